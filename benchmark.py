@@ -0,0 +1,1126 @@
+import argparse
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import platform
+import queue
+import posixpath
+import random
+import shutil
+import socket
+import socketserver
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import ftp
+
+# Contas e diretórios usados pelos benchmarks (espelham a estrutura de ftp.main())
+BENCH_ACCOUNTS = {f"username_{i}": f"password_{i}" for i in range(1, 5)}
+BENCH_FOLDERS = ["/Auto Religacao", "/Avaria", "/processo_completo_PI", "/Operacoes"]
+FIRST_UC = 10_000_000  # Primeira UC sintética (a mesma numeração no FTP, no banco local e no histórico)
+
+
+def synthetic_pdf(uc, size=20_000):
+    # Função para gerar o conteúdo de um PDF sintético com cabeçalho e trailer válidos
+    header = f"%PDF-1.4\n% UC {uc}\n".encode()
+    trailer = b"\n%%EOF\n"
+    filler = (f"UC {uc} ".encode() * (size // 8 + 1))[:max(size - len(header) - len(trailer), 0)]
+    return header + filler + trailer
+
+
+class LocalFTPHandler(socketserver.StreamRequestHandler):
+    # Sessão FTP mínima (subconjunto do RFC 959/3659) servida a partir de um sistema de arquivos em memória
+
+    def setup(self):
+        super().setup()
+        self.account = None  # Conta autenticada na sessão
+        self.pending_user = None  # Usuário informado no comando USER
+        self.cwd = "/"  # Diretório corrente da sessão
+        self.rest = 0  # Deslocamento informado pelo comando REST
+        self.passive = None  # Socket de dados em modo passivo
+
+    def reply(self, line):
+        # Envia uma resposta ao cliente, simulando a latência de ida e volta do servidor
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write((line + "\r\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def resolve(self, path):
+        # Resolve um caminho relativo ao diretório corrente
+        if not path:
+            return self.cwd
+        return posixpath.normpath(posixpath.join(self.cwd, path)) if not path.startswith("/") else posixpath.normpath(path)
+
+    def open_data(self):
+        # Aceita a conexão de dados aberta pelo cliente após o PASV
+        if self.passive is None:
+            self.reply("425 Use PASV first.")
+            return None
+        conn, _ = self.passive.accept()
+        self.passive.close()
+        self.passive = None
+        return conn
+
+    def send_data(self, payload):
+        # Envia um bloco de dados pela conexão passiva
+        conn = self.open_data()
+        if conn is None:
+            return
+        self.reply("150 Opening data connection.")
+        with conn:
+            conn.sendall(payload)
+        self.reply("226 Transfer complete.")
+
+    def handle(self):
+        self.reply("220 Local FTP stand-in ready.")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                break
+            line = raw.decode("utf-8", "surrogateescape").rstrip("\r\n")
+            command, _, arg = line.partition(" ")
+            command = command.upper()
+            if command == "QUIT":
+                self.reply("221 Bye.")
+                break
+            handler = getattr(self, f"ftp_{command.lower()}", None)
+            if handler is None:
+                self.reply(f"502 Command {command} not implemented.")
+            elif self.account is None and command not in ("USER", "PASS", "FEAT", "SYST", "NOOP"):
+                self.reply("530 Not logged in.")
+            else:
+                handler(arg)
+        if self.passive is not None:
+            self.passive.close()
+        if self.account is not None:
+            self.server.session_closed(self.account)
+
+    def ftp_user(self, arg):
+        self.pending_user = arg
+        self.reply("331 Password required.")
+
+    def ftp_pass(self, arg):
+        if self.server.accounts.get(self.pending_user) != arg:
+            self.reply("530 Login incorrect.")
+        elif not self.server.session_opened(self.pending_user):
+            self.reply("421 Too many connections for this user.")  # Mesmo comportamento de um servidor com limite por conta
+        else:
+            self.account = self.pending_user
+            self.reply("230 Logged in.")
+
+    def ftp_syst(self, arg):
+        self.reply("215 UNIX Type: L8")
+
+    def ftp_feat(self, arg):
+        self.wfile.write(b"211-Features:\r\n MLSD\r\n SIZE\r\n MDTM\r\n REST STREAM\r\n")
+        self.reply("211 End")
+
+    def ftp_opts(self, arg):
+        self.reply("200 OK.")
+
+    def ftp_type(self, arg):
+        self.reply("200 Type set.")
+
+    def ftp_noop(self, arg):
+        self.reply("200 NOOP ok.")
+
+    def ftp_pwd(self, arg):
+        self.reply(f'257 "{self.cwd}" is the current directory.')
+
+    def ftp_cwd(self, arg):
+        path = self.resolve(arg)
+        if self.server.fs.is_dir(self.account, path):
+            self.cwd = path
+            self.reply("250 Directory changed.")
+        else:
+            self.reply(f"550 {arg}: No such directory.")
+
+    def ftp_pasv(self, arg):
+        if self.passive is not None:
+            self.passive.close()
+        self.passive = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.passive.bind(("127.0.0.1", 0))
+        self.passive.listen(1)
+        port = self.passive.getsockname()[1]
+        self.reply(f"227 Entering Passive Mode (127,0,0,1,{port >> 8},{port & 0xFF}).")
+
+    def ftp_rest(self, arg):
+        self.rest = int(arg)
+        self.reply(f"350 Restarting at {self.rest}.")
+
+    def ftp_nlst(self, arg):
+        entries = self.server.fs.list_dir(self.account, self.resolve(arg))
+        self.send_data("".join(f"{name}\r\n" for name, _, _, _ in entries).encode("utf-8"))
+
+    def ftp_list(self, arg):
+        lines = []
+        for name, is_dir, size, mtime in self.server.fs.list_dir(self.account, self.resolve(arg)):
+            stamp = datetime.fromtimestamp(mtime, timezone.utc).strftime("%b %d %H:%M")
+            mode = "drwxr-xr-x" if is_dir else "-rw-r--r--"
+            lines.append(f"{mode}    1 ftp      ftp      {size:>10} {stamp} {name}\r\n")
+        self.send_data("".join(lines).encode("utf-8"))
+
+    def ftp_mlsd(self, arg):
+        lines = []
+        for name, is_dir, size, mtime in self.server.fs.list_dir(self.account, self.resolve(arg)):
+            modify = datetime.fromtimestamp(mtime, timezone.utc).strftime("%Y%m%d%H%M%S")
+            kind = "dir" if is_dir else "file"
+            lines.append(f"type={kind};size={size};modify={modify}; {name}\r\n")
+        self.send_data("".join(lines).encode("utf-8"))
+
+    def ftp_size(self, arg):
+        entry = self.server.fs.get_file(self.account, self.resolve(arg))
+        self.reply(f"213 {len(entry[0])}" if entry else f"550 {arg}: No such file.")
+
+    def ftp_mdtm(self, arg):
+        entry = self.server.fs.get_file(self.account, self.resolve(arg))
+        if entry:
+            self.reply("213 " + datetime.fromtimestamp(entry[1], timezone.utc).strftime("%Y%m%d%H%M%S"))
+        else:
+            self.reply(f"550 {arg}: No such file.")
+
+    def ftp_retr(self, arg):
+        entry = self.server.fs.get_file(self.account, self.resolve(arg))
+        offset, self.rest = self.rest, 0
+        if entry is None:
+            self.reply(f"550 {arg}: No such file.")
+            return
+        self.send_data(entry[0][offset:])
+
+    def ftp_dele(self, arg):
+        if self.server.fs.delete(self.account, self.resolve(arg)):
+            self.reply("250 File deleted.")
+        else:
+            self.reply(f"550 {arg}: No such file.")
+
+
+class MemoryFileSystem:
+    # Sistema de arquivos em memória, separado por conta FTP
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}  # {conta: {caminho: (conteúdo, mtime)}}
+        self.dirs = {}  # {conta: {diretórios}}
+
+    def add_file(self, account, path, content, mtime=None):
+        # Adiciona um arquivo e cria os diretórios intermediários
+        with self.lock:
+            self.files.setdefault(account, {})[path] = (content, mtime or time.time())
+            dirs = self.dirs.setdefault(account, {"/"})
+            parent = posixpath.dirname(path)
+            while parent not in dirs:
+                dirs.add(parent)
+                parent = posixpath.dirname(parent)
+
+    def is_dir(self, account, path):
+        with self.lock:
+            return path in self.dirs.get(account, {"/"})
+
+    def get_file(self, account, path):
+        with self.lock:
+            return self.files.get(account, {}).get(path)
+
+    def delete(self, account, path):
+        with self.lock:
+            return self.files.get(account, {}).pop(path, None) is not None
+
+    def list_dir(self, account, path):
+        # Lista (nome, é_diretório, tamanho, mtime) das entradas diretas de um diretório
+        with self.lock:
+            entries = [
+                (posixpath.basename(name), False, len(content), mtime)
+                for name, (content, mtime) in self.files.get(account, {}).items()
+                if posixpath.dirname(name) == path
+            ]
+            entries += [
+                (posixpath.basename(name), True, 0, time.time())
+                for name in self.dirs.get(account, set())
+                if name != path and posixpath.dirname(name) == path
+            ]
+        return sorted(entries)
+
+
+class LocalFTPServer(socketserver.ThreadingTCPServer):
+    # Servidor FTP local, em processo, usado como substituto do servidor de produção
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128  # Muitas sessões simultâneas: evita estouro da fila de conexões pendentes
+
+    def __init__(self, accounts, latency=0.0, max_sessions=None):
+        super().__init__(("127.0.0.1", 0), LocalFTPHandler)
+        self.accounts = accounts  # {usuário: senha}
+        self.latency = latency  # Atraso (em segundos) aplicado a cada resposta de controle
+        self.max_sessions = max_sessions  # Sessões simultâneas permitidas por conta (None = sem limite)
+        self.fs = MemoryFileSystem()
+        self.thread = None
+        self.sessions_lock = threading.Lock()
+        self.sessions = {}  # {conta: sessões autenticadas abertas}
+        self.peak_sessions = {}  # {conta: maior número de sessões abertas ao mesmo tempo}
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def session_opened(self, account):
+        # Conta uma sessão autenticada; retorna False se a conta já estiver no limite
+        with self.sessions_lock:
+            current = self.sessions.get(account, 0)
+            if self.max_sessions is not None and current >= self.max_sessions:
+                return False
+            self.sessions[account] = current + 1
+            self.peak_sessions[account] = max(self.peak_sessions.get(account, 0), current + 1)
+            return True
+
+    def session_closed(self, account):
+        with self.sessions_lock:
+            self.sessions[account] -= 1
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+
+
+def seed_ftp(server, files_per_folder, file_size, folders=BENCH_FOLDERS):
+    # Função para popular todas as contas do servidor local com PDFs sintéticos
+    uc = FIRST_UC
+    for account in server.accounts:
+        for folder in folders:
+            for _ in range(files_per_folder):
+                server.fs.add_file(account, f"{folder}/{uc}.pdf", synthetic_pdf(uc, file_size))
+                uc += 1
+    return uc - FIRST_UC  # Número total de arquivos criados (UCs FIRST_UC até FIRST_UC + total - 1)
+
+
+def run_harvest(server, files_per_folder, file_size, workers=None):
+    # Executa uma coleta completa contra o servidor local e retorna (tempo, totais por pasta)
+    seed_ftp(server, files_per_folder, file_size)  # A coleta apaga os arquivos do servidor, então repovoa a cada rodada
+    ftp_servers = [{"username": user, "password": password} for user, password in server.accounts.items()]
+    root = tempfile.mkdtemp(prefix="bench_ftp_")
+    try:
+        base_folders = {folder: os.path.join(root, folder.strip("/")) for folder in BENCH_FOLDERS}
+        for path in base_folders.values():
+            os.makedirs(path)
+        start = time.perf_counter()
+        if workers is None:
+            summary = ftp.harvest_sequentially(ftp_servers, BENCH_FOLDERS, base_folders, "127.0.0.1", server.port)
+        else:
+            summary = ftp.harvest_concurrently(ftp_servers, BENCH_FOLDERS, base_folders, max_workers=workers,
+                                              max_per_account=max(1, workers // len(ftp_servers)),
+                                              host="127.0.0.1", port=server.port)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    peak = max(server.peak_sessions.values(), default=0)
+    server.peak_sessions.clear()
+    return elapsed, {posixpath.basename(path): total for path, total in summary["transferred"].items()}, peak
+
+
+def bench_ftp(args):
+    # Benchmark de vazão da coleta FTP: sequencial contra concorrente com 4/8/16 workers
+    with LocalFTPServer(BENCH_ACCOUNTS, latency=args.latency) as server:
+        total_files = len(BENCH_ACCOUNTS) * len(BENCH_FOLDERS) * args.files
+        print(f"Coleta FTP: {total_files} arquivos de {args.size} bytes, latência {args.latency * 1000:.0f} ms")
+        baseline, expected, peak = run_harvest(server, args.files, args.size)
+        print(f"  sequencial   {baseline:8.2f} s  {total_files / baseline:8.1f} arquivos/s  conexões por conta {peak}")
+        for workers in args.workers:
+            elapsed, totals, peak = run_harvest(server, args.files, args.size, workers)
+            status = "ok" if totals == expected else f"DIVERGENTE {totals}"
+            print(f"  {workers:2d} workers   {elapsed:8.2f} s  {total_files / elapsed:8.1f} arquivos/s"
+                  f"  speedup {baseline / elapsed:5.2f}x  totais {status}  conexões por conta {peak}"
+                  f" (limite {max(1, workers // len(BENCH_ACCOUNTS))})")
+
+
+NAME_SCENARIOS = {  # {cenário: {conta: {caminho remoto: UC do conteúdo}}}
+    "mesmo nome e conteúdo em duas contas": {
+        "username_1": {"/Avaria/12345.pdf": 12345},
+        "username_2": {"/Avaria/12345.pdf": 12345},
+    },
+    "mesmo nome com conteúdo diferente em duas contas": {
+        "username_1": {"/Avaria/12345.pdf": 12345},
+        "username_2": {"/Avaria/12345.pdf": 54321},
+    },
+    "mesmo nome com conteúdo diferente em todas as contas": {
+        account: {"/Avaria/12345.pdf": 12345 + index} for index, account in enumerate(BENCH_ACCOUNTS)
+    },
+    "mesmo nome e conteúdo em dois subdiretórios": {
+        "username_1": {"/Avaria/a/12345.pdf": 12345, "/Avaria/b/12345.pdf": 12345},
+    },
+    "mesmo nome com conteúdo diferente em dois subdiretórios": {
+        "username_1": {"/Avaria/a/12345.pdf": 12345, "/Avaria/b/12345.pdf": 54321},
+    },
+    "mesmo nome em subdiretórios de contas diferentes": {
+        "username_1": {"/Avaria/a/12345.pdf": 12345},
+        "username_2": {"/Avaria/b/12345.pdf": 54321},
+    },
+}
+
+
+def run_name_scenario(server, files, harvest, file_size):
+    # Executa uma coleta com arquivos de mesmo nome e retorna (arquivos perdidos, arquivos corrompidos, parciais restantes)
+    from manifest import SyncManifest
+    from content_store import ContentStore
+    sources = {}
+    for account, paths in files.items():
+        for path, uc in paths.items():
+            data = synthetic_pdf(uc, file_size)
+            server.fs.add_file(account, path, data)
+            sources[account, path] = hashlib.sha256(data).hexdigest()
+    ftp_servers = [{"username": user, "password": server.accounts[user]} for user in files]
+    folders = [folder for folder in BENCH_FOLDERS if any(path.startswith(folder + "/") for _, path in sources)]
+    root = tempfile.mkdtemp(prefix="bench_names_")
+    try:
+        base_folders = {folder: os.path.join(root, folder.strip("/")) for folder in folders}
+        for path in base_folders.values():
+            os.makedirs(path)
+        with SyncManifest(os.path.join(root, "manifest.sqlite")) as manifest, \
+                ContentStore(os.path.join(root, "content_store.sqlite")) as content_store:
+            harvest(ftp_servers, folders, base_folders, host="127.0.0.1", port=server.port,
+                    manifest=manifest, content_store=content_store)
+        on_disk = set()
+        partials = []
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if name.endswith(".pdf"):
+                    on_disk.add(ftp.file_sha256(os.path.join(directory, name)))
+                elif name.endswith(ftp.PARTIAL_SUFFIX):
+                    partials.append(name)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    remaining = {(account, path) for account, paths in server.fs.files.items() for path in paths}
+    # Cada arquivo enviado precisa continuar no servidor ou ter o seu conteúdo no disco
+    lost = sorted(key for key, sha256 in sources.items() if key not in remaining and sha256 not in on_disk)
+    corrupt = len(on_disk - set(sources.values()))
+    for account, path in remaining:
+        server.fs.files[account].pop(path)  # Limpa o servidor para o próximo cenário
+    return lost, corrupt, partials
+
+
+def bench_names(args):
+    # Verificação de arquivos de mesmo nome em contas/diretórios diferentes: nenhum original pode ser apagado do servidor
+    # sem que o seu conteúdo esteja no disco (sai com código 1 se algum arquivo for perdido ou corrompido)
+    failures = 0
+    with LocalFTPServer(BENCH_ACCOUNTS, latency=args.latency) as server:
+        for mode, harvest in (("concorrente", ftp.harvest_concurrently), ("agendador", ftp.harvest_scheduled)):
+            for scenario, files in NAME_SCENARIOS.items():
+                # A ordem em que as contas terminam varia: o cenário é repetido para cobrir as combinações
+                lost, corrupt, partials = [], 0, []
+                for _ in range(args.rounds):
+                    round_lost, round_corrupt, round_partials = run_name_scenario(server, files, harvest, args.size)
+                    lost += round_lost
+                    corrupt += round_corrupt
+                    partials += round_partials
+                ok = not lost and not corrupt and not partials
+                failures += not ok
+                print(f"  {mode:12s} {scenario:55s} {'ok' if ok else 'FALHOU'}"
+                      f"{f'  perdidos {lost}' if lost else ''}{f'  corrompidos {corrupt}' if corrupt else ''}"
+                      f"{f'  parciais {partials}' if partials else ''}")
+    if failures:
+        sys.exit(1)
+
+
+def local_uc_database(path, uc_count, seed=42):
+    # Função que cria um substituto local (arquivo SQLite) da tabela rededes.cad_uc_ee
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        conn.execute("CREATE TABLE cad_uc_ee (cod_un_cons_uee TEXT PRIMARY KEY, cod_loc_uee TEXT)")
+        generator = random.Random(seed)
+        conn.executemany(
+            "INSERT INTO cad_uc_ee VALUES (?, ?)",
+            ((str(FIRST_UC + i), f"{generator.randint(1, 400):04d}") for i in range(uc_count))
+        )
+        conn.commit()
+    return path
+
+
+class LatencyCursor(sqlite3.Cursor):
+    # Cursor SQLite que simula a ida e volta de rede de cada execução no banco remoto
+    latency = 0.0
+
+    def execute(self, *args):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().execute(*args)
+
+
+def connect_local_database(path, latency=0.0):
+    # Abre uma conexão em que a tabela local é acessível pelo mesmo nome qualificado da consulta Oracle
+    class Connection(sqlite3.Connection):
+        def cursor(self, factory=None):
+            cursor = super().cursor(factory or LatencyCursor)
+            cursor.latency = latency
+            return cursor
+
+    conn = sqlite3.connect(":memory:", check_same_thread=False, factory=Connection)
+    conn.execute("ATTACH DATABASE ? AS rededes", (path,))
+    return conn
+
+
+class LocalDatabasePool:
+    # Substituto local do pool do oracledb: empresta conexões SQLite com a tabela rededes.cad_uc_ee
+
+    def __init__(self, path, size=4, latency=0.0):
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(connect_local_database(path, latency))
+
+    @contextlib.contextmanager
+    def acquire(self):
+        conn = self.connections.get()
+        try:
+            yield conn
+        finally:
+            self.connections.put(conn)
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+
+def sample_ucs(count, table_size, missing_ratio=0.05, seed=7):
+    # Função que sorteia UCs existentes na tabela local, com uma fração de UCs inexistentes ("UCs incorretas")
+    generator = random.Random(seed)
+    existing = generator.sample(range(table_size), count)
+    return [str(10_000_000 + i) if generator.random() >= missing_ratio else str(90_000_000 + i) for i in existing]
+
+
+def legacy_execute_query(cursor, pdf_files):
+    # Consulta como era antes: todas as UCs em uma lista IN literal (um texto de SQL diferente a cada execução)
+    ucs = "','".join(pdf_files)
+    cursor.execute(f"""
+        SELECT DISTINCT a.cod_un_cons_uee, a.cod_loc_uee
+        FROM rededes.cad_uc_ee a
+        WHERE a.cod_un_cons_uee IN ('{ucs}')
+    """)
+    return cursor.fetchall()
+
+
+def bench_oracle(args):
+    # Benchmark da consulta de UCs: lista IN literal contra blocos com variáveis de ligação (serial e em paralelo)
+    import oracle  # Importado aqui: depende de pandas/openpyxl/oracledb
+
+    table_size = max(args.ucs) * 2
+    root = tempfile.mkdtemp(prefix="bench_oracle_")
+    try:
+        path = local_uc_database(os.path.join(root, "rededes.sqlite"), table_size)
+        conn = connect_local_database(path, args.latency)
+        pool = LocalDatabasePool(path, args.workers, args.latency)
+        print(f"Consulta de UCs: tabela local com {table_size} UCs, blocos de {args.chunk} variáveis de ligação, "
+              f"latência {args.latency * 1000:.0f} ms por execução")
+        for count in args.ucs:
+            ucs = sample_ucs(count, table_size)
+            cursor = conn.cursor()
+            start = time.perf_counter()
+            legacy_rows = legacy_execute_query(cursor, ucs)
+            legacy_elapsed = time.perf_counter() - start
+
+            with contextlib.redirect_stdout(io.StringIO()):  # Omite a lista de "UCs incorretas" impressa pela consulta
+                start = time.perf_counter()
+                rows = oracle.execute_query(cursor, ucs, ucs, chunk_size=args.chunk)
+                elapsed = time.perf_counter() - start
+                start = time.perf_counter()
+                parallel_rows, failed = oracle.execute_query_parallel(pool, ucs, ucs, chunk_size=args.chunk, workers=args.workers)
+                parallel_elapsed = time.perf_counter() - start
+            status = "ok" if set(rows) == set(legacy_rows) == set(parallel_rows) and not failed else "DIVERGENTE"
+            chunks = -(-count // args.chunk)
+            # No Oracle cada texto de SQL distinto é um hard parse; a lista literal acima de 1000 itens falha com ORA-01795
+            print(f"  {count:>7} UCs  literal {legacy_elapsed:7.3f} s  binds {elapsed:7.3f} s"
+                  f"  binds/{args.workers} conexões {parallel_elapsed:7.3f} s  ({chunks} blocos)  linhas {len(rows)} {status}")
+        pool.close()
+        conn.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def legacy_format_dataframe(results, current_date, localities, pdf_files, pdf_sources):
+    # Montagem do relatório como era antes: apply por linha e data convertida texto -> datetime -> texto
+    import pandas as pd
+    from oracle import ENERGEC_DIRECTORY
+
+    results_df = pd.DataFrame(results, columns=['cod_un_cons_uee', 'cod_loc_uee'])
+    results_df['Data'] = current_date
+    results_df['cod_loc_uee'] = results_df['cod_loc_uee'].astype(str).str.lstrip('0')
+    results_df['Localidade'] = results_df['cod_loc_uee'].map(localities).fillna("Localidade não encontrada")
+    results_df['PDF'] = results_df['cod_un_cons_uee'].astype(str).map(dict(zip(pdf_files, pdf_sources)))
+    results_df['Localidade'] = results_df.apply(
+        lambda row: f"ENERGEC - {row['Localidade']}" if row['PDF'] == ENERGEC_DIRECTORY else row['Localidade'],
+        axis=1
+    )
+    results_df.rename(columns={'cod_un_cons_uee': 'UC', 'Localidade': 'UTD', 'Data': 'DATA'}, inplace=True)
+    results_df = results_df[['UC', 'UTD', 'DATA']]
+    results_df['DATA'] = pd.to_datetime(results_df['DATA'], format='%d.%m.%Y').dt.strftime('%d/%m/%Y')
+    return results_df
+
+
+def synthetic_report_input(rows, locality_count=300, seed=11):
+    # Gera resultados de consulta, localidades e fontes de PDF no formato recebido por format_dataframe
+    from oracle import ENERGEC_DIRECTORY
+
+    rng = random.Random(seed)
+    localities = {str(code): f"UTD {code}" for code in range(1, locality_count + 1)}
+    directories = [f"//source//directory//{i}" for i in range(1, 5)] + [ENERGEC_DIRECTORY]
+    # Alguns códigos ficam fora do arquivo de localidades para exercitar o "Localidade não encontrada"
+    results = [(10_000_000 + i, f"{rng.randint(1, locality_count + 20):04d}") for i in range(rows)]
+    pdf_files = [str(uc) for uc, _ in results]
+    pdf_sources = [rng.choice(directories) for _ in range(rows)]
+    return results, localities, pdf_files, pdf_sources
+
+
+def measure(function, *args):
+    # Executa a função duas vezes: uma para medir o tempo e outra para o pico de memória alocada (tracemalloc
+    # deixa a execução bem mais lenta, então não pode entrar na medida de tempo)
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_report(args):
+    # Benchmark da montagem do relatório: format_dataframe vetorizado contra a versão com apply por linha
+    import oracle  # Importado aqui: depende de pandas/openpyxl/oracledb
+    from localities import LocalityIndex
+
+    current_date = "16.10.2026"
+    print("Montagem do relatório (format_dataframe): tempo e pico de memória (tracemalloc)")
+    for rows in args.rows:
+        results, localities, pdf_files, pdf_sources = synthetic_report_input(rows)
+        locality_index = LocalityIndex.from_mapping({int(code): name for code, name in localities.items()})
+        legacy_df, legacy_elapsed, legacy_peak = measure(legacy_format_dataframe, results, current_date, localities,
+                                                         pdf_files, pdf_sources)
+        df, elapsed, peak = measure(oracle.format_dataframe, results, current_date, locality_index, pdf_files, pdf_sources)
+        status = "ok" if df.astype(object).equals(legacy_df.astype(object)) else "DIVERGENTE"
+        print(f"  {rows:>9} linhas  apply {legacy_elapsed:7.3f} s {legacy_peak / 2**20:8.1f} MiB"
+              f"  vetorizado {elapsed:7.3f} s {peak / 2**20:8.1f} MiB  ({legacy_elapsed / elapsed:5.1f}x)  {status}")
+
+
+def legacy_save_to_excel(results_df, spreadsheet_name):
+    # Gravação da planilha como era antes: to_excel, recarga do arquivo e estilos criados célula a célula
+    import openpyxl
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+
+    header_fill = PatternFill(start_color='C6E0B4', end_color='C6E0B4', fill_type='solid')
+    border_style = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+
+    results_df.to_excel(spreadsheet_name, index=False, sheet_name='Processos_Retirados')
+    wb = openpyxl.load_workbook(spreadsheet_name)
+    ws = wb.active
+    ws.column_dimensions['A'].width = 11
+    ws.column_dimensions['B'].width = 31
+    ws.column_dimensions['C'].width = 11
+    for row in range(1, ws.max_row + 1):
+        for column in range(1, ws.max_column + 1):
+            cell = ws.cell(row=row, column=column)
+            cell.alignment = Alignment(horizontal='left', vertical='center')
+            cell.border = border_style
+            if row == 1:
+                cell.font = Font(bold=True, color='000000')
+                cell.fill = header_fill
+    wb.save(spreadsheet_name)
+    wb.close()
+
+
+def bench_excel(args):
+    # Benchmark da gravação da planilha: modo somente escrita em uma passada contra to_excel + recarga + estilos
+    import oracle  # Importado aqui: depende de pandas/openpyxl/oracledb
+    from localities import LocalityIndex
+
+    root = tempfile.mkdtemp(prefix="bench_excel_")
+    try:
+        print("Gravação da planilha (save_to_excel): tempo e pico de memória (tracemalloc)")
+        for rows in args.rows:
+            results, localities, pdf_files, pdf_sources = synthetic_report_input(rows)
+            # format_dataframe recebe o índice de localidades (o mesmo que load_localities retorna), não o dicionário
+            locality_index = LocalityIndex.from_mapping({int(code): name for code, name in localities.items()})
+            results_df = oracle.format_dataframe(results, "16.10.2026", locality_index, pdf_files, pdf_sources)
+            legacy_path = os.path.join(root, "legacy.xlsx")
+            path = os.path.join(root, "streaming.xlsx")
+            _, legacy_elapsed, legacy_peak = measure(legacy_save_to_excel, results_df, legacy_path)
+            _, elapsed, peak = measure(oracle.write_xlsx, results_df, path)
+            print(f"  {rows:>9} linhas  to_excel+estilos {legacy_elapsed:7.3f} s {legacy_peak / 2**20:8.1f} MiB"
+                  f"  somente escrita {elapsed:7.3f} s {peak / 2**20:8.1f} MiB  ({legacy_elapsed / elapsed:5.1f}x)")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+STARTUP_MODULES = ["ftp", "oracle", "outlook", "run_scripts"]  # Pontos de entrada medidos no benchmark de inicialização
+HEAVY_MODULES = ["pandas", "openpyxl", "oracledb", "win32com"]  # Dependências que não devem carregar sem necessidade
+
+# Script do dia sem PDFs novos: diretórios vazios, nada a consultar
+NO_OP_RUN = """
+import sys, oracle
+oracle.SOURCE_DIRECTORIES = [sys.argv[1]]
+oracle.setup_logging()
+oracle.main()
+print("pesados:" + ",".join(name for name in {heavy} if name in sys.modules))
+"""
+
+
+def run_python(args, cwd):
+    # Executa o interpretador atual com o diretório do projeto no caminho de importação
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable] + args, cwd=cwd, env=env, capture_output=True, text=True)
+    return time.perf_counter() - start, completed
+
+
+def parse_importtime(stderr, module):
+    # Lê a saída do -X importtime: retorna (tempo acumulado do módulo em ms, [(pacote de 1º nível, ms)])
+    total = 0.0
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.split("|")
+        try:
+            cumulative = int(parts[1]) / 1000
+        except ValueError:
+            continue  # Linha de cabeçalho
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2  # Cada nível de aninhamento acrescenta dois espaços
+        if name.strip() == module:
+            total = cumulative
+        elif depth == 2:
+            top_level.append((name.strip(), cumulative))  # Importações feitas diretamente pelo módulo
+    return total, sorted(top_level, key=lambda item: item[1], reverse=True)
+
+
+def bench_startup(args):
+    # Benchmark de inicialização: tempo de importação de cada ponto de entrada (-X importtime) e de um dia sem PDFs
+    root = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        print(f"Importação dos pontos de entrada (mediana de {args.repeat} execuções, -X importtime)")
+        for module in STARTUP_MODULES:
+            totals = []
+            heaviest = []
+            for _ in range(args.repeat):
+                _, completed = run_python(["-X", "importtime", "-c", f"import {module}"], root)
+                if completed.returncode != 0:
+                    print(f"  {module:<12} falhou: {completed.stderr.strip().splitlines()[-1]}")
+                    break
+                total, heaviest = parse_importtime(completed.stderr, module)
+                totals.append(total)
+            if totals:
+                top = ", ".join(f"{name} {ms:.0f} ms" for name, ms in heaviest[:3])
+                print(f"  {module:<12} {statistics.median(totals):8.1f} ms   maiores: {top}")
+
+        empty = os.path.join(root, "vazio")
+        os.makedirs(empty)
+        script = NO_OP_RUN.format(heavy=HEAVY_MODULES)
+        timings = []
+        for _ in range(args.repeat):
+            elapsed, completed = run_python(["-c", script, empty], root)
+            timings.append(elapsed)
+        heavy = completed.stdout.strip().splitlines()[-1].split(":", 1)[1] if completed.returncode == 0 else "?"
+        print(f"Dia sem PDFs (python oracle.py): {statistics.median(timings) * 1000:.0f} ms de ponta a ponta, "
+              f"dependências pesadas carregadas: {heavy or 'nenhuma'}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+class LocalSMTPHandler(socketserver.StreamRequestHandler):
+    # Sessão SMTP mínima (RFC 5321) que só conta as mensagens recebidas, usada como substituto do servidor de e-mail
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+        self.wfile.flush()
+
+    def handle(self):
+        self.reply("220 Local SMTP stand-in ready.")
+        recipients = 0
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                break
+            command = raw.decode("ascii", "replace").strip().split(" ", 1)[0].upper()
+            if command == "QUIT":
+                self.reply("221 Bye.")
+                break
+            if command == "EHLO":
+                self.wfile.write(b"250-localhost\r\n")
+                self.reply("250 8BITMIME")
+            elif command == "RCPT":
+                recipients += 1
+                self.reply("250 OK.")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for line in self.rfile:
+                    if line in (b".\r\n", b".\n"):
+                        break
+                    size += len(line)
+                self.server.record(recipients, size)
+                recipients = 0
+                self.reply("250 Message accepted.")
+            elif command == "RSET":
+                recipients = 0
+                self.reply("250 OK.")
+            else:  # HELO, MAIL, NOOP
+                self.reply("250 OK.")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    # Servidor SMTP local, em processo: recebe as mensagens do SMTPBackend e guarda só os totais
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), LocalSMTPHandler)
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def record(self, recipients, size):
+        with self.lock:
+            self.messages += 1
+            self.recipients += recipients
+            self.bytes += size
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+
+
+def peak_rss():
+    # Pico de memória residente do processo em bytes (None se a plataforma não informar)
+    try:
+        import resource
+    except ImportError:  # Windows: pico do working set, se o psutil estiver instalado
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux informa em KiB, macOS em bytes
+
+
+def seed_overlaps(server, total_files, overlap, file_size):
+    # Reenvia uma fração dos PDFs para a conta seguinte com o mesmo nome: metade com o mesmo conteúdo (cópia
+    # duplicada, apagada das duas contas) e metade com outro conteúdo (conflito de nome, uma fica no servidor)
+    accounts = list(server.accounts)
+    originals = sorted((account, path) for account, files in server.fs.files.items() for path in files)
+    conflicts = 0
+    for index, (account, path) in enumerate(originals[:int(total_files * overlap)]):
+        target = accounts[(accounts.index(account) + 1) % len(accounts)]
+        content = server.fs.get_file(account, path)[0]
+        if index % 2:
+            uc = int(posixpath.splitext(posixpath.basename(path))[0])
+            content = synthetic_pdf(uc, file_size + 16)  # Mesmo nome (mesma UC), arquivo diferente
+            conflicts += 1
+        server.fs.add_file(target, path, content)
+    return conflicts
+
+
+def check_e2e_integrity(ftp_server, sources, base_folders, report_path, resubmission_column, expected):
+    # Confere o resultado do pipeline: nenhum PDF perdido ou corrompido, uma linha por UC e os reenvios marcados
+    on_disk = set()
+    for folder in base_folders.values():
+        for name in os.listdir(folder):
+            if name.endswith(".pdf"):
+                on_disk.add(ftp.file_sha256(os.path.join(folder, name)))
+    remaining = {(account, path) for account, files in ftp_server.fs.files.items() for path in files}
+    with open(report_path, "r", encoding="utf-8-sig", newline="") as file:
+        rows = list(csv.DictReader(file, delimiter=";"))
+    found = {
+        "lost": sum(1 for key, sha256 in sources.items() if key not in remaining and sha256 not in on_disk),
+        "corrupt": len(on_disk - set(sources.values())),
+        "kept_on_server": len(remaining),
+        "report_rows": len(rows),
+        "resubmissions": sum(1 for row in rows if row.get(resubmission_column)),
+    }
+    failures = [f"{name} {found[name]} (esperado {expected[name]})" for name in expected if found[name] != expected[name]]
+    return found, failures
+
+
+def run_e2e_scale(args):
+    # Executa o pipeline de produção (run_scripts.run_pipeline) uma vez, no processo atual, contra FTP, banco e SMTP
+    # locais, e retorna as medidas da rodada; só os caminhos e os servidores são trocados pelos substitutos locais
+    import oracle
+    import outlook
+    import run_scripts
+    from history import ReceiptHistory
+    import metrics
+
+    root = tempfile.mkdtemp(prefix="bench_e2e_")
+    stages = {}
+    try:
+        files_per_folder = -(-args.single // (len(BENCH_ACCOUNTS) * len(BENCH_FOLDERS)))
+        with LocalFTPServer(BENCH_ACCOUNTS, latency=args.latency) as ftp_server, LocalSMTPServer() as smtp_server:
+            with stage_timer(stages, "preparação"):
+                import pandas, openpyxl  # Importados antes da medida: o tempo de importação tem o benchmark startup
+                total_files = seed_ftp(ftp_server, files_per_folder, args.size)
+                conflicts = seed_overlaps(ftp_server, total_files, args.overlap, args.size)
+                sources = {(account, path): hashlib.sha256(content).hexdigest()
+                           for account, files in ftp_server.fs.files.items() for path, (content, _) in files.items()}
+                database_path = local_uc_database(os.path.join(root, "rededes.sqlite"), total_files)
+                localities_path = os.path.join(root, "Localidades.txt")
+                with open(localities_path, "w", encoding="utf-8") as file:
+                    file.writelines(f"{code:04d};UTD {code % 40}\n" for code in range(1, 401))
+                db_config_path = os.path.join(root, "login_sql.ini")
+                with open(db_config_path, "w", encoding="utf-8") as file:
+                    file.write("[database]\nuser = bench\npassword = bench\naddress = 127.0.0.1\nport = 1521\nservice_name = local\n")
+                smtp_config = os.path.join(root, "login_smtp.ini")
+                with open(smtp_config, "w", encoding="utf-8") as file:
+                    file.write(f"[smtp]\nhost = 127.0.0.1\nport = {smtp_server.port}\nsender = relatorio@example.com\ntls = false\n")
+                # Três destinatários do relatório completo e, com a divisão, um grupo por UTD
+                recipients_path = os.path.join(root, "Emails.xlsx")
+                workbook = openpyxl.Workbook()
+                workbook.active.append(["Principal", "Cópia", "UTD"])
+                for i in range(3):
+                    workbook.active.append([f"geral{i}@example.com", f"copia{i}@example.com", None])
+                for i in range(40 if args.split else 0):
+                    workbook.active.append([f"utd{i}@example.com", None, f"UTD {i}"])
+                workbook.save(recipients_path)
+                # Uma UC em cada dez já apareceu no relatório de ontem: a planilha marca o reenvio
+                current_date = oracle.get_current_date()
+                yesterday = (datetime.now() - timedelta(days=1)).strftime("%d.%m.%Y")
+                history_path = os.path.join(root, "historico_ucs.sqlite")
+                history = ReceiptHistory(history_path)
+                history.record((FIRST_UC + i, yesterday, "UTD", None, None) for i in range(0, total_files, 10))
+                history.close()
+                base_folders = {folder: os.path.join(root, "base", folder.strip("/")) for folder in BENCH_FOLDERS}
+                for path in base_folders.values():
+                    os.makedirs(path)
+                report_directory = os.path.join(root, "relatorio")
+                os.makedirs(report_directory)
+
+            # Configuração de produção apontada para os substitutos locais
+            ftp.FTP_HOST, ftp.FTP_PORT = "127.0.0.1", ftp_server.port
+            ftp.FTP_SERVERS = [{"username": user, "password": password} for user, password in ftp_server.accounts.items()]
+            ftp.FTP_FOLDERS = BENCH_FOLDERS
+            ftp.BASE_FOLDERS = base_folders
+            ftp.MANIFEST_PATH = os.path.join(root, "manifest.sqlite")
+            ftp.CONTENT_STORE_PATH = oracle.CONTENT_STORE_PATH = os.path.join(root, "content_store.sqlite")
+            oracle.DB_CONFIG_PATH = db_config_path
+            oracle.create_database_pool = lambda config, *_, **__: LocalDatabasePool(database_path, oracle.DB_POOL_MAX, args.latency)
+            oracle.UC_CACHE_PATH = os.path.join(root, "uc_cache.sqlite")
+            oracle.SCAN_INDEX_PATH = os.path.join(root, "pdf_scan_index.sqlite")
+            oracle.SOURCE_DIRECTORIES = list(base_folders.values())
+            oracle.LOCALITIES_PATH = localities_path
+            oracle.HISTORY_PATH = history_path
+            oracle.REPORT_DIRECTORY = report_directory
+            oracle.REPORT_FORMATS = ('xlsx', 'csv')  # O CSV é relido na conferência do relatório
+            outlook.CAMINHO_DESTINATARIOS = recipients_path
+            outlook.CAMINHO_CACHE_DESTINATARIOS = os.path.join(root, "Emails.cache.json")
+            outlook.CAMINHO_PLANILHA_BASE = os.path.join(report_directory, "Processos retirados do FTP em {}.xlsx")
+            outlook.MAIL_BACKEND = 'smtp'
+            outlook.CAMINHO_CONFIG_SMTP = smtp_config
+            outlook.SPLIT_BY_UTD = args.split
+            run_scripts.PIPELINE_LOG_PATH = os.path.join(root, "pipeline_log.log")
+            sys.stdin = io.StringIO("\n")  # Confirmação do e-mail (fora do tempo medido pelo próprio pipeline)
+
+            run_scripts.run_pipeline()
+
+            # Tempos das etapas registrados pelo pipeline (mesmos valores do log e das métricas de produção)
+            snapshot = metrics.REGISTRY.snapshot()
+            for histogram in snapshot["histograms"]:
+                if histogram["name"] == "stage_seconds":
+                    stages[histogram["labels"]["stage"]] = histogram["sum"]
+                elif histogram["name"] == "report_history_seconds":
+                    stages[f"histórico ({histogram['labels']['step']})"] = histogram["sum"]
+            elapsed = stages.pop("total")
+            transferred = sum(counter["value"] for counter in snapshot["counters"]
+                              if counter["name"] == "ftp_files_transferred_total")
+            transferred_bytes = sum(counter["value"] for counter in snapshot["counters"]
+                                    if counter["name"] == "ftp_bytes_transferred_total")
+            integrity, failures = check_e2e_integrity(
+                ftp_server, sources, base_folders,
+                os.path.join(report_directory, f"Processos retirados do FTP em {current_date}.csv"), oracle.RESUBMISSION_COLUMN,
+                {"lost": 0, "corrupt": 0, "kept_on_server": conflicts, "report_rows": total_files,
+                 "resubmissions": len(range(0, total_files, 10))}
+            )
+            return {
+                "files": total_files,
+                "size": args.size,
+                "split": args.split,
+                "overlap": args.overlap,
+                "transferred": transferred,
+                "report_rows": integrity["report_rows"],
+                "messages": smtp_server.messages,
+                "mail_bytes": smtp_server.bytes,
+                "seconds": round(elapsed, 4),
+                "files_per_second": round(transferred / elapsed, 1) if elapsed else None,
+                "mib_per_second": round(transferred_bytes / 2**20 / elapsed, 2) if elapsed else None,
+                "stages": {stage: round(seconds, 4) for stage, seconds in stages.items()},
+                "peak_rss_mib": round(peak_rss() / 2**20, 1) if peak_rss() else None,
+                "integrity": integrity,
+                "failures": failures,
+            }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def stage_timer(stages, stage):
+    # Mede o tempo de parede de uma etapa (mesmo critério do log de etapas do run_scripts.py)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[stage] = time.perf_counter() - start
+
+
+def compare_e2e(runs, baseline_path):
+    # Compara as rodadas com um arquivo de referência gravado antes (mesma escala de arquivos)
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = {run["files"]: run for run in json.load(file)["runs"]}
+    print(f"Comparação com {baseline_path} (negativo = mais rápido / menos memória)")
+    for run in runs:
+        previous = baseline.get(run["files"])
+        if previous is None:
+            print(f"  {run['files']:>7} arquivos: sem referência")
+            continue
+        if (run["size"], run["split"], run["overlap"]) != (previous["size"], previous["split"], previous.get("overlap")):
+            print(f"  {run['files']:>7} arquivos: referência com outro tamanho de PDF, divisão por UTD ou fração de "
+                  f"nomes repetidos (não comparável)")
+            continue
+        changes = [("total", run["seconds"], previous["seconds"])]
+        changes += [(stage, seconds, previous["stages"].get(stage)) for stage, seconds in run["stages"].items()]
+        changes.append(("pico RSS", run["peak_rss_mib"], previous.get("peak_rss_mib")))
+        parts = [f"{name} {(current - old) / old * 100:+.1f}%" for name, current, old in changes if current and old]
+        print(f"  {run['files']:>7} arquivos: " + ", ".join(parts))
+
+
+def bench_e2e(args):
+    # Benchmark de ponta a ponta: FTP local com N PDFs em 4 contas, tabela local de UCs e servidor SMTP local
+    if args.single:
+        # Rodada de uma escala (processo filho): o pico de memória medido é só desta escala
+        # O log vai para o arquivo do pipeline (run_scripts.PIPELINE_LOG_PATH, no diretório temporário da rodada)
+        with contextlib.redirect_stdout(io.StringIO()):  # Omite os prints das etapas
+            run = run_e2e_scale(args)
+        print("resultado:" + json.dumps(run))
+        return
+
+    runs = []
+    failed = False
+    print(f"Ponta a ponta (coleta FTP, consulta, relatório e e-mail): PDFs de {args.size} bytes, "
+          f"latência {args.latency * 1000:.0f} ms, {args.overlap:.0%} de nomes repetidos entre contas"
+          f"{', relatório dividido por UTD' if args.split else ''}")
+    for files in args.files:
+        command = [os.path.abspath(__file__), "e2e", "--single", str(files), "--size", str(args.size),
+                   "--latency", str(args.latency), "--overlap", str(args.overlap)] + (["--split"] if args.split else [])
+        _, completed = run_python(command, tempfile.gettempdir())
+        lines = [line for line in completed.stdout.splitlines() if line.startswith("resultado:")]
+        if completed.returncode != 0 or not lines:
+            print(f"  {files:>7} arquivos: falhou ({(completed.stderr.strip().splitlines() or ['?'])[-1]})")
+            failed = True
+            continue
+        run = json.loads(lines[-1].split(":", 1)[1])
+        runs.append(run)
+        stages = "  ".join(f"{stage} {seconds:.2f} s" for stage, seconds in run["stages"].items())
+        rss = f"{run['peak_rss_mib']:.0f} MiB" if run["peak_rss_mib"] else "?"
+        print(f"  {run['files']:>7} arquivos  {run['seconds']:8.2f} s  {run['files_per_second']:8.1f} arquivos/s"
+              f"  {run['mib_per_second']:6.2f} MiB/s  pico RSS {rss}  linhas {run['report_rows']}"
+              f"  e-mails {run['messages']}\n           {stages}")
+        if run["failures"]:
+            print(f"           integridade FALHOU: {'; '.join(run['failures'])}")
+            failed = True
+        else:
+            integrity = run["integrity"]
+            print(f"           integridade ok: nenhum PDF perdido ou corrompido, {integrity['resubmissions']} reenvio(s), "
+                  f"{integrity['kept_on_server']} conflito(s) de nome mantido(s) no servidor")
+
+    if args.compare:
+        compare_e2e(runs, args.compare)
+    if runs and args.out:
+        baseline = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "latency": args.latency,
+            "runs": runs,
+        }
+        with open(args.out, "w", encoding="utf-8") as file:
+            json.dump(baseline, file, ensure_ascii=False, indent=2)
+        print(f"Medidas gravadas em {args.out}")
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline FTP/Oracle com substitutos locais.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ftp_parser = subparsers.add_parser("ftp", help="Vazão da coleta FTP com múltiplas contas")
+    ftp_parser.add_argument("--files", type=int, default=10, help="PDFs por diretório de cada conta")
+    ftp_parser.add_argument("--size", type=int, default=20_000, help="Tamanho de cada PDF em bytes")
+    ftp_parser.add_argument("--latency", type=float, default=0.01, help="Latência simulada por comando (s)")
+    ftp_parser.add_argument("--workers", type=int, nargs="+", default=[4, 8, 16])
+    ftp_parser.set_defaults(func=bench_ftp)
+
+    names_parser = subparsers.add_parser("names", help="Arquivos de mesmo nome em contas diferentes (nada pode ser perdido)")
+    names_parser.add_argument("--size", type=int, default=2_000_000, help="Tamanho de cada PDF em bytes")
+    names_parser.add_argument("--rounds", type=int, default=5, help="Repetições de cada cenário")
+    names_parser.add_argument("--latency", type=float, default=0.0, help="Latência simulada por comando (s)")
+    names_parser.set_defaults(func=bench_names)
+
+    oracle_parser = subparsers.add_parser("oracle", help="Consulta de UCs contra uma tabela local")
+    oracle_parser.add_argument("--ucs", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    oracle_parser.add_argument("--chunk", type=int, default=1000, help="UCs por bloco de variáveis de ligação")
+    oracle_parser.add_argument("--workers", type=int, default=4, help="Conexões do pool na consulta paralela")
+    oracle_parser.add_argument("--latency", type=float, default=0.02, help="Latência simulada por execução (s)")
+    oracle_parser.set_defaults(func=bench_oracle)
+
+    report_parser = subparsers.add_parser("report", help="Montagem do relatório a partir dos resultados da consulta")
+    report_parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    report_parser.set_defaults(func=bench_report)
+
+    excel_parser = subparsers.add_parser("excel", help="Gravação da planilha do relatório")
+    excel_parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    excel_parser.set_defaults(func=bench_excel)
+
+    startup_parser = subparsers.add_parser("startup", help="Tempo de importação dos pontos de entrada")
+    startup_parser.add_argument("--repeat", type=int, default=5, help="Execuções por medida (usa a mediana)")
+    startup_parser.set_defaults(func=bench_startup)
+
+    e2e_parser = subparsers.add_parser("e2e", help="Pipeline completo contra FTP, banco e e-mail locais")
+    e2e_parser.add_argument("--files", type=int, nargs="+", default=[100, 10_000, 100_000],
+                            help="PDFs no FTP em cada escala (distribuídos entre as 4 contas e os 4 diretórios)")
+    e2e_parser.add_argument("--size", type=int, default=4_000, help="Tamanho de cada PDF em bytes")
+    e2e_parser.add_argument("--latency", type=float, default=0.0, help="Latência simulada por comando FTP e consulta (s)")
+    e2e_parser.add_argument("--split", action="store_true", help="Divide o relatório por UTD no envio dos e-mails")
+    e2e_parser.add_argument("--overlap", type=float, default=0.02,
+                            help="Fração dos PDFs reenviada por outra conta com o mesmo nome (metade com outro conteúdo)")
+    e2e_parser.add_argument("--out", default=os.path.join(tempfile.gettempdir(), "benchmark_e2e.json"),
+                            help="Arquivo JSON com as medidas da rodada (padrão: diretório temporário)")
+    e2e_parser.add_argument("--compare", help="Arquivo JSON de uma rodada anterior para comparação")
+    e2e_parser.add_argument("--single", type=int, help=argparse.SUPPRESS)  # Uso interno: uma escala no processo filho
+    e2e_parser.set_defaults(func=bench_e2e)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# Caminho do índice de conteúdo (fica junto dos diretórios base)
+CONTENT_STORE_PATH = (r'\\ftp_content_store.sqlite')
+HASH_READ_SIZE = 1024 * 1024  # Tamanho do bloco ao calcular o hash de um arquivo em disco (nunca o arquivo inteiro na memória)
+
+def file_sha256(path):
+    # Função que calcula o SHA-256 de um arquivo gravado em disco, lido em blocos
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def holds_content(path, sha256, size):
+    # Função que confere se o arquivo em disco ainda tem o conteúdo registrado (o caminho pode ter sido substituído)
+    try:
+        return (size is None or os.path.getsize(path) == size) and file_sha256(path) == sha256
+    except OSError:
+        return False
+
+# Classe que indexa os PDFs baixados pelo SHA-256 do conteúdo para detectar cópias do mesmo processo
+class ContentStore:
+    def __init__(self, path=CONTENT_STORE_PATH):
+        # Abre (ou cria) o índice; a conexão é compartilhada entre as threads da coleta
+        self.path = path
+        self.lock = threading.Lock()  # Serializa a verificação e o registro de cada conteúdo
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER,
+                local_path TEXT NOT NULL,
+                stored_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS aliases (
+                sha256 TEXT NOT NULL,
+                account TEXT,
+                remote_path TEXT,
+                local_path TEXT,
+                duplicate INTEGER NOT NULL,
+                seen_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_aliases_sha256 ON aliases (sha256);
+            CREATE INDEX IF NOT EXISTS idx_blobs_local_path ON blobs (local_path);
+        """)
+        self.conn.commit()
+        logging.info(f"Índice de conteúdo aberto: {path}")
+
+    def add(self, sha256, size, local_path, account, remote_path):
+        # Método que registra um arquivo baixado e retorna o caminho da cópia já armazenada, se o conteúdo for duplicado
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock:
+            row = self.conn.execute("SELECT local_path, size FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            # Só é duplicado se a cópia armazenada ainda estiver no disco com o mesmo conteúdo: arquivos já processados
+            # e removidos dos diretórios voltam a ser armazenados (reenvios de dias anteriores continuam no relatório),
+            # e um caminho substituído por outro arquivo não serve de cópia
+            duplicate = (
+                row is not None
+                and os.path.normcase(os.path.abspath(row[0])) != os.path.normcase(os.path.abspath(local_path))
+                and holds_content(row[0], sha256, row[1])
+            )
+            if not duplicate:
+                # O caminho passa a ter este conteúdo: registros de outro conteúdo no mesmo caminho deixam de valer
+                self.conn.execute("DELETE FROM blobs WHERE local_path = ? AND sha256 <> ?", (local_path, sha256))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO blobs (sha256, size, local_path, stored_at) VALUES (?, ?, ?, ?)",
+                    (sha256, size, local_path, now)
+                )
+            self.conn.execute(
+                "INSERT INTO aliases (sha256, account, remote_path, local_path, duplicate, seen_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, account, remote_path, local_path, int(duplicate), now)
+            )
+            self.conn.commit()
+        return row[0] if duplicate else None
+
+    def lookup(self, sha256):
+        # Método que retorna o caminho armazenado de um conteúdo (ou None se ele nunca foi baixado)
+        with self.lock:
+            row = self.conn.execute("SELECT local_path FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def hashes_in(self, directories):
+        # Método que retorna {caminho local: sha256} dos PDFs armazenados nos diretórios informados (busca por prefixo no índice)
+        hashes = {}
+        with self.lock:
+            for directory in set(directories):
+                prefix = directory.rstrip('/\\')
+                for separator in ('/', '\\'):  # Caminhos gravados com barra ou barra invertida
+                    hashes.update(self.conn.execute(
+                        "SELECT local_path, sha256 FROM blobs WHERE local_path >= ? AND local_path < ?",
+                        (prefix + separator, prefix + chr(ord(separator) + 1))
+                    ))
+        return hashes
+
+    def close(self):
+        # Método para fechar o índice
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
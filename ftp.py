@@ -1,31 +1,364 @@
 import ftplib 
+import hashlib
 import os  
 import logging  
+import posixpath
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from manifest import SyncManifest, MANIFEST_PATH
+from content_store import ContentStore, CONTENT_STORE_PATH, HASH_READ_SIZE, file_sha256
+from transfer_scheduler import TransferScheduler, ORDER_SMALLEST, ORDER_DEADLINE, ORDER_LISTING
+import metrics
+import log_config
+
+# Endereço do servidor FTP
+FTP_HOST = "ftp.sua_ftp.com.br"
+FTP_PORT = 21
+
+# Modo de coleta: True processa contas e diretórios em paralelo, False mantém a execução sequencial
+CONCURRENT_MODE = True
+MAX_WORKERS = 8  # Pares (conta, diretório) processados ao mesmo tempo
+MAX_CONNECTIONS_PER_ACCOUNT = 2  # Limite de conexões simultâneas por conta FTP (somando listagem, downloads e exclusões)
+
+# Pool de sessões de cada conta: listagem, downloads e exclusões usam só as sessões do pool (não há conexão principal)
+POOL_SIZE = MAX_CONNECTIONS_PER_ACCOUNT  # Sessões por conta (1 desativa o pool e usa uma única conexão)
+KEEPALIVE_INTERVAL = 30  # Segundos de inatividade antes de enviar NOOP para manter a sessão viva
+
+# Agendador de transferências: uma fila única para todas as contas e diretórios, com prioridade por diretório
+TRANSFER_SCHEDULER = True  # False volta à coleta por (conta, diretório) do CONCURRENT_MODE
+FOLDER_PRIORITIES = {  # 0 é a mais urgente (ajuste conforme a urgência de cada tipo de processo)
+    "/Auto Religacao": 0,
+    "/Avaria": 1,
+    "/processo_completo_PI": 2,
+    "/Operacoes": 2
+}
+DEFAULT_FOLDER_PRIORITY = 2  # Prioridade dos diretórios fora da lista acima
+# Cada transferência ocupa uma sessão do pool da conta: o total de conexões nunca passa de MAX_CONNECTIONS_PER_ACCOUNT por conta
+SCHEDULER_WORKERS = MAX_WORKERS  # Transferências simultâneas no total (somando as contas)
+SCHEDULER_PER_ACCOUNT = MAX_CONNECTIONS_PER_ACCOUNT  # Transferências simultâneas por conta
+TRANSFER_ORDER = ORDER_SMALLEST  # Dentro da mesma prioridade: ORDER_SMALLEST, ORDER_DEADLINE ou ORDER_LISTING
+FOLDER_DEADLINES = {"/Auto Religacao": 4 * 3600, "/Avaria": 24 * 3600}  # Prazo (s) a partir da data do arquivo (ORDER_DEADLINE)
+DEFAULT_FOLDER_DEADLINE = 48 * 3600
+BANDWIDTH_LIMIT = None  # Banda máxima somada de todos os downloads em bytes/s (ex.: 2 * 2**20); None não limita
+BANDWIDTH_LIMIT_HOURS = ("08:00", "18:00")  # Janela em que o limite vale (horário comercial); None limita o dia todo
+
+# Percorre também os subdiretórios de cada diretório FTP (ex.: pastas datadas criadas pelos parceiros)
+RECURSIVE_LISTING = True
+
+# Downloads são gravados em um arquivo temporário e renomeados só quando completos
+PARTIAL_SUFFIX = ".part"  # Sufixo do arquivo parcial; o nome é único por download e o manifesto guarda de quem ele é
+DOWNLOAD_RETRIES = 4  # Número máximo de tentativas por arquivo
+BACKOFF_BASE = 1.0  # Espera (s) antes da segunda tentativa; dobra a cada nova tentativa
+BACKOFF_MAX = 30.0  # Espera máxima (s) entre tentativas
+
+# Validação feita durante o download, sem reler o arquivo gravado
+PDF_MAGIC = b"%PDF-"  # Cabeçalho obrigatório de um PDF
+PDF_EOF_MARKER = b"%%EOF"  # Marcador de fim de arquivo do PDF
+PDF_TRAILER_WINDOW = 1024  # O marcador %%EOF deve aparecer nos últimos bytes do arquivo
+
+# Modo contínuo: as sessões de cada conta ficam abertas entre as varreduras dos diretórios
+POLL_INTERVAL = 120  # Segundos entre duas varreduras dos diretórios FTP
+RECONNECT_BACKOFF_BASE = 15.0  # Espera (s) antes de tentar reconectar uma conta que caiu; dobra a cada falha seguida
+RECONNECT_BACKOFF_MAX = 600.0  # Espera máxima (s) entre tentativas de reconexão de uma conta
+
+# Lista de servidores FTP com suas credenciais
+FTP_SERVERS = [
+    {"username": "username_1", "password": "password_1"},
+    {"username": "username_2", "password": "password_2"},
+    {"username": "username_3", "password": "password_3"},
+    {"username": "username_4", "password": "password_4"}
+]
+
+# Diretórios no servidor FTP que serão acessados
+FTP_FOLDERS = ["/Auto Religacao", "/Avaria", "/processo_completo_PI", "/Operacoes"]
+
+# Mapeia os diretórios FTP para os diretórios locais onde os arquivos serão salvos
+BASE_FOLDERS = {
+    "/path//ftp//1": "//path//1",
+    "/path//ftp//2": "//path//2",
+    "/path//ftp//3": "//path//3",
+    "/path//ftp//4": "//path//4"
+}
+
+# Erros que indicam que a sessão FTP caiu e precisa ser reaberta
+CONNECTION_ERRORS = (EOFError, ConnectionError, TimeoutError, ftplib.error_temp, ftplib.error_reply)
 
 # Função para configurar o logging
 def setup_logging():
-    logging.basicConfig(
-        filename=(r'\\ftp_log.log'), 
-        level=logging.DEBUG,  # Define o nível de log como DEBUG
-        format='%(asctime)s - %(levelname)s - %(message)s',  # Define o formato das mensagens de log
-        filemode='w'  # Modo de escrita do arquivo de log (substitui o arquivo a cada execução)
-    )
+    # Gravação em segundo plano; cada execução começa um arquivo novo e as anteriores são mantidas (ftp_log.log.1, ...)
+    log_config.setup_logging(r'\\ftp_log.log', level=logging.DEBUG)  # Define o nível de log como DEBUG
+
+def open_ftp_session(username, password, host=FTP_HOST, port=FTP_PORT):
+    # Função para abrir uma sessão FTP autenticada, em modo passivo e binário
+    session = ftplib.FTP()  # Cria uma instância de FTP
+    session.connect(host, port)  # Conecta ao servidor FTP
+    session.login(username, password)  # Realiza o login com as credenciais fornecidas
+    session.set_pasv(True)  # Ativa o modo passivo
+    session.voidcmd("TYPE I")  # Define o tipo de transferência como binário
+    return session
+
+def close_ftp_session(session):
+    # Função para encerrar uma sessão FTP, mesmo que a conexão já tenha caído
+    try:
+        session.quit()  # Encerra a sessão de forma educada
+    except Exception:
+        session.close()  # A conexão já caiu: apenas fecha o socket
+
+# Formato DOS/Windows da resposta do LIST: "01-31-24  10:15AM       12345 nome.pdf" ou "<DIR>"
+DOS_LIST_LINE = re.compile(r"^(\d{2}-\d{2}-\d{2,4})\s+(\d{1,2}:\d{2}[AP]M)\s+(<DIR>|\d+)\s+(.+)$", re.IGNORECASE)
+
+def parse_list_line(line):
+    # Função que interpreta uma linha do LIST (formatos Unix e DOS) e retorna (nome, é_diretório, tamanho, data)
+    match = DOS_LIST_LINE.match(line)
+    if match:
+        date, hour, size, name = match.groups()
+        is_dir = size.upper() == "<DIR>"
+        return name, is_dir, None if is_dir else int(size), f"{date} {hour}"
+    fields = line.split(None, 8)  # Unix: permissões, links, dono, grupo, tamanho, mês, dia, hora/ano, nome
+    if len(fields) < 9 or fields[0][0] not in "-dl" or not fields[4].isdigit():
+        return None  # Linha de total ("total 12") ou formato desconhecido
+    name = fields[8]
+    if fields[0][0] == "l":
+        name = name.split(" -> ")[0]  # Link simbólico: descarta o destino
+    # O LIST não traz ano/segundos de forma uniforme; o texto da data é guardado como veio (estável entre execuções)
+    return name, fields[0][0] == "d", int(fields[4]), " ".join(fields[5:8])
+
+destination_locks = {}  # {caminho final: trava}: dois downloads nunca gravam o mesmo arquivo ao mesmo tempo
+destination_locks_lock = threading.Lock()
+
+def destination_lock(local_file_path):
+    # Função que retorna a trava do caminho final de um download
+    key = os.path.normcase(os.path.abspath(local_file_path))
+    with destination_locks_lock:
+        return destination_locks.setdefault(key, threading.Lock())
+
+# Classe usada como callback do retrbinary: grava cada bloco recebido e valida o PDF enquanto ele chega
+class PDFStreamValidator:
+    def __init__(self, sink):
+        # sink é a função que grava o bloco no disco (ex.: f.write)
+        self.sink = sink
+        self.sha256 = hashlib.sha256()  # Hash do conteúdo completo
+        self.size = 0  # Bytes recebidos
+        self.head = b""  # Primeiros bytes, para conferir o cabeçalho %PDF-
+        self.tail = b""  # Últimos bytes, para conferir o trailer %%EOF
+
+    def update(self, chunk):
+        # Método que atualiza hash, contagem e janelas de cabeçalho/trailer com um bloco de dados
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        if len(self.head) < len(PDF_MAGIC):
+            self.head += chunk[:len(PDF_MAGIC) - len(self.head)]
+        if len(chunk) >= PDF_TRAILER_WINDOW:
+            self.tail = chunk[-PDF_TRAILER_WINDOW:]
+        else:
+            self.tail = (self.tail + chunk)[-PDF_TRAILER_WINDOW:]
+
+    def update_from_file(self, path):
+        # Método que inclui no cálculo o trecho já gravado de um download parcial que será retomado
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_READ_SIZE), b""):
+                self.update(chunk)
+
+    def write(self, chunk):
+        # Callback do retrbinary: grava o bloco e atualiza a validação
+        self.sink(chunk)
+        self.update(chunk)
+
+    def problems(self):
+        # Método que lista os problemas de integridade encontrados (lista vazia se o PDF for válido)
+        problems = []
+        if self.head != PDF_MAGIC:
+            problems.append("cabeçalho %PDF- ausente")
+        if PDF_EOF_MARKER not in self.tail:
+            problems.append("marcador %%EOF ausente no final do arquivo")
+        return problems
+
+    def hexdigest(self):
+        # Método que retorna o SHA-256 do conteúdo recebido
+        return self.sha256.hexdigest()
+
+# Classe que mantém um pool de sessões FTP autenticadas de uma mesma conta
+class FTPSessionPool:
+    def __init__(self, username, password, host=FTP_HOST, port=FTP_PORT, size=POOL_SIZE, keepalive_interval=KEEPALIVE_INTERVAL):
+        # Inicializa o pool; as sessões são abertas sob demanda, até o tamanho máximo
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.size = size
+        self.keepalive_interval = keepalive_interval
+        self.idle = queue.LifoQueue()  # Sessões livres (a usada mais recentemente é reaproveitada primeiro)
+        self.lock = threading.Lock()
+        self.created = 0  # Número de sessões abertas (livres + em uso)
+        self.closed = threading.Event()
+        self.keepalive_thread = threading.Thread(target=self.keepalive_loop, daemon=True)
+        self.keepalive_thread.start()
+
+    def open_session(self):
+        # Método para abrir uma nova sessão do pool
+        session = open_ftp_session(self.username, self.password, self.host, self.port)
+        session.current_folder = None  # Diretório corrente da sessão
+        session.last_used = time.monotonic()  # Momento do último comando enviado
+        logging.debug(f"Nova sessão FTP aberta no pool do usuário {self.username}")
+        return session
+
+    def discard(self, session):
+        # Método para fechar uma sessão morta e liberar sua vaga no pool
+        close_ftp_session(session)
+        with self.lock:
+            self.created -= 1
+
+    def release(self, session):
+        # Método para devolver uma sessão ao pool; depois do close() ela é fechada, nunca reenfileirada
+        # (a verificação e o close() usam o mesmo lock: nenhuma sessão volta para a fila depois de esvaziada)
+        with self.lock:
+            if not self.closed.is_set():
+                self.idle.put(session)
+                return
+        self.discard(session)
+
+    def take(self):
+        # Método para obter uma sessão livre, abrindo uma nova se o pool ainda não estiver cheio
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self.lock:
+                can_open = self.created < self.size
+                if can_open:
+                    self.created += 1  # Reserva a vaga antes de abrir a conexão
+            if can_open:
+                try:
+                    return self.open_session()
+                except Exception:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+            try:
+                return self.idle.get(timeout=1)  # Aguarda uma sessão ser devolvida (ou uma vaga ser liberada)
+            except queue.Empty:
+                continue
+
+    def checkout(self, folder):
+        # Método para obter uma sessão viva posicionada no diretório desejado
+        for attempt in range(2):
+            session = self.take()
+            try:
+                if time.monotonic() - session.last_used > self.keepalive_interval:
+                    session.voidcmd("NOOP")  # Sessão parada há muito tempo: confirma que ainda está viva
+                if folder is not None and session.current_folder != folder:
+                    session.cwd(folder)  # Posiciona a sessão no diretório
+                    session.current_folder = folder
+                return session
+            except CONNECTION_ERRORS + (OSError,) as e:
+                logging.warning(f"Sessão FTP do usuário {self.username} caiu, reconectando: {e}")
+                self.discard(session)
+                if attempt == 1:
+                    raise
+            except Exception:
+                self.release(session)  # Erro do comando (ex.: 550 no CWD) com a sessão viva: ela volta ao pool
+                raise
+
+    @contextmanager
+    def acquire(self, folder=None):
+        # Empresta uma sessão do pool; se algo falhar durante o uso, a sessão é descartada e reaberta na próxima vez
+        session = self.checkout(folder)
+        try:
+            yield session
+        except BaseException:
+            self.discard(session)  # O estado da sessão é incerto após um erro no meio de uma transferência
+            raise
+        session.last_used = time.monotonic()
+        self.release(session)  # Devolve a sessão ao pool
+
+    def keepalive_loop(self):
+        # Envia NOOP periodicamente às sessões ociosas para que o servidor não as encerre
+        while not self.closed.wait(self.keepalive_interval):
+            sessions = []
+            while True:
+                try:
+                    sessions.append(self.idle.get_nowait())
+                except queue.Empty:
+                    break
+            for session in sessions:
+                if time.monotonic() - session.last_used >= self.keepalive_interval:
+                    try:
+                        session.voidcmd("NOOP")
+                        session.last_used = time.monotonic()
+                    except Exception as e:
+                        logging.warning(f"Keep-alive falhou para o usuário {self.username}, descartando sessão: {e}")
+                        self.discard(session)
+                        continue
+                self.release(session)  # Se o pool foi fechado durante os NOOPs, a sessão é fechada aqui
+
+    def close(self):
+        # Método para encerrar o keep-alive e todas as sessões livres do pool
+        with self.lock:
+            self.closed.set()  # Sessões devolvidas a partir daqui (release) são fechadas em vez de reenfileiradas
+        while True:
+            try:
+                session = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            close_ftp_session(session)
+            with self.lock:
+                self.created -= 1
 
 # Classe para gerenciar o download de arquivos via FTP
 class FTPDownloader:
-    def __init__(self, username, password):
-        # Inicializa a classe com o nome de usuário e senha
+    def __init__(self, username, password, host=FTP_HOST, port=FTP_PORT, pool_size=POOL_SIZE, manifest=None,
+                 content_store=None, on_download=None, pool=None, scheduler=None):
+        # Inicializa a classe com o nome de usuário, senha e endereço do servidor
         self.username = username
         self.password = password
-        self.ftp = None  # Inicializa o objeto FTP como None
+        self.host = host
+        self.port = port
+        self.pool_size = pool.size if pool is not None else pool_size  # Número de sessões em paralelo
+        self.ftp = None  # Conexão única, usada só sem pool (pool_size 1)
+        self.pool = pool  # Pool de sessões da conta (criado no connect se pool_size > 1, ou compartilhado pelos diretórios da conta)
+        self.owns_pool = pool is None  # Um pool compartilhado entre os diretórios da conta é fechado por quem o criou
+        self.current_folder = None  # Diretório FTP sendo processado
+        self.manifest = manifest  # Manifesto de sincronização (None baixa todos os arquivos, como antes)
+        self.supports_mlsd = True  # Desativado na primeira recusa do servidor ao comando MLSD
+        self.remote_listing = {}  # {caminho relativo ao diretório: (tamanho, modificação)} do diretório corrente
+        self.skipped_files = 0  # PDFs do diretório corrente ignorados por já terem sido baixados
+        self.content_store = content_store  # Índice de conteúdo para descartar cópias do mesmo PDF (None mantém todas)
+        self.folder_stats = {"transferred": 0, "skipped": 0, "duplicates": 0, "deleted": 0}  # Contadores do último diretório processado
+        self.verified_files = {}  # {caminho remoto: {"size", "sha256", "local_path", "new"}} dos arquivos baixados e validados
+        self.duplicate_files = []  # Arquivos do diretório corrente cujo conteúdo já estava armazenado
+        self.deferred_files = []  # Arquivos do diretório corrente adiados porque outro arquivo já ocupa o mesmo nome local
+        self.on_download = on_download  # Chamada com (nome do arquivo, caminho local) a cada PDF novo salvo no diretório base
+        self.scheduler = scheduler  # Agendador que ordena e executa as transferências (None usa o pool de threads do diretório)
+        self.partials = {}  # {caminho remoto: arquivo parcial} dos downloads interrompidos nesta execução
+
+    def open_sessions(self):
+        # Método que abre a conexão única ou a primeira sessão do pool da conta
+        if self.pool is None and self.pool_size > 1:
+            # Cria o pool de sessões da conta
+            self.pool = FTPSessionPool(self.username, self.password, self.host, self.port, self.pool_size)
+        if self.pool is None:
+            self.ftp = open_ftp_session(self.username, self.password, self.host, self.port)  # Abre a conexão única
+            return
+        try:
+            with self.pool.acquire():
+                pass  # Abre (ou confere) uma sessão do pool: credenciais inválidas falham aqui, como antes
+        except Exception:
+            if self.owns_pool:
+                self.pool.close()  # Não deixa aberto o pool de uma conta que não conectou
+                self.pool = None
+            raise
 
     def connect(self):
         # Método para conectar ao servidor FTP
         try:
-            self.ftp = ftplib.FTP("ftp.sua_ftp.com.br")  # Cria uma instância de FTP
-            self.ftp.login(self.username, self.password)  # Realiza o login com as credenciais fornecidas
-            self.ftp.set_pasv(True)  # Ativa o modo passivo
-            self.ftp.voidcmd("TYPE I")  # Define o tipo de transferência como binário
+            self.open_sessions()
             logging.info(f"Conectado ao servidor FTP com usuário {self.username}")  # Log de sucesso
         except ftplib.error_perm as e:
             # Captura erros de permissão
@@ -39,9 +372,30 @@ class FTPDownloader:
 
     def disconnect(self):
         # Método para desconectar do servidor FTP
+        if self.pool and self.owns_pool:
+            self.pool.close()  # Encerra as sessões da conta
+            self.pool = None
         if self.ftp:
-            self.ftp.quit()  # Encerra a sessão FTP
-            logging.info(f"Desconectado do servidor FTP com usuário {self.username}")  # Log de desconexão
+            close_ftp_session(self.ftp)  # Encerra a sessão FTP
+            self.ftp = None
+        logging.info(f"Desconectado do servidor FTP com usuário {self.username}")  # Log de desconexão
+
+    def keepalive(self):
+        # Método que envia NOOP pela conexão única ou por uma sessão do pool (falha se a conta estiver inacessível)
+        if self.pool is None:
+            self.ftp.voidcmd("NOOP")
+            return
+        with self.pool.acquire() as session:
+            session.voidcmd("NOOP")
+
+    def change_folder(self, folder):
+        # Método que entra no diretório (e confirma que ele existe) pela conexão única ou por uma sessão do pool
+        if self.pool is None:
+            self.ftp.cwd(folder)
+        else:
+            with self.pool.acquire(folder):
+                pass  # A sessão volta ao pool já posicionada no diretório
+        self.current_folder = folder
 
     def log_error(self, message):
         # Método para registrar erros
@@ -51,31 +405,185 @@ class FTPDownloader:
     def download_files(self, folder, base_folder):
         # Método para baixar arquivos de um diretório específico
         try:
-            self.ftp.cwd(folder)  # Muda para o diretório desejado
-            files = self.ftp.nlst()  # Lista os arquivos no diretório
+            self.change_folder(folder)  # Muda para o diretório desejado
+            self.duplicate_files = []
+            self.deferred_files = []
+            self.verified_files = {}  # Só interessa ao diretório corrente (no modo contínuo o objeto vive por dias)
+            self.remote_listing = {}  # Preenchido à medida que a árvore remota é percorrida
+            self.skipped_files = 0
+            # Os downloads começam enquanto os subdiretórios ainda estão sendo listados
+            files = self.iter_new_files(folder)
             downloaded_files, failed_downloads = self.process_files_from_list(files, base_folder)  # Processa a lista de arquivos
 
             logging.info(f"Número de arquivos baixados do diretório {folder}: {len(downloaded_files)}")  # Log do número de arquivos baixados
+            if self.manifest is not None:
+                logging.info(f"Número de arquivos ignorados (já baixados) no diretório {folder}: {self.skipped_files}")
+            if self.duplicate_files:
+                logging.info(f"Número de arquivos duplicados descartados no diretório {folder}: {len(self.duplicate_files)}")
+            if self.deferred_files:
+                logging.warning(f"Número de arquivos adiados por conflito de nome no diretório {folder}: {len(self.deferred_files)}")
+            self.folder_stats = {"transferred": len(downloaded_files), "skipped": self.skipped_files,
+                                 "duplicates": len(self.duplicate_files), "deleted": 0}
             
             self.log_failed_downloads(failed_downloads, folder)  # Registra arquivos que falharam no download
             return len(downloaded_files), downloaded_files  # Retorna a quantidade de arquivos baixados e a lista
         except Exception as e:
             self.log_error(f"Erro ao baixar arquivos do diretório {folder}: {e}")  # Registra erro ao baixar arquivos
 
+    def list_directory(self, session, path):
+        # Método que lista um diretório remoto e retorna [(nome, é_diretório, tamanho, data de modificação)]
+        with metrics.timer("ftp_listing_seconds", account=self.username):  # Tempo de cada listagem
+            if self.supports_mlsd:
+                try:
+                    # MLSD traz tipo, tamanho e data de todas as entradas em uma única listagem
+                    return [
+                        (name, facts.get("type") == "dir", int(facts["size"]) if "size" in facts else None, facts.get("modify"))
+                        for name, facts in session.mlsd(path)
+                        if facts.get("type", "file") in ("file", "dir")  # Ignora as entradas "." e ".." (cdir/pdir)
+                    ]
+                except ftplib.error_perm as e:
+                    logging.info(f"Servidor não suporta MLSD ({e}). Usando LIST.")
+                    self.supports_mlsd = False
+            lines = []
+            session.retrlines(f"LIST {path}", lines.append)
+            entries = [entry for entry in map(parse_list_line, lines) if entry and entry[0] not in (".", "..")]
+            if entries or not lines:
+                return entries
+            # Formato de LIST desconhecido: usa NLST (sem subdiretórios) com SIZE/MDTM por arquivo
+            logging.warning(f"Formato de LIST não reconhecido em {path}. Usando NLST.")
+            names = [posixpath.basename(name) for name in session.nlst(path)]
+            return [(name, False) + self.stat_remote_file(session, posixpath.join(path, name)) for name in names]
+
+    def stat_remote_file(self, session, file):
+        # Método para obter tamanho (SIZE) e data de modificação (MDTM) de um arquivo, quando o servidor suporta
+        if self.manifest is None or not file.lower().endswith(".pdf"):
+            return None, None  # Sem manifesto os metadados não são necessários; arquivos que não são PDF não são baixados
+        try:
+            size = session.size(file)
+        except ftplib.error_perm:
+            size = None
+        try:
+            modify = session.voidcmd(f"MDTM {file}").split()[-1]  # Resposta no formato "213 AAAAMMDDHHMMSS"
+        except ftplib.error_perm:
+            modify = None
+        return size, modify
+
+    def list_with_pool(self, path):
+        # Método que lista um diretório usando uma sessão do pool
+        with self.pool.acquire() as session:
+            return self.list_directory(session, path)
+
+    def walk(self, folder):
+        # Gerador que percorre a árvore remota e entrega (caminho, tamanho, data) de cada arquivo assim que seu diretório é listado
+        if self.pool is None:
+            pending = [folder]
+            while pending:
+                path = pending.pop(0)
+                for name, is_dir, size, modify in self.list_directory(self.ftp, path):
+                    child = posixpath.join(path, name)
+                    if not is_dir:
+                        yield child, size, modify
+                    elif RECURSIVE_LISTING:
+                        pending.append(child)
+            return
+
+        # Com pool, diretórios irmãos são listados em paralelo; cada listagem concluída entra na fila de resultados
+        results = queue.Queue()
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            def submit(path):
+                future = executor.submit(self.list_with_pool, path)
+                future.add_done_callback(lambda done, path=path: results.put((path, done)))
+
+            submit(folder)
+            pending = 1
+            while pending:
+                path, future = results.get()
+                pending -= 1
+                try:
+                    entries = future.result()
+                except Exception as e:
+                    if path == folder:
+                        raise  # Falha ao listar o diretório principal interrompe o diretório, como antes
+                    logging.error(f"Erro ao listar o diretório {path}: {e}")
+                    continue
+                for name, is_dir, size, modify in entries:
+                    child = posixpath.join(path, name)
+                    if not is_dir:
+                        yield child, size, modify
+                    elif RECURSIVE_LISTING:
+                        submit(child)
+                        pending += 1
+
+    def iter_new_files(self, folder):
+        # Gerador que entrega, relativos ao diretório, só os arquivos novos ou alterados segundo o manifesto
+        for path, size, modify in self.walk(folder):
+            file = posixpath.relpath(path, folder)
+            self.remote_listing[file] = (size, modify)
+            if self.manifest is not None and self.manifest.is_current(self.username, path, size, modify):
+                if file.lower().endswith(".pdf"):
+                    self.skipped_files += 1  # PDF já baixado em uma execução anterior
+                    metrics.inc("ftp_files_skipped_total", account=self.username)
+                continue
+            yield file
+
+    def remote_path(self, file):
+        # Método que monta o caminho remoto completo de um arquivo do diretório corrente
+        return posixpath.join(self.current_folder or "/", file)
+
     def process_files_from_list(self, files, base_folder):
-        # Método para processar a lista de arquivos e tentar baixá-los
+        # Método para processar a lista de arquivos e tentar baixá-los (a lista pode ser um gerador)
         downloaded_files = []  # Lista para arquivos baixados
         failed_downloads = []  # Lista para arquivos que falharam no download
+        pending = []  # Lista de (nome, resultado ou future) dos PDFs baixados/em download
+        targets = {}  # {caminho local: arquivo remoto} dos PDFs desta listagem
 
-        for file in files:
-            file_name = self.decode_file_name(file)  # Decodifica o nome do arquivo
-            if file_name and file_name.lower().endswith(".pdf"):  # Verifica se é um arquivo PDF
-                local_file_path = os.path.join(base_folder, file_name)  # Define o caminho local para salvar o arquivo
-                os.makedirs(os.path.dirname(local_file_path), exist_ok=True)  # Cria o diretório se não existir
-                if self.download_file(file_name, local_file_path):  # Tenta baixar o arquivo
-                    downloaded_files.append(file_name)  # Adiciona à lista de arquivos baixados
-                else:
-                    failed_downloads.append(file_name)  # Adiciona à lista de falhas
+        # Com pool, cada arquivo é enviado para download assim que aparece na listagem
+        executor = ThreadPoolExecutor(max_workers=self.pool_size) if self.pool is not None and self.scheduler is None else None
+        try:
+            for file in files:
+                file_name = self.decode_file_name(file)  # Decodifica o nome do arquivo
+                if file_name and file_name.lower().endswith(".pdf"):  # Verifica se é um arquivo PDF
+                    # Arquivos de subdiretórios são salvos diretamente no diretório base (a UC vem do nome do arquivo
+                    # e a leitura dos PDFs não entra em subdiretórios); só o nome final é usado, nunca o caminho remoto
+                    # Barras invertidas no nome remoto viram separadores no Windows: também são tratadas como diretório
+                    local_file_path = os.path.join(base_folder, posixpath.basename(file_name.replace("\\", "/")))  # Define o caminho local para salvar o arquivo
+                    if local_file_path in targets:
+                        # Mesmo nome em dois subdiretórios: o primeiro é baixado e o outro fica no servidor até a próxima execução
+                        self.deferred_files.append(file_name)
+                        metrics.inc("ftp_files_deferred_total", account=self.username)
+                        logging.warning(f"Arquivo {file_name} tem o mesmo nome de {targets[local_file_path]}. Mantido no servidor.")
+                        continue
+                    targets[local_file_path] = file_name
+                    os.makedirs(os.path.dirname(local_file_path), exist_ok=True)  # Cria o diretório se não existir
+                    if self.scheduler is not None:
+                        # A posição na fila depende da prioridade do diretório e do tamanho/data da listagem
+                        size, modify = self.remote_listing.get(file, (None, None))
+                        pending.append((file_name, self.scheduler.submit(self.username, self.current_folder, size, modify,
+                                                                         self.fetch_file, file_name, local_file_path, file)))
+                    elif executor is None:
+                        pending.append((file_name, self.fetch_file(file_name, local_file_path, file)))
+                    else:
+                        pending.append((file_name, executor.submit(self.fetch_file, file_name, local_file_path, file)))
+        except BaseException:
+            # Erro no meio da listagem: os downloads que ainda nem começaram são cancelados
+            for _, result in pending:
+                if isinstance(result, Future):
+                    result.cancel()
+            raise
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)  # Aguarda os downloads em andamento
+            # Também os do escalonador: quem chamou só muda de diretório ou desconecta depois que eles terminarem
+            wait([result for _, result in pending if isinstance(result, Future)])
+
+        for file_name, result in pending:
+            downloaded = result.result() if isinstance(result, Future) else result
+            if downloaded:
+                downloaded_files.append(file_name)  # Adiciona à lista de arquivos baixados
+            elif file_name in self.deferred_files:
+                pass  # Conflito de nome: fica no servidor e é baixado de novo numa próxima execução
+            else:
+                failed_downloads.append(file_name)  # Adiciona à lista de falhas
 
         return downloaded_files, failed_downloads  # Retorna as listas de arquivos baixados e falhados
 
@@ -85,6 +593,7 @@ class FTPDownloader:
             # Verifica se a pasta é uma string, caso contrário, levanta um erro
             raise ValueError(f"A pasta esperada era uma string, conseguiu {type(folder)}")
 
+        self.folder_stats = {"transferred": 0, "skipped": 0, "duplicates": 0, "deleted": 0}
         if not os.path.exists(base_folder):
             # Verifica se o diretório base existe
             logging.error(f"O diretório base {base_folder} não existe. Abortando o download.")  # Log de erro
@@ -109,53 +618,292 @@ class FTPDownloader:
             logging.warning(f"Erro ao decodificar o nome do arquivo: {file}. Ignorando.")  # Log de aviso
             return None  # Retorna None se a decodificação falhar
 
-    def download_file(self, file_name, local_file_path):
-        # Método para baixar um arquivo individual
+    def reconnect(self):
+        # Método para reabrir a sessão principal e voltar ao diretório que estava sendo processado
+        if self.ftp:
+            close_ftp_session(self.ftp)
+        self.connect()
+        if self.current_folder:
+            self.ftp.cwd(self.current_folder)
+
+    def fetch_file(self, file_name, local_file_path, remote_name=None):
+        # Método para baixar um arquivo, retomando de onde parou com espera crescente se a conexão cair
+        remote_name = remote_name or file_name
+        size, modify = self.remote_listing.get(remote_name, (None, None))  # Metadados da listagem do diretório
+        for attempt in range(DOWNLOAD_RETRIES):
+            if attempt:
+                # Espera exponencial limitada, com variação aleatória para as sessões não reconectarem ao mesmo tempo
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                time.sleep(delay + random.uniform(0, delay / 2))
+            try:
+                if self.pool is None:
+                    if self.ftp is None:
+                        self.reconnect()  # A reconexão da tentativa anterior falhou
+                    downloaded = self.download_file(file_name, local_file_path, expected_size=size, modify=modify)
+                else:
+                    with self.pool.acquire(self.current_folder) as session:
+                        downloaded = self.download_file(file_name, local_file_path, session, expected_size=size, modify=modify)
+                if downloaded and self.manifest is not None:
+                    # Registra o download no manifesto assim que ele termina
+                    verified = self.verified_files[self.remote_path(file_name)]
+                    self.manifest.record(self.username, self.remote_path(remote_name), size, modify,
+                                         verified["local_path"], verified["sha256"])
+                if downloaded and self.on_download is not None:
+                    verified = self.verified_files[self.remote_path(file_name)]
+                    if verified["new"]:  # Cópias duplicadas descartadas não são repassadas
+                        self.on_download(file_name, local_file_path)
+                return downloaded
+            except CONNECTION_ERRORS + (OSError,) as e:
+                logging.warning(f"Conexão perdida ao baixar o arquivo {file_name}: {e}. Tentativa {attempt + 1} de {DOWNLOAD_RETRIES}.")
+                if self.pool is None:
+                    close_ftp_session(self.ftp)
+                    self.ftp = None  # Sem pool, a conexão principal é reaberta na próxima tentativa
+            except Exception as e:
+                # Falha ao reabrir a conexão principal: tenta de novo após a espera
+                logging.warning(f"Falha ao reconectar para baixar o arquivo {file_name}: {e}. Tentativa {attempt + 1} de {DOWNLOAD_RETRIES}.")
+        logging.error(f"Arquivo {file_name} não foi baixado após {DOWNLOAD_RETRIES} tentativas.")
+        metrics.inc("ftp_files_failed_total", account=self.username)
+        return False
+
+    def limit_bandwidth(self, write):
+        # Método que passa cada bloco recebido pelo limite de banda do agendador antes de gravá-lo
+        if self.scheduler is None or self.scheduler.bucket is None:
+            return write
+        def throttled_write(chunk):
+            self.scheduler.throttle(len(chunk))  # Segurar a leitura faz o TCP reduzir o envio do servidor
+            write(chunk)
+        return throttled_write
+
+    def partial_file(self, remote_path, local_file_path, expected_size, modify):
+        # Método que retorna (arquivo parcial, bytes já baixados) do download: retoma só um parcial criado por esta conta
+        # para este arquivo remoto (e da mesma versão); senão cria um parcial novo, com nome único, no diretório de destino
+        partial_path = self.partials.get(remote_path)
+        if partial_path is None and self.manifest is not None:
+            recorded = self.manifest.partial(self.username, remote_path)
+            if recorded is not None:
+                partial_path, size, modify_at_start = recorded
+                if (size, modify_at_start) != (expected_size, modify):
+                    self.discard_partial(remote_path, partial_path)  # O arquivo remoto mudou: o trecho baixado não serve mais
+                    partial_path = None
+        if partial_path is not None and os.path.exists(partial_path):
+            offset = os.path.getsize(partial_path)
+            if expected_size is None or offset <= expected_size:
+                return partial_path, offset
+            self.discard_partial(remote_path, partial_path)  # Parcial maior que o arquivo remoto: recomeça do zero
+
+        account = re.sub(r'[^\w.-]+', '_', self.username)
+        handle, partial_path = tempfile.mkstemp(prefix=f"{os.path.basename(local_file_path)}.{account}.",
+                                                suffix=PARTIAL_SUFFIX, dir=os.path.dirname(local_file_path))
+        os.close(handle)
+        self.partials[remote_path] = partial_path
+        if self.manifest is not None:
+            self.manifest.record_partial(self.username, remote_path, partial_path, expected_size, modify)
+        return partial_path, 0
+
+    def discard_partial(self, remote_path, partial_path=None):
+        # Método que apaga o parcial do download (se houver) e esquece o registro dele
+        partial_path = partial_path or self.partials.get(remote_path)
+        self.partials.pop(remote_path, None)
+        if self.manifest is not None:
+            self.manifest.forget_partial(self.username, remote_path)
+        if partial_path and os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    def name_conflict(self, remote_path, local_file_path, sha256):
+        # Método (chamado com a trava do caminho final) que compara o download com o arquivo que já ocupa o nome local:
+        # None = caminho livre (ou nova versão do mesmo arquivo remoto), False = mesmo conteúdo, True = outro arquivo
+        if not os.path.exists(local_file_path):
+            return None
+        if file_sha256(local_file_path) == sha256:
+            return False
+        if self.manifest is not None and self.manifest.owners(local_file_path) == {(self.username, remote_path)}:
+            return None  # O arquivo local é a versão anterior deste mesmo arquivo remoto: pode ser substituído
+        return True
+
+    def download_file(self, file_name, local_file_path, session=None, expected_size=None, modify=None):
+        # Método para baixar um arquivo individual (pela sessão informada ou pela conexão principal)
+        ftp_session = session or self.ftp
+        remote_path = self.remote_path(file_name)
+        # O arquivo só recebe o nome final quando estiver completo
+        partial_path, offset = self.partial_file(remote_path, local_file_path, expected_size, modify)
+        start = time.perf_counter()
         try:
-            with open(local_file_path, "wb") as f:
-                # Abre o arquivo local para escrita em modo binário
-                self.ftp.retrbinary("RETR " + file_name, f.write)  # Realiza o download do arquivo
-            logging.info(f"Arquivo {file_name} transferido com sucesso para {local_file_path}")  # Log de sucesso
+            try:
+                with open(partial_path, "ab" if offset else "wb") as f:
+                    # Continua o arquivo parcial a partir do seu tamanho (REST) ou começa um novo
+                    validator = PDFStreamValidator(self.limit_bandwidth(f.write))
+                    if offset:
+                        validator.update_from_file(partial_path)  # Só o trecho já baixado é relido, para o hash
+                    ftp_session.retrbinary("RETR " + file_name, validator.write, rest=offset or None)
+            except ftplib.error_perm as e:
+                if not offset:
+                    raise
+                # Servidor recusou o REST: baixa o arquivo inteiro novamente
+                logging.warning(f"Não foi possível retomar {file_name} a partir do byte {offset}: {e}. Reiniciando.")
+                offset = 0
+                with open(partial_path, "wb") as f:
+                    validator = PDFStreamValidator(self.limit_bandwidth(f.write))
+                    ftp_session.retrbinary("RETR " + file_name, validator.write)
+            metrics.observe("ftp_transfer_seconds", time.perf_counter() - start, account=self.username)
+            metrics.inc("ftp_bytes_transferred_total", validator.size - offset, account=self.username)  # Só o trecho recebido agora
+            if offset:
+                logging.info(f"Download do arquivo {file_name} retomado a partir do byte {offset}")
+
+            problems = validator.problems()
+            if expected_size is not None and validator.size != expected_size:
+                problems.append(f"{validator.size} de {expected_size} bytes recebidos")
+            if problems:
+                # Arquivo corrompido ou incompleto: descarta o parcial e o arquivo fica em failed_downloads
+                self.discard_partial(remote_path, partial_path)
+                logging.error(f"Arquivo {file_name} inválido ({'; '.join(problems)}). Descartado.")
+                return False
+
+            sha256 = validator.hexdigest()
+            stored_path = local_file_path
+            # Um único download por vez grava (e confere no índice de conteúdo) cada caminho final
+            with destination_lock(local_file_path):
+                conflict = self.name_conflict(remote_path, local_file_path, sha256)
+                if conflict is not None:
+                    self.discard_partial(remote_path, partial_path)
+                    if conflict:
+                        # Outro arquivo remoto, com conteúdo diferente, já ocupa o nome: nada é sobrescrito e o original
+                        # fica no servidor até o arquivo local ser processado (o manifesto não registra o download)
+                        self.deferred_files.append(file_name)
+                        metrics.inc("ftp_files_deferred_total", account=self.username)
+                        logging.warning(f"Arquivo {file_name} tem o mesmo nome de {local_file_path}, com outro conteúdo. "
+                                        f"Mantido no servidor.")
+                        return False
+                    # O arquivo com o mesmo nome já tem este conteúdo: o download é só mais uma cópia
+                    self.verified_files[remote_path] = {"size": validator.size, "sha256": sha256,
+                                                        "local_path": local_file_path, "new": False}
+                    self.duplicate_files.append(file_name)
+                    metrics.inc("ftp_files_duplicate_total", account=self.username)
+                    logging.info(f"Arquivo {file_name} é idêntico a {local_file_path}. Cópia descartada.")
+                    return True
+                os.replace(partial_path, local_file_path)  # Renomeação atômica para o nome final
+                self.partials.pop(remote_path, None)
+                if self.manifest is not None:
+                    self.manifest.forget_partial(self.username, remote_path)
+                if self.content_store is not None:
+                    existing_path = self.content_store.add(sha256, validator.size, local_file_path,
+                                                           self.username, remote_path)
+                    if existing_path:
+                        # Mesmo conteúdo já armazenado (outra conta ou diretório): mantém só a primeira cópia
+                        os.remove(local_file_path)
+                        stored_path = existing_path
+                        self.duplicate_files.append(file_name)
+                        metrics.inc("ftp_files_duplicate_total", account=self.username)
+                        logging.info(f"Arquivo {file_name} é duplicado de {existing_path}. Cópia descartada.")
+            self.verified_files[self.remote_path(file_name)] = {"size": validator.size, "sha256": sha256, "local_path": stored_path,
+                                                                "new": stored_path == local_file_path}
+            metrics.inc("ftp_files_transferred_total", account=self.username)
+            if stored_path == local_file_path:
+                logging.info(f"Arquivo {file_name} transferido com sucesso para {local_file_path}")  # Log de sucesso
             return True  # Retorna True se o download foi bem-sucedido
+        except CONNECTION_ERRORS:
+            raise  # A sessão caiu: o parcial é mantido e quem chamou retoma o download
         except (OSError, ftplib.error_perm) as e:
             # Captura erros de sistema de arquivos ou de permissão
             logging.error(f"Erro ao salvar o arquivo {file_name}: {e}")  # Log de erro
+            try:
+                self.discard_partial(remote_path)  # O próximo download do arquivo começa do zero
+            except OSError:
+                pass
             return False  # Retorna False se o download falhar
 
     def log_failed_downloads(self, failed_downloads, folder):
         # Método para registrar arquivos que falharam no download
         if failed_downloads:
             # Se houver arquivos que falharam
-            print(f"Falha ao transferir arquivos da pasta {folder}: {', '.join(failed_downloads)}")  # Imprime os arquivos que falharam
+            print(f"Falha ao transferir arquivos da pasta {folder}: {log_config.summarize(failed_downloads)}")  # Imprime os arquivos que falharam
 
-    def delete_file(self, file):
-        # Método para deletar um arquivo específico do servidor FTP
+    def delete_file(self, file, session=None):
+        # Método para deletar um arquivo específico do servidor FTP (pela sessão informada ou pela conexão principal)
+        ftp_session = session or self.ftp
         try:
-            self.ftp.delete(file)  # Tenta deletar o arquivo do servidor FTP
+            ftp_session.delete(file)  # Tenta deletar o arquivo do servidor FTP
             logging.info(f"Arquivo {file} deletado com sucesso do servidor FTP.")  # Log de sucesso
+            return True
         except ftplib.error_perm as e:
             # Captura erros de permissão
             logging.error(f"Erro de permissão ao tentar deletar o arquivo {file}: {e}")  # Log de erro
+        except CONNECTION_ERRORS:
+            raise  # A sessão caiu: o pool descarta a sessão e quem chamou registra a falha
         except Exception as e:
             # Captura qualquer outro erro inesperado
             logging.error(f"Erro inesperado ao tentar deletar o arquivo {file}: {e}")  # Log de erro
+        return False
+
+    def delete_pooled(self, file):
+        # Método para deletar um arquivo usando uma sessão do pool
+        try:
+            with self.pool.acquire(self.current_folder) as session:
+                return self.delete_file(file, session)
+        except Exception as e:
+            logging.error(f"Erro de conexão ao tentar deletar o arquivo {file}: {e}")  # Log de erro
+            return False
+
+    def is_verified(self, file):
+        # Método que confirma, no arquivo gravado em disco, que a cópia local é a que foi baixada e validada:
+        # mesmo tamanho da listagem e do download, e o mesmo SHA-256 calculado durante a transferência
+        verified = self.verified_files.get(self.remote_path(file))
+        if verified is None:
+            return False
+        listed_size = self.remote_listing.get(file, (None, None))[0]
+        if listed_size is not None and listed_size != verified["size"]:
+            logging.warning(f"Arquivo {file}: {verified['size']} bytes baixados, {listed_size} na listagem.")
+            return False
+        try:
+            disk_size = os.path.getsize(verified["local_path"])
+            if disk_size != verified["size"]:
+                logging.warning(f"Arquivo {file}: cópia local {verified['local_path']} com {disk_size} bytes, "
+                                f"{verified['size']} baixados.")
+                return False
+            if file_sha256(verified["local_path"]) != verified["sha256"]:
+                logging.warning(f"Arquivo {file}: conteúdo de {verified['local_path']} diferente do que foi baixado.")
+                return False
+        except OSError as e:  # Cópia local removida ou ilegível
+            logging.warning(f"Arquivo {file}: não foi possível conferir a cópia local {verified['local_path']}: {e}")
+            return False
+        return True
 
     def delete_files(self, folder, files=None):
         # Método para deletar um ou múltiplos arquivos do servidor FTP
         try:
+            if folder != self.current_folder or not self.remote_listing:
+                # Só lista de novo se o diretório não for o que acabou de ser baixado
+                self.change_folder(folder)  # Muda para o diretório especificado
+                self.remote_listing = {posixpath.relpath(path, folder): (size, modify)
+                                       for path, size, modify in self.walk(folder)}
+            existing_files = set(self.remote_listing)  # Reaproveita a listagem feita no download (busca em conjunto)
             if files is None:  # Se nenhum arquivo for especificado, assume que deve deletar tudo no diretório
-                self.ftp.cwd(folder)  # Muda para o diretório especificado
-                existing_files = self.ftp.nlst()  # Lista os arquivos existentes no diretório
-                files = existing_files  # Prepara a lista de arquivos para deletar
-            else:
-                self.ftp.cwd(folder)  # Muda para o diretório especificado
-                existing_files = self.ftp.nlst()  # Lista os arquivos existentes no diretório
+                files = list(existing_files)  # Prepara a lista de arquivos para deletar
 
+            to_delete = []
             for file in files:
-                if file in existing_files: 
-                    self.delete_file(file)  # Chama o método para deletar o arquivo
-                else:
+                if file not in existing_files:
                     logging.warning(f"Arquivo {file} não encontrado em {folder}. Ignorando.")  # Log de aviso se o arquivo não for encontrado
+                elif not self.is_verified(file):
+                    # Nunca apaga do servidor um arquivo cuja cópia local não foi conferida
+                    logging.warning(f"Arquivo {file} não teve o download verificado (ou a cópia local não confere). Mantido no servidor.")
+                else:
+                    to_delete.append(file)
+
+            start = time.perf_counter()
+            if self.pool is None:
+                results = [self.delete_file(file) for file in to_delete]
+            else:
+                # Envia os DELE em paralelo pelas sessões do pool
+                with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+                    results = list(executor.map(self.delete_pooled, to_delete))
+            elapsed = time.perf_counter() - start
+
+            deleted = sum(results)
+            metrics.inc("ftp_files_deleted_total", deleted, account=self.username)
+            if to_delete:
+                logging.info(f"Deletados {deleted} de {len(to_delete)} arquivo(s) de {folder} em {elapsed:.2f} s "
+                             f"({elapsed / len(to_delete) * 1000:.0f} ms por arquivo)")
+            self.folder_stats["deleted"] = deleted
         except Exception as e:
             logging.error(f"Erro ao acessar o diretório {folder} para deletar arquivos: {e}")  # Registra erro ao acessar o diretório
 
@@ -168,47 +916,280 @@ class FTPDownloader:
         # Método chamado ao sair do bloco 'with'
         self.disconnect()  # Desconecta do servidor FTP
 
-def main():
-    # Função principal que controla o fluxo do programa
-    setup_logging()  # Configura o logging
-
-    # Lista de servidores FTP com suas credenciais
-    ftp_servers = [
-        {"username": "username_1", "password": "password_1"},
-        {"username": "username_2", "password": "password_2"},
-        {"username": "username_3", "password": "password_3"},
-        {"username": "username_4", "password": "password_4"}
-    ]
-
-    # Diretórios no servidor FTP que serão acessados
-    ftp_folders = ["/Auto Religacao", "/Avaria", "/processo_completo_PI", "/Operacoes"]
-
-    # Mapeia os diretórios FTP para os diretórios locais onde os arquivos serão salvos
-    base_folders = {
-        "/path//ftp//1": "//path//1",
-        "/path//ftp//2": "//path//2",
-        "/path//ftp//3": "//path//3",
-        "/path//ftp//4": "//path//4"
+def new_harvest_summary(base_folders):
+    # Função que cria os contadores da coleta por diretório base
+    return {
+        "transferred": {folder: 0 for folder in base_folders.values()},  # Arquivos transferidos
+        "skipped": {folder: 0 for folder in base_folders.values()},  # Arquivos ignorados por já terem sido baixados
+        "duplicates": {folder: 0 for folder in base_folders.values()},  # Cópias descartadas por conteúdo repetido
+        "deleted": {folder: 0 for folder in base_folders.values()}  # Arquivos apagados do servidor FTP
     }
 
-    # Dicionário para armazenar o número total de arquivos transferidos por diretório base
-    transferred_files_by_base_folder = {folder: 0 for folder in base_folders.values()} 
-    total_transferred_files = 0  # Inicializa o contador total de arquivos transferidos
+def add_folder_stats(summary, base_folder, folder_stats):
+    # Função que soma os contadores de um diretório processado aos totais da coleta
+    for key, value in folder_stats.items():
+        summary[key][base_folder] += value
+
+def harvest_folder(server, folder, base_folder, account_limits, host=FTP_HOST, port=FTP_PORT, manifest=None,
+                   content_store=None, on_download=None, pool=None):
+    # Função para processar um diretório de uma conta pelas sessões do pool da conta
+    with account_limits[server["username"]]:  # Respeita o limite de diretórios simultâneos da conta
+        with FTPDownloader(server["username"], server["password"], host, port, manifest=manifest,
+                           content_store=content_store, on_download=on_download, pool=pool) as downloader:
+            downloader.process_files(folder, base_folder)
+            return downloader.folder_stats  # Retorna os contadores do diretório
+
+def harvest_sequentially(ftp_servers, ftp_folders, base_folders, host=FTP_HOST, port=FTP_PORT, manifest=None,
+                         content_store=None, on_download=None):
+    # Função que percorre as contas e os diretórios um após o outro
+    summary = new_harvest_summary(base_folders)
 
     # Loop através de cada servidor FTP
     for server in ftp_servers:
-        with FTPDownloader(server["username"], server["password"]) as downloader:
+        with FTPDownloader(server["username"], server["password"], host, port, manifest=manifest,
+                           content_store=content_store, on_download=on_download) as downloader:
             # Conecta ao servidor FTP usando as credenciais
             for folder in ftp_folders:
                 if isinstance(folder, str):
                     # Verifica se o nome da pasta é uma string
-                    transferred_files, downloaded_files = downloader.process_files(folder, base_folders[folder]) 
-                    # Processa os arquivos e obtém o número de transferidos e a lista de baixados
-                    transferred_files_by_base_folder[base_folders[folder]] += transferred_files  # Atualiza o contador por diretório
-                    total_transferred_files += transferred_files  # Atualiza o contador total
+                    downloader.process_files(folder, base_folders[folder]) 
+                    # Processa os arquivos e soma os contadores do diretório
+                    add_folder_stats(summary, base_folders[folder], downloader.folder_stats)
                 else:
                     logging.error(f"Folder deve ser uma string, mas recebeu {type(folder)}")  # Log de erro se a pasta não for uma string
 
+    return summary
+
+def harvest_concurrently(ftp_servers, ftp_folders, base_folders, max_workers=MAX_WORKERS,
+                         max_per_account=MAX_CONNECTIONS_PER_ACCOUNT, host=FTP_HOST, port=FTP_PORT, manifest=None,
+                         content_store=None, on_download=None):
+    # Função que processa as contas e os diretórios em paralelo; os diretórios de uma conta dividem o pool de sessões da conta
+    summary = new_harvest_summary(base_folders)
+    # Semáforo por conta para que os diretórios de um usuário não fiquem todos esperando pelas mesmas sessões
+    account_limits = {server["username"]: threading.BoundedSemaphore(max_per_account) for server in ftp_servers}
+    # Um pool por conta, compartilhado pelos diretórios: a conta nunca abre mais de max_per_account conexões
+    pools = {server["username"]: FTPSessionPool(server["username"], server["password"], host, port, max_per_account)
+             for server in ftp_servers}
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:  # O tamanho do pool é o limite de diretórios simultâneos
+            futures = {}
+            # Intercala as contas dentro de cada diretório para que nenhuma conta monopolize os workers
+            for folder in ftp_folders:
+                if not isinstance(folder, str):
+                    logging.error(f"Folder deve ser uma string, mas recebeu {type(folder)}")  # Log de erro se a pasta não for uma string
+                    continue
+                for server in ftp_servers:
+                    future = executor.submit(harvest_folder, server, folder, base_folders[folder], account_limits, host, port,
+                                             manifest, content_store, on_download, pools[server["username"]])
+                    futures[future] = (server["username"], folder)
+
+            for future in as_completed(futures):
+                username, folder = futures[future]
+                try:
+                    folder_stats = future.result()
+                except Exception as e:
+                    # Uma falha em uma conta ou diretório não interrompe os demais
+                    logging.error(f"Erro ao processar o diretório {folder} com usuário {username}: {e}")
+                    continue
+                add_folder_stats(summary, base_folders[folder], folder_stats)  # Atualiza os contadores por diretório
+    finally:
+        for pool in pools.values():
+            pool.close()  # Encerra as sessões de cada conta
+    return summary
+
+def folder_priority(folder):
+    # Função que retorna a prioridade de um diretório FTP (0 é a mais urgente)
+    return FOLDER_PRIORITIES.get(folder, DEFAULT_FOLDER_PRIORITY)
+
+def harvest_scheduled_folder(server, folder, base_folder, pool, scheduler, host=FTP_HOST, port=FTP_PORT, manifest=None,
+                             content_store=None, on_download=None):
+    # Função que lista um diretório de uma conta e entrega os arquivos ao agendador (listagem e transferências usam o pool da conta)
+    with FTPDownloader(server["username"], server["password"], host, port, manifest=manifest, content_store=content_store,
+                       on_download=on_download, pool=pool, scheduler=scheduler) as downloader:
+        downloader.process_files(folder, base_folder)
+        return downloader.folder_stats  # Retorna os contadores do diretório
+
+def harvest_scheduled(ftp_servers, ftp_folders, base_folders, max_workers=SCHEDULER_WORKERS, per_account=SCHEDULER_PER_ACCOUNT,
+                      host=FTP_HOST, port=FTP_PORT, manifest=None, content_store=None, on_download=None,
+                      order=TRANSFER_ORDER, bandwidth=BANDWIDTH_LIMIT, bandwidth_hours=BANDWIDTH_LIMIT_HOURS):
+    # Função que lista todos os diretórios de todas as contas de uma vez e transfere os arquivos pela fila do agendador:
+    # diretórios urgentes primeiro, max_workers transferências no total e per_account por conta
+    summary = new_harvest_summary(base_folders)
+    folders = sorted((folder for folder in ftp_folders if isinstance(folder, str)), key=folder_priority)  # Urgentes listados primeiro
+    for folder in ftp_folders:
+        if not isinstance(folder, str):
+            logging.error(f"Folder deve ser uma string, mas recebeu {type(folder)}")  # Log de erro se a pasta não for uma string
+    # Um pool de sessões por conta, compartilhado pelos diretórios: o limite de conexões vale para a conta inteira
+    pools = {server["username"]: FTPSessionPool(server["username"], server["password"], host, port, per_account)
+             for server in ftp_servers}
+    scheduler = TransferScheduler(max_workers, per_account, FOLDER_PRIORITIES, DEFAULT_FOLDER_PRIORITY, order,
+                                  FOLDER_DEADLINES, DEFAULT_FOLDER_DEADLINE, bandwidth, bandwidth_hours)
+    try:
+        with scheduler, ThreadPoolExecutor(max_workers=max(1, len(ftp_servers) * len(folders))) as executor:
+            # Cada (conta, diretório) só lista e aguarda seus arquivos: as threads passam a maior parte do tempo paradas
+            futures = {
+                executor.submit(harvest_scheduled_folder, server, folder, base_folders[folder], pools[server["username"]],
+                                scheduler, host, port, manifest, content_store, on_download): (server["username"], folder)
+                for folder in folders for server in ftp_servers
+            }
+            for future in as_completed(futures):
+                username, folder = futures[future]
+                try:
+                    folder_stats = future.result()
+                except Exception as e:
+                    # Uma falha em uma conta ou diretório não interrompe os demais
+                    logging.error(f"Erro ao processar o diretório {folder} com usuário {username}: {e}")
+                    continue
+                add_folder_stats(summary, base_folders[folder], folder_stats)  # Atualiza os contadores por diretório
+    finally:
+        for pool in pools.values():
+            pool.close()  # Encerra as sessões de transferência de cada conta
+    return summary
+
+def harvest(on_download=None):
+    # Função que coleta os PDFs de todas as contas e diretórios e retorna os contadores por diretório base
+    # O manifesto registra o que já foi baixado para que as próximas execuções só transfiram arquivos novos ou alterados
+    # O índice de conteúdo descarta cópias do mesmo PDF enviadas para mais de uma conta ou diretório
+    with SyncManifest(MANIFEST_PATH) as manifest, ContentStore(CONTENT_STORE_PATH) as content_store:
+        # Servidor e porta lidos na chamada (não no import): podem ser trocados antes da coleta (ex.: benchmark)
+        if TRANSFER_SCHEDULER:
+            return harvest_scheduled(FTP_SERVERS, FTP_FOLDERS, BASE_FOLDERS, host=FTP_HOST, port=FTP_PORT, manifest=manifest,
+                                     content_store=content_store, on_download=on_download)
+        if CONCURRENT_MODE:
+            return harvest_concurrently(FTP_SERVERS, FTP_FOLDERS, BASE_FOLDERS, host=FTP_HOST, port=FTP_PORT, manifest=manifest,
+                                        content_store=content_store, on_download=on_download)
+        return harvest_sequentially(FTP_SERVERS, FTP_FOLDERS, BASE_FOLDERS, host=FTP_HOST, port=FTP_PORT, manifest=manifest,
+                                    content_store=content_store, on_download=on_download)
+
+# Classe que mantém um FTPDownloader conectado por conta e varre os diretórios periodicamente (modo contínuo)
+class FTPWatcher:
+    def __init__(self, ftp_servers, ftp_folders, base_folders, host=FTP_HOST, port=FTP_PORT, manifest=None,
+                 content_store=None, on_download=None, keepalive_interval=KEEPALIVE_INTERVAL):
+        self.ftp_servers = ftp_servers
+        # Diretórios urgentes são varridos primeiro em cada conta
+        self.ftp_folders = sorted((folder for folder in ftp_folders if isinstance(folder, str)), key=folder_priority)
+        self.base_folders = base_folders
+        self.host = host
+        self.port = port
+        self.manifest = manifest
+        self.content_store = content_store
+        self.on_download = on_download
+        self.keepalive_interval = keepalive_interval
+        self.downloaders = {}  # {usuário: FTPDownloader conectado}
+        self.failures = {}  # {usuário: falhas de conexão seguidas}
+        self.retry_at = {}  # {usuário: momento (monotonic) da próxima tentativa de conexão}
+        self.lock = threading.Lock()  # Protege os contadores da varredura, atualizados pelas threads das contas
+        self.scheduler = None  # Agendador único do modo contínuo (prioridade e limite de banda entre as contas)
+        if TRANSFER_SCHEDULER:
+            # Criado uma vez e mantido enquanto o modo contínuo roda: as threads, a fila e o limite de banda valem
+            # para todas as varreduras; cada conta transfere pelas sessões do pool do seu FTPDownloader
+            self.scheduler = TransferScheduler(SCHEDULER_WORKERS, SCHEDULER_PER_ACCOUNT, FOLDER_PRIORITIES,
+                                               DEFAULT_FOLDER_PRIORITY, TRANSFER_ORDER, FOLDER_DEADLINES,
+                                               DEFAULT_FOLDER_DEADLINE, BANDWIDTH_LIMIT, BANDWIDTH_LIMIT_HOURS).start()
+
+    def downloader(self, server):
+        # Método que retorna a sessão da conta, reconectando com espera crescente se ela tiver caído
+        username = server["username"]
+        downloader = self.downloaders.get(username)
+        if downloader is not None:
+            return downloader
+        if time.monotonic() < self.retry_at.get(username, 0):
+            return None  # Ainda aguardando a próxima tentativa de reconexão
+        downloader = FTPDownloader(username, server["password"], self.host, self.port, SCHEDULER_PER_ACCOUNT,
+                                   manifest=self.manifest, content_store=self.content_store, on_download=self.on_download,
+                                   scheduler=self.scheduler)
+        try:
+            downloader.connect()
+        except Exception:
+            downloader.disconnect()  # Fecha o que chegou a ser aberto
+            failures = self.failures[username] = self.failures.get(username, 0) + 1
+            delay = min(RECONNECT_BACKOFF_MAX, RECONNECT_BACKOFF_BASE * 2 ** (failures - 1))
+            self.retry_at[username] = time.monotonic() + delay + random.uniform(0, delay / 2)
+            logging.warning(f"Conta {username} indisponível ({failures} falha(s) seguida(s)). Nova tentativa em {delay:.0f} s.")
+            return None
+        self.failures.pop(username, None)
+        self.downloaders[username] = downloader
+        return downloader
+
+    def drop(self, username):
+        # Método que descarta a sessão de uma conta (reaberta na próxima varredura)
+        downloader = self.downloaders.pop(username, None)
+        if downloader is not None:
+            downloader.disconnect()
+
+    def poll_account(self, server, summary):
+        # Método que processa os diretórios de uma conta pela sessão já aberta
+        downloader = self.downloader(server)
+        if downloader is None:
+            return
+        for folder in self.ftp_folders:
+            try:
+                downloader.process_files(folder, self.base_folders[folder])
+            except Exception as e:
+                logging.error(f"Erro ao processar o diretório {folder} com usuário {server['username']}: {e}")
+                try:
+                    downloader.keepalive()  # Erro do diretório (ex.: permissão) com a sessão ainda viva: segue para o próximo
+                except Exception:
+                    self.drop(server["username"])  # Sessão caiu: reconecta na próxima varredura
+                    return
+                continue
+            with self.lock:
+                add_folder_stats(summary, self.base_folders[folder], downloader.folder_stats)
+
+    def poll(self):
+        # Método que faz uma varredura de todas as contas em paralelo (uma thread por conta) e retorna os contadores
+        summary = new_harvest_summary(self.base_folders)
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.ftp_servers)) as executor:
+                for future in [executor.submit(self.poll_account, server, summary) for server in self.ftp_servers]:
+                    future.result()
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.log_summary()  # O resumo da fila sai a cada varredura
+                self.scheduler.reset_summary()
+        return summary
+
+    def keepalive(self):
+        # Método que mantém viva a sessão principal de cada conta entre as varreduras
+        for username, downloader in list(self.downloaders.items()):
+            try:
+                downloader.keepalive()
+            except Exception as e:
+                logging.warning(f"Keep-alive falhou para o usuário {username}, a sessão será reaberta: {e}")
+                self.drop(username)
+
+    def wait(self, seconds, stop_event):
+        # Método que aguarda até a próxima varredura enviando keep-alives; retorna True se foi pedido para parar
+        deadline = time.monotonic() + seconds
+        while not stop_event.wait(max(0, min(self.keepalive_interval, deadline - time.monotonic()))):
+            if time.monotonic() >= deadline:
+                return False
+            self.keepalive()
+        return True
+
+    def close(self):
+        # Método que encerra o agendador e as sessões de todas as contas
+        if self.scheduler is not None:
+            self.scheduler.close()  # Aguarda as transferências ainda na fila
+            self.scheduler = None
+        for username in list(self.downloaders):
+            self.drop(username)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def log_harvest_summary(summary):
+    # Função que registra e imprime os totais da coleta
+    transferred_files_by_base_folder = summary["transferred"]  # Número de arquivos transferidos por diretório base
+    total_transferred_files = sum(transferred_files_by_base_folder.values())  # Total de arquivos transferidos
+    total_skipped_files = sum(summary["skipped"].values())  # Total de arquivos ignorados por já terem sido baixados
+    total_duplicate_files = sum(summary["duplicates"].values())  # Total de cópias descartadas por conteúdo repetido
+    total_deleted_files = sum(summary["deleted"].values())  # Total de arquivos apagados do servidor FTP
+
     # Log e imprime o total de arquivos transferidos por diretório
     for base_folder, total_transferred in transferred_files_by_base_folder.items():
         logging.info(f"Transferidos {total_transferred} PDF(s) para a pasta {base_folder}")  # Log do número de arquivos transferidos
@@ -217,6 +1198,19 @@ def main():
     # Log e imprime o total de arquivos PDF transferidos
     logging.info(f"Total de arquivos PDF transferidos: {total_transferred_files}")  # Log do total de arquivos transferidos
     print(f"Total de arquivos PDF transferidos: {total_transferred_files}")  # Imprime o total de arquivos transferidos
+    logging.info(f"Total de arquivos PDF ignorados (já baixados): {total_skipped_files}")
+    print(f"Total de arquivos PDF ignorados (já baixados): {total_skipped_files}")
+    logging.info(f"Total de arquivos PDF duplicados descartados: {total_duplicate_files}")
+    print(f"Total de arquivos PDF duplicados descartados: {total_duplicate_files}")
+    logging.info(f"Total de arquivos PDF deletados do servidor FTP: {total_deleted_files}")
+
+def main():
+    # Função principal que controla o fluxo do programa
+    setup_logging()  # Configura o logging
+    with metrics.timer("stage_seconds", stage="coleta FTP"):
+        summary = harvest()  # Coleta os PDFs
+    log_harvest_summary(summary)  # Registra os totais
+    metrics.export("ftp")  # Grava as métricas da execução (JSON e arquivo .prom)
 
 # Verifica se o script está sendo executado diretamente
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+import argparse
+import glob
+import logging
+import sqlite3
+from datetime import date, datetime
+from uc_cache import SQLITE_CHUNK_SIZE
+
+# Caminho do histórico de UCs recebidas (fica junto dos demais arquivos do processo)
+HISTORY_PATH = (r'\\historico_ucs.sqlite')
+DATE_FORMATS = ('%d/%m/%Y', '%d.%m.%Y', '%Y-%m-%d')  # Formatos aceitos: coluna DATA, nome da planilha e ISO
+
+def to_iso(date_text):
+    # Função que converte uma data do relatório (dd/mm/aaaa ou dd.mm.aaaa) para AAAA-MM-DD (ordenável no índice)
+    # Células de data das planilhas antigas chegam do openpyxl como datetime (e do pandas como Timestamp)
+    if isinstance(date_text, datetime):
+        return date_text.date().isoformat()
+    if isinstance(date_text, date):
+        return date_text.isoformat()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(date_text).strip(), date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ValueError(f"Data inválida: {date_text}")
+
+def from_iso(date_text):
+    # Função que converte AAAA-MM-DD para o formato da planilha (dd/mm/aaaa)
+    return datetime.strptime(date_text, '%Y-%m-%d').strftime('%d/%m/%Y')
+
+# Classe que guarda todas as UCs de todos os relatórios, com índice por UC e por data
+class ReceiptHistory:
+    def __init__(self, path=HISTORY_PATH):
+        # Abre (ou cria) o histórico
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # A chave (uc, report_date) é o índice das buscas por UC; gerar de novo o relatório do dia substitui as linhas
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS receipts (
+                uc TEXT NOT NULL,
+                report_date TEXT NOT NULL,
+                utd TEXT,
+                source TEXT,
+                sha256 TEXT,
+                recorded_at TEXT,
+                PRIMARY KEY (uc, report_date)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts (report_date);
+        """)
+        self.conn.commit()
+
+    def record(self, rows):
+        # Método que grava as linhas (uc, data do relatório, utd, diretório de origem, sha256) de um relatório
+        now = datetime.now().isoformat(timespec="seconds")
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO receipts (uc, report_date, utd, source, sha256, recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ((str(uc), to_iso(report_date), utd, source, sha256, now) for uc, report_date, utd, source, sha256 in rows)
+        )
+        self.conn.commit()
+
+    def last_seen(self, ucs, before):
+        # Método que retorna {UC: data (dd/mm/aaaa) do último relatório anterior a 'before'} das UCs já recebidas
+        ucs = list(dict.fromkeys(str(uc) for uc in ucs))
+        before = to_iso(before)
+        seen = {}
+        for start in range(0, len(ucs), SQLITE_CHUNK_SIZE):
+            chunk = ucs[start:start + SQLITE_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            seen.update(
+                (uc, from_iso(report_date))
+                for uc, report_date in self.conn.execute(
+                    f"SELECT uc, MAX(report_date) FROM receipts WHERE uc IN ({placeholders}) AND report_date < ? GROUP BY uc",
+                    chunk + [before]
+                )
+            )
+        return seen
+
+    def find(self, ucs=None, start=None, end=None):
+        # Método que retorna as linhas (uc, data, utd, origem, sha256) das UCs e/ou do intervalo de datas informados
+        conditions, parameters = [], []
+        if start:
+            conditions.append("report_date >= ?")
+            parameters.append(to_iso(start))
+        if end:
+            conditions.append("report_date <= ?")
+            parameters.append(to_iso(end))
+        query = "SELECT uc, report_date, utd, source, sha256 FROM receipts"
+        if not ucs:
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            rows = self.conn.execute(f"{query}{where} ORDER BY report_date, uc", parameters).fetchall()
+        else:
+            ucs = list(dict.fromkeys(str(uc) for uc in ucs))
+            rows = []
+            for offset in range(0, len(ucs), SQLITE_CHUNK_SIZE):
+                chunk = ucs[offset:offset + SQLITE_CHUNK_SIZE]
+                where = " AND ".join([f"uc IN ({', '.join('?' * len(chunk))})"] + conditions)
+                rows.extend(self.conn.execute(f"{query} WHERE {where}", chunk + parameters))
+            rows.sort(key=lambda row: (row[1], row[0]))
+        return [(uc, from_iso(report_date), utd, source, sha256) for uc, report_date, utd, source, sha256 in rows]
+
+    def import_workbook(self, path):
+        # Método que carrega no histórico uma planilha de relatório antiga (sem origem e hash, que não constam nela)
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            header = [str(column).strip().upper() if column is not None else "" for column in next(rows, ())]
+            uc_index, utd_index, date_index = header.index('UC'), header.index('UTD'), header.index('DATA')
+            entries = [(row[uc_index], row[date_index], row[utd_index], None, None)
+                       for row in rows if row[uc_index] is not None and row[date_index] is not None]
+        finally:
+            wb.close()
+        self.record(entries)
+        return len(entries)
+
+    def close(self):
+        # Método para fechar o histórico
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def main():
+    # Função que consulta o histórico pela linha de comando
+    parser = argparse.ArgumentParser(description="Consulta as UCs já recebidas em relatórios anteriores.")
+    parser.add_argument("ucs", nargs="*", help="UCs a procurar")
+    parser.add_argument("--de", dest="start", help="Data inicial (dd/mm/aaaa)")
+    parser.add_argument("--ate", dest="end", help="Data final (dd/mm/aaaa)")
+    parser.add_argument("--importar", metavar="PLANILHAS", nargs="+",
+                        help="Carrega planilhas de relatórios antigos no histórico (aceita curingas)")
+    parser.add_argument("--historico", default=HISTORY_PATH, help="Caminho do histórico")
+    args = parser.parse_args()
+
+    with ReceiptHistory(args.historico) as history:
+        if args.importar:
+            for pattern in args.importar:
+                for path in sorted(glob.glob(pattern)) or [pattern]:
+                    try:
+                        print(f"{path}: {history.import_workbook(path)} UC(s) importada(s)")
+                    except Exception as e:  # Planilha fora do formato do relatório: segue para a próxima
+                        logging.error(f"Erro ao importar a planilha {path}: {e}")
+                        print(f"{path}: erro ao importar ({e})")
+            return
+
+        if not args.ucs and not args.start and not args.end:
+            parser.error("informe ao menos uma UC ou um intervalo de datas (--de/--ate)")
+        rows = history.find(args.ucs, args.start, args.end)
+        print("UC;DATA;UTD;ORIGEM;SHA256")
+        for row in rows:
+            print(";".join("" if value is None else str(value) for value in row))
+        print(f"{len(rows)} registro(s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import bisect
+import json
+import logging
+import os
+import re
+import time
+from array import array
+import metrics
+from content_store import file_sha256  # SHA-256 em blocos, o mesmo do índice de conteúdo
+
+# Versão do formato do cache (um cache de outra versão é descartado e refeito)
+# JSON, não pickle: o cache fica no compartilhamento de rede e não pode executar código ao ser lido
+CACHE_VERSION = 2
+ENCODINGS = ('utf-8-sig', 'cp1252')  # O arquivo de localidades pode ter sido salvo pelo Bloco de Notas do Windows
+UNKNOWN_SAMPLE = 20  # Quantos códigos desconhecidos (os mais frequentes) aparecem no log
+
+# Linha do arquivo: código, separador (; , tab = : | - ou espaços) e nome da localidade ("0069;UTD CENTRO", "69 - UTD CENTRO")
+LINE_PATTERN = re.compile(r'^\s*(\d+)(?:\s*[;\t,=:|\-]\s*|\s+)(\S.*?)\s*$')
+
+# Classe que guarda as localidades em vetores ordenados pelo código inteiro (sem zeros à esquerda nem texto)
+class LocalityIndex:
+    def __init__(self, codes, name_ids, names):
+        # codes: códigos em ordem crescente; name_ids: posição do nome de cada código em names (nomes sem repetição)
+        self.codes = codes
+        self.name_ids = name_ids
+        self.names = names
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        # Método que monta o índice a partir de {código inteiro: nome}
+        names = list(dict.fromkeys(mapping.values()))  # Várias localidades da mesma UTD guardam o nome uma única vez
+        positions = {name: index for index, name in enumerate(names)}
+        codes = sorted(mapping)
+        return cls(array('q', codes), array('q', (positions[mapping[code]] for code in codes)), names)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def get(self, code):
+        # Método que retorna o nome de uma localidade (ou None se o código não existir)
+        try:
+            code = int(code)
+        except (TypeError, ValueError):
+            return None
+        position = bisect.bisect_left(self.codes, code)
+        if position < len(self.codes) and self.codes[position] == code:
+            return self.names[self.name_ids[position]]
+        return None
+
+    def lookup(self, codes):
+        # Método vetorizado: retorna uma Series categórica com o nome de cada código (NaN nos desconhecidos)
+        import numpy as np
+        import pandas as pd
+        codes = pd.Series(codes)
+        # Os códigos distintos são poucos (centenas): só eles são convertidos e buscados, depois o resultado é espalhado
+        row_positions, distinct = pd.factorize(codes)  # -1 nas linhas sem código
+        numeric = pd.to_numeric(pd.Series(distinct), errors='coerce').to_numpy(dtype='float64', na_value=np.nan)  # '0069' e 69 viram 69
+        valid = ~np.isnan(numeric)
+        valid[valid] = numeric[valid] == np.floor(numeric[valid])  # Códigos não inteiros não existem no arquivo
+        distinct_names = np.full(len(distinct) + 1, -1, dtype=np.int64)  # A última posição atende as linhas sem código (-1)
+        if len(self.codes) and valid.any():
+            sorted_codes = np.frombuffer(self.codes, dtype=np.int64)
+            wanted = numeric[valid].astype(np.int64)
+            found = np.minimum(np.searchsorted(sorted_codes, wanted), len(sorted_codes) - 1)
+            hit = sorted_codes[found] == wanted
+            name_ids = np.frombuffer(self.name_ids, dtype=np.int64)
+            distinct_names[np.flatnonzero(valid)[hit]] = name_ids[found[hit]]
+        name_positions = distinct_names[row_positions]
+        return pd.Series(pd.Categorical.from_codes(name_positions, categories=self.names), index=codes.index)
+
+def parse_localities(path):
+    # Função que lê o arquivo de localidades e retorna {código inteiro: nome}
+    for encoding in ENCODINGS:
+        try:
+            with open(path, 'r', encoding=encoding) as file:
+                lines = file.read().splitlines()
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        with open(path, 'r', encoding=ENCODINGS[0], errors='replace') as file:  # Nenhuma codificação serviu: lê o que der
+            lines = file.read().splitlines()
+    mapping = {}
+    skipped = 0  # Linhas fora do formato (cabeçalho, linhas em branco ou comentários)
+    repeated = 0  # Códigos que aparecem mais de uma vez (vale a última linha)
+    for line in lines:
+        match = LINE_PATTERN.match(line)
+        if not match:
+            skipped += bool(line.strip())
+            continue
+        code = int(match.group(1))  # '0069' e '69' são a mesma localidade
+        repeated += code in mapping
+        mapping[code] = match.group(2)
+    if skipped or repeated:
+        logging.warning(f"Arquivo de localidades {path}: {skipped} linha(s) ignorada(s), {repeated} código(s) repetido(s)")
+    return mapping
+
+def read_cache(cache_path):
+    # Função que lê o cache JSON (None se não existir, estiver corrompido, incompleto ou for de outra versão)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as file:
+            cached = json.load(file)
+        if not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION:
+            return None
+        codes = array('q', cached["codes"])  # Só aceita inteiros: qualquer outro conteúdo invalida o cache
+        name_ids = array('q', cached["name_ids"])
+        names = [str(name) for name in cached["names"]]
+        if len(codes) != len(name_ids) or any(not 0 <= name_id < len(names) for name_id in name_ids):
+            return None
+        return {"version": CACHE_VERSION, "sha256": str(cached["sha256"]), "mtime_ns": int(cached["mtime_ns"]),
+                "size": int(cached["size"]), "codes": codes, "name_ids": name_ids, "names": names}
+    except (OSError, ValueError, TypeError, KeyError, OverflowError):
+        return None
+
+def write_cache(cache_path, cached):
+    # Função que grava o cache JSON (arquivo temporário renomeado, para nunca deixar um cache pela metade)
+    temporary_path = f"{cache_path}.tmp"
+    content = dict(cached, codes=list(cached["codes"]), name_ids=list(cached["name_ids"]))
+    try:
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(content, file, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporary_path, cache_path)
+    except OSError as e:  # Sem permissão no diretório: segue com o índice em memória
+        logging.warning(f"Não foi possível gravar o cache de localidades {cache_path}: {e}")
+
+def load_localities(path, cache_path=None):
+    # Função que retorna o índice de localidades, lendo o arquivo texto só quando ele mudou
+    cache_path = cache_path or f"{path}.cache.json"
+    start = time.perf_counter()
+    stat = os.stat(path)
+    cached = read_cache(cache_path)
+    if cached is not None and (cached["mtime_ns"], cached["size"]) == (stat.st_mtime_ns, stat.st_size):
+        source = "cache"  # Arquivo inalterado: nem é lido
+    else:
+        sha256 = file_sha256(path)
+        if cached is not None and cached["sha256"] == sha256:
+            source = "cache (conteúdo igual)"  # Só a data mudou (ex.: arquivo copiado de novo)
+        else:
+            index = LocalityIndex.from_mapping(parse_localities(path))
+            cached = {"version": CACHE_VERSION, "sha256": sha256, "codes": index.codes,
+                      "name_ids": index.name_ids, "names": index.names}
+            source = "arquivo texto"
+        cached.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        write_cache(cache_path, cached)
+    index = LocalityIndex(cached["codes"], cached["name_ids"], cached["names"])
+    logging.info(f"Localidades carregadas ({source}): {len(index)} código(s), {len(index.names)} nome(s) "
+                 f"em {(time.perf_counter() - start) * 1000:.1f} ms")
+    return index
+
+def report_unknown_codes(codes):
+    # Função que registra, de forma agregada, os códigos de localidade que não estão no arquivo
+    import pandas as pd
+    counts = pd.Series(codes).astype(str).value_counts()
+    if counts.empty:
+        return
+    metrics.inc("report_unknown_localities_total", int(counts.sum()))
+    logging.warning(f"Códigos de localidade não encontrados: {len(counts)} código(s) em {int(counts.sum())} UC(s); "
+                    f"mais frequentes: {counts.head(UNKNOWN_SAMPLE).to_dict()}")
+    print(f"Códigos de localidade não encontrados: {len(counts)} código(s) em {int(counts.sum())} UC(s). Verifique o log.")
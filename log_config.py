@@ -0,0 +1,57 @@
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Configuração compartilhada do logging de todas as etapas
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'  # Formato das mensagens de log
+LOG_BACKUP_COUNT = 14  # Execuções anteriores mantidas (arquivo.log.1 é a mais recente)
+LOG_MAX_BYTES = 50 * 1024 * 1024  # Tamanho máximo de um arquivo; acima dele o log também é rodado no meio da execução
+PAYLOAD_SAMPLE = 20  # Quantos itens de uma lista grande (resultados, UCs incorretas) aparecem no log
+
+active_listener = None  # Listener da execução atual (grava no arquivo em uma thread própria)
+active_handler = None  # QueueHandler da execução atual, preso ao logger raiz
+
+def setup_logging(path, level=logging.INFO, fmt=LOG_FORMAT, backup_count=LOG_BACKUP_COUNT, max_bytes=LOG_MAX_BYTES):
+    # Função que envia os registros para uma fila e os grava no arquivo em segundo plano, com rotação por execução
+    global active_listener, active_handler
+    if active_listener is not None:
+        return active_listener  # Já configurado nesta execução (ex.: etapas do pipeline no mesmo processo)
+
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        handler.doRollover()  # Cada execução começa um arquivo novo; as anteriores viram .1, .2, ...
+    handler.setFormatter(logging.Formatter(fmt))
+
+    # Quem registra só coloca a mensagem na fila: a escrita no compartilhamento de rede não trava a coleta
+    log_queue = queue.SimpleQueue()
+    active_listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    active_listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    active_handler = QueueHandler(log_queue)
+    root.addHandler(active_handler)
+    atexit.register(stop_logging)  # Esvazia a fila antes de o processo terminar
+    return active_listener
+
+def stop_logging():
+    # Função que grava o que restou na fila e encerra a thread do logging
+    global active_listener, active_handler
+    if active_handler is not None:
+        # Sem o listener ninguém esvazia a fila: o logger raiz deixa de enviar para ela (e um novo setup_logging não duplica)
+        logging.getLogger().removeHandler(active_handler)
+        active_handler = None
+    if active_listener is not None:
+        active_listener.stop()
+        for handler in active_listener.handlers:
+            handler.close()
+        active_listener = None
+
+def summarize(items, sample=PAYLOAD_SAMPLE):
+    # Função que resume uma lista grande para o log: total e apenas os primeiros itens
+    items = list(items)
+    if len(items) <= sample:
+        return f"{len(items)} item(ns): {items}"
+    return f"{len(items)} item(ns), primeiros {sample}: {items[:sample]} (+{len(items) - sample} omitidos)"
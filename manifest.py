@@ -0,0 +1,111 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+# Caminho do manifesto de sincronização (fica junto dos diretórios base)
+MANIFEST_PATH = (r'\\ftp_manifest.sqlite')
+
+# Classe que registra os arquivos já baixados de cada conta FTP para não baixá-los de novo
+class SyncManifest:
+    def __init__(self, path=MANIFEST_PATH):
+        # Abre (ou cria) o manifesto; a conexão é compartilhada entre as threads da coleta
+        self.path = path
+        self.lock = threading.Lock()  # Serializa o acesso à conexão SQLite
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                account TEXT NOT NULL,
+                remote_path TEXT NOT NULL,
+                size INTEGER,
+                modify TEXT,
+                local_path TEXT,
+                downloaded_at TEXT,
+                sha256 TEXT,
+                PRIMARY KEY (account, remote_path)
+            )
+        """)
+        # Downloads interrompidos: cada parcial pertence a uma conta e a um arquivo remoto (só o dono retoma com REST)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS partials (
+                account TEXT NOT NULL,
+                remote_path TEXT NOT NULL,
+                partial_path TEXT NOT NULL,
+                size INTEGER,
+                modify TEXT,
+                started_at TEXT,
+                PRIMARY KEY (account, remote_path)
+            )
+        """)
+        # Manifestos criados antes da coluna de hash recebem a coluna nova
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        if "sha256" not in columns:
+            self.conn.execute("ALTER TABLE files ADD COLUMN sha256 TEXT")
+        # Busca dos arquivos remotos gravados em um mesmo caminho local (conflito de nomes entre contas/diretórios)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_files_local_path ON files (local_path)")
+        self.conn.commit()
+        logging.info(f"Manifesto de sincronização aberto: {path}")
+
+    def is_current(self, account, remote_path, size, modify):
+        # Método que verifica se o arquivo remoto já foi baixado com o mesmo tamanho e data de modificação
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, modify FROM files WHERE account = ? AND remote_path = ?",
+                (account, remote_path)
+            ).fetchone()
+        if row is None:
+            return False  # Arquivo nunca baixado
+        # Sem tamanho/data no servidor, só é possível detectar arquivos novos (não alterações)
+        return row[0] == size and row[1] == modify
+
+    def record(self, account, remote_path, size, modify, local_path, sha256=None):
+        # Método que registra um download concluído (gravado na hora, para sobreviver a uma interrupção da execução)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (account, remote_path, size, modify, local_path, downloaded_at, sha256) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (account, remote_path, size, modify, local_path, datetime.now().isoformat(timespec="seconds"), sha256)
+            )
+            self.conn.commit()
+
+    def owners(self, local_path):
+        # Método que retorna {(conta, caminho remoto)} dos downloads registrados com o caminho local informado
+        with self.lock:
+            return set(self.conn.execute(
+                "SELECT account, remote_path FROM files WHERE local_path = ?", (local_path,)
+            ).fetchall())
+
+    def partial(self, account, remote_path):
+        # Método que retorna (caminho do parcial, tamanho, data de modificação) do download interrompido do arquivo, ou None
+        with self.lock:
+            return self.conn.execute(
+                "SELECT partial_path, size, modify FROM partials WHERE account = ? AND remote_path = ?",
+                (account, remote_path)
+            ).fetchone()
+
+    def record_partial(self, account, remote_path, partial_path, size, modify):
+        # Método que registra o arquivo parcial criado para um download (para retomá-lo numa próxima execução)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO partials (account, remote_path, partial_path, size, modify, started_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (account, remote_path, partial_path, size, modify, datetime.now().isoformat(timespec="seconds"))
+            )
+            self.conn.commit()
+
+    def forget_partial(self, account, remote_path):
+        # Método que remove o registro do parcial (download concluído ou descartado)
+        with self.lock:
+            self.conn.execute("DELETE FROM partials WHERE account = ? AND remote_path = ?", (account, remote_path))
+            self.conn.commit()
+
+    def close(self):
+        # Método para fechar o manifesto
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Diretório das métricas: um JSON por execução e um arquivo .prom por ponto de entrada (coletor textfile do node-exporter)
+METRICS_DIRECTORY = (r'\\metricas')
+METRIC_PREFIX = "ftp_pipeline_"  # Prefixo de todas as métricas exportadas
+# Limites (s) dos histogramas de latência: de uma listagem rápida a um arquivo grande em um link lento
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Descrição de cada métrica (linha HELP do arquivo .prom)
+METRIC_HELP = {
+    "ftp_files_transferred_total": "PDFs baixados e validados",
+    "ftp_bytes_transferred_total": "Bytes recebidos nos downloads",
+    "ftp_files_skipped_total": "PDFs ignorados por já terem sido baixados (manifesto)",
+    "ftp_files_duplicate_total": "PDFs descartados por conteúdo repetido",
+    "ftp_files_deferred_total": "PDFs mantidos no servidor porque outro arquivo já ocupa o mesmo nome local",
+    "ftp_files_failed_total": "PDFs que falharam após todas as tentativas",
+    "ftp_files_deleted_total": "PDFs apagados do servidor FTP",
+    "ftp_listing_seconds": "Tempo de listagem de um diretório FTP",
+    "ftp_queue_depth": "PDFs aguardando na fila do agendador de transferências",
+    "ftp_queue_wait_seconds": "Espera de um PDF na fila do agendador até o início da transferência",
+    "ftp_transfer_seconds": "Tempo de transferência de um PDF (RETR)",
+    "oracle_ucs_found_total": "UCs encontradas na consulta",
+    "oracle_ucs_missing_total": "UCs não encontradas na consulta",
+    "oracle_ucs_failed_total": "UCs não consultadas por erro no banco de dados (bloco com erro)",
+    "oracle_query_chunk_seconds": "Tempo de consulta de um bloco de UCs",
+    "uc_cache_hits_total": "UCs encontradas no cache local",
+    "uc_cache_misses_total": "UCs consultadas no banco por não estarem no cache",
+    "uc_extraction_total": "UCs extraídas dos PDFs, por método (texto, texto e nome, nome do arquivo)",
+    "report_rows_total": "Linhas do relatório",
+    "report_unknown_localities_total": "UCs do relatório com código de localidade fora do arquivo de localidades",
+    "report_format_seconds": "Tempo de montagem do DataFrame do relatório",
+    "report_write_seconds": "Tempo de gravação do relatório",
+    "report_history_seconds": "Tempo da marcação de reenvios e da gravação do histórico de UCs",
+    "mail_messages_total": "E-mails entregues, por backend (com, smtp, eml)",
+    "mail_delivery_seconds": "Tempo da sessão de entrega de todos os e-mails do relatório",
+    "stage_seconds": "Tempo de parede de cada etapa",
+    "last_run_timestamp_seconds": "Horário (epoch) do fim da última execução",
+}
+
+# Classe que acumula as observações de uma métrica de latência em faixas cumulativas
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # Observações em cada faixa (não cumulativas)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        # Método que registra uma observação na primeira faixa que a comporta
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self):
+        # Método que retorna [(limite, observações até o limite)] no formato do Prometheus
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+# Classe que guarda os contadores, medidores e histogramas de uma execução (compartilhada entre as threads)
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.counters = {}  # {(nome, rótulos): valor}
+        self.gauges = {}  # {(nome, rótulos): valor}
+        self.histograms = {}  # {(nome, rótulos): Histogram}
+
+    def inc(self, name, value=1, **labels):
+        # Método que soma um valor a um contador
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        # Método que define o valor de um medidor
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        # Método que registra uma latência (s) no histograma
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        # Método que mede o tempo do bloco e o registra no histograma
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        # Método que retorna as métricas como dicionário (formato do JSON da execução)
+        with self.lock:
+            return {
+                "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                           for (name, labels), value in sorted(self.gauges.items())],
+                "histograms": [{"name": name, "labels": dict(labels), "count": histogram.count,
+                                "sum": round(histogram.sum, 6), "buckets": dict(histogram.cumulative())}
+                               for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0])],
+            }
+
+    def textfile(self):
+        # Método que formata as métricas no formato texto do Prometheus
+        lines = []
+        with self.lock:
+            families = {}
+            for (name, labels), value in self.counters.items():
+                families.setdefault((name, "counter"), []).append((labels, value))
+            for (name, labels), value in self.gauges.items():
+                families.setdefault((name, "gauge"), []).append((labels, value))
+            for (name, labels), histogram in self.histograms.items():
+                families.setdefault((name, "histogram"), []).append((labels, histogram))
+
+            for (name, kind), samples in sorted(families.items()):
+                metric = METRIC_PREFIX + name
+                lines.append(f"# HELP {metric} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {metric} {kind}")
+                for labels, value in sorted(samples, key=lambda sample: sample[0]):
+                    if kind != "histogram":
+                        lines.append(f"{metric}{format_labels(labels)} {value}")
+                        continue
+                    for bound, count in value.cumulative():
+                        lines.append(f"{metric}_bucket{format_labels(labels + (('le', str(bound)),))} {count}")
+                    lines.append(f"{metric}_bucket{format_labels(labels + (('le', '+Inf'),))} {value.count}")
+                    lines.append(f"{metric}_sum{format_labels(labels)} {value.sum:.6f}")
+                    lines.append(f"{metric}_count{format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, job, directory=METRICS_DIRECTORY):
+        # Método que grava o JSON da execução e substitui o arquivo .prom do ponto de entrada
+        # Uma falha ao gravar (compartilhamento fora do ar, sem permissão, disco cheio) não interrompe o ponto de entrada
+        self.set("last_run_timestamp_seconds", round(time.time(), 3), job=job)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            json_path = os.path.join(directory, f"{job}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+            write_atomically(json_path, json.dumps(dict(self.snapshot(), job=job), ensure_ascii=False, indent=2))
+            # O node-exporter lê o diretório a qualquer momento: o arquivo só aparece completo (renomeação atômica)
+            write_atomically(os.path.join(directory, f"{job}.prom"), self.textfile())
+        except OSError as e:
+            logging.error(f"Erro ao gravar as métricas em {directory}: {e}")
+            return None
+        return json_path
+
+def escape_label_value(value):
+    # Função que escapa barra invertida, aspas e quebra de linha no valor de um rótulo
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    # Função que formata os rótulos de uma amostra ({chave="valor",...})
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels) + "}"
+
+def write_atomically(path, content):
+    # Função que grava o arquivo em um temporário e o renomeia para o nome final
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(temporary_path, path)
+
+# Registro da execução atual, usado por todas as etapas
+REGISTRY = MetricsRegistry()
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+export = REGISTRY.export
@@ -1,67 +1,92 @@
 import os 
-import re  
+import time
 import logging  
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime  
-import pandas as pd  
-import openpyxl  
-import oracledb  
-from openpyxl import Workbook 
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side  
 import configparser
-
-# Configuração do logging: define onde os logs serão salvos, o nível de severidade e o formato das mensagens
-logging.basicConfig(
-    filename=(r'\\planilha_log.log'), 
-    level=logging.INFO, # Define o nível de log como INFO
-    format='%(asctime)s - %(levelname)s - %(message)s', # Define o formato das mensagens de log
-    filemode='w'  # Modo de escrita do arquivo de log (substitui o arquivo a cada execução)
-    )
-
-# Estilo de preenchimento para o cabeçalho da planilha Excel
-header_fill = PatternFill(start_color='C6E0B4', end_color='C6E0B4', fill_type='solid')  
-# Estilo de borda para as células da planilha Excel
-border_style = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))  
-
-def collect_pdfs(directories):
-    # Função para coletar arquivos PDF de uma lista de diretórios
-    pdf_files = []  # Lista que armazenará os nomes dos arquivos PDF encontrados
-    pdf_sources = []  # Lista que armazenará os diretórios de origem dos arquivos PDF encontrados
-    
-    for directory in directories:  # Itera sobre cada diretório fornecido
-        # Verifica se o diretório existe
-        if not os.path.isdir(directory):
-            logging.error(f"Diretório não encontrado: {directory}")  # Registra um erro se o diretório não existe
-            continue  # Passa para o próximo diretório
-        
-        files_in_directory = os.listdir(directory)  # Lista todos os arquivos no diretório
-        
-        # Verifica se o diretório está vazio
-        if not files_in_directory:
-            logging.warning(f"O diretório {directory} está vazio.")  # Registra um aviso se o diretório estiver vazio
-            continue  # Passa para o próximo diretório
-
-        for file in files_in_directory:  # Itera sobre cada arquivo encontrado no diretório
-            # Verifica se o arquivo termina com a extensão PDF
-            if file.endswith('.pdf'):
-                cleaned_uc = re.sub(r'\D', '', file)  # Remove todos os caracteres não numéricos do nome do arquivo
-                pdf_files.append(cleaned_uc)  # Adiciona o nome do arquivo (apenas números) à lista de arquivos PDF
-                pdf_sources.append(directory)  # Adiciona o diretório à lista de fontes de arquivos PDF
-                logging.info(f"Arquivo PDF encontrado: {file} no diretório {directory}")  # Registra a informação do arquivo encontrado
-            else:
-                logging.warning(f"Arquivo ignorado (não é PDF): {file}")  # Registra um aviso se o arquivo não for um PDF
-
-    return pdf_files, pdf_sources  # Retorna as listas de arquivos PDF e suas fontes
+import argparse
+from uc_cache import UCLookupCache, UC_CACHE_PATH
+from pdf_scanner import scan_pdfs, extract_uc, RECURSIVE_SCAN, SCAN_INDEX_PATH, CONTENT_EXTRACTION
+from history import ReceiptHistory, HISTORY_PATH
+from content_store import ContentStore, CONTENT_STORE_PATH
+from localities import load_localities, report_unknown_codes
+import metrics
+import log_config
+
+# Diretórios verificados em busca de arquivos PDF
+SOURCE_DIRECTORIES = [
+    (r'//source//directory//1'),
+    (r'//source//directory//2'),
+    (r'//source//directory//3'),
+    (r'//source//directory//4'),
+    (r'//source//directory//5')
+]
+LOCALITIES_PATH = (r'\\Localidades.txt')  # Caminho do arquivo que contém as localidades
+DB_CONFIG_PATH = (r'\\login_sql.ini')  # Credenciais e endereço do banco de dados (seção [database])
+
+# Consulta em fluxo (pipeline): UCs recebidas enquanto os downloads continuam são consultadas em lotes
+STREAM_BATCH_WAIT = 2.0  # Espera máxima (s) por mais UCs antes de consultar um lote incompleto
+POOL_RETRY_INTERVAL = 300  # Espera (s) antes de tentar de novo abrir o pool se o banco estiver indisponível
+
+# Número de UCs por consulta: a lista IN do Oracle aceita no máximo 1000 expressões (ORA-01795)
+UC_CHUNK_SIZE = 1000
+
+# Pool de conexões com o banco: os blocos de UCs são consultados em paralelo
+DB_POOL_MIN = 1  # Conexões abertas ao criar o pool
+DB_POOL_MAX = 4  # Máximo de conexões simultâneas (e de blocos consultados em paralelo)
+STATEMENT_CACHE_SIZE = 20  # Cursores mantidos no cache de instruções de cada conexão
+FETCH_ARRAYSIZE = 1000  # Linhas buscadas por ida ao banco no fetch
+FETCH_PREFETCHROWS = 1000  # Linhas já trazidas junto com a execução da consulta
+CONNECT_RETRIES = 3  # Tentativas de conexão
+CONNECT_BACKOFF_BASE = 1.0  # Espera (s) antes da segunda tentativa; dobra a cada nova tentativa
+CONNECT_BACKOFF_MAX = 30.0  # Espera máxima (s) entre tentativas
+
+# Diretório dos PDFs da ENERGEC: as UCs vindas dele recebem o prefixo 'ENERGEC' na UTD
+ENERGEC_DIRECTORY = (r'S:\SRC\01_Gestao_da_Receita\01-Recuperacao_Energia\03-Usuarios\ALEX GUIDONI\--- ANÁLISE TOIS FTP\===ENERGEC')
+LOCALITY_NOT_FOUND = "Localidade não encontrada"  # UTD usada quando o código de localidade não está no arquivo
+
+# pandas, openpyxl e oracledb são importados dentro das funções que os usam: um dia sem PDFs novos termina
+# sem carregá-los (a importação dos três leva mais de um segundo)
+HEADER_FILL_COLOR = 'C6E0B4'  # Cor de preenchimento do cabeçalho da planilha Excel
+
+# Relatório: diretório de destino, formatos gerados e larguras das colunas da planilha
+REPORT_DIRECTORY = (r'//destiny//directory')
+REPORT_FORMATS = ('xlsx',)  # Formatos opcionais: 'csv' e 'parquet' (este exige o pyarrow)
+COLUMN_WIDTHS = {'UC': 11, 'UTD': 31, 'DATA': 11, 'REENVIO': 11}
+RESUBMISSION_COLUMN = 'REENVIO'  # Data do último relatório em que a UC já apareceu (vazio na primeira vez); None não adiciona a coluna
+
+def setup_logging():
+    # Função para configurar o logging: define onde os logs serão salvos, o nível de severidade e o formato das mensagens
+    # (gravação em segundo plano; cada execução começa um arquivo novo e as anteriores são mantidas)
+    log_config.setup_logging(r'\\planilha_log.log', level=logging.INFO)  # Define o nível de log como INFO
+
+def collect_pdfs(directories, recursive=None, index_path=None):
+    # Função para coletar arquivos PDF de uma lista de diretórios (varredura paralela com índice das listagens)
+    # Sem argumentos, usa a configuração do módulo no momento da chamada
+    recursive = RECURSIVE_SCAN if recursive is None else recursive
+    return scan_pdfs(directories, recursive=recursive, index_path=index_path or SCAN_INDEX_PATH)  # Retorna as listas de arquivos PDF e suas fontes
+
+def collapse_duplicate_ucs(pdf_files, pdf_sources):
+    # Função para remover UCs repetidas (o mesmo processo recebido em mais de um diretório) antes da consulta
+    sources_by_uc = dict(zip(pdf_files, pdf_sources))  # Mantém a ordem da primeira ocorrência e a fonte da última, como no relatório
+    duplicates = len(pdf_files) - len(sources_by_uc)  # Quantidade de UCs repetidas descartadas
+    if duplicates:
+        logging.info(f"UCs duplicadas descartadas antes da consulta: {duplicates}")  # Registra a quantidade de duplicadas
+        print(f"UCs duplicadas descartadas antes da consulta: {duplicates}")  # Informa ao usuário
+    return list(sources_by_uc), list(sources_by_uc.values())  # Retorna as listas sem repetições
 
 def get_current_date(date_format="%d.%m.%Y"):
     # Função para obter a data atual formatada
     return datetime.now().strftime(date_format)  # Retorna a data atual no formato especificado
 
-def connect_to_database(config, retries=3):
-    # Função para conectar ao banco de dados Oracle
-    dsn = oracledb.makedsn(config['address'], config['port'], service_name=config['service_name'])  # Cria o DSN para a conexão com o banco de dados
+def connect_with_backoff(connect, retries=CONNECT_RETRIES):
+    # Função que executa uma tentativa de conexão com espera exponencial entre as tentativas
+    import oracledb
     for attempt in range(retries):  # Tenta conectar ao banco de dados até o número de tentativas especificado
         try:
-            return oracledb.connect(user=config['user'], password=config['password'], dsn=dsn)  # Tenta estabelecer a conexão com as credenciais fornecidas
+            return connect()  # Tenta estabelecer a conexão
         except oracledb.DatabaseError as e:  # Captura erros de banco de dados
             error_code = e.args[0].code  # Obtém o código do erro
             logging.error(f"Erro ao conectar ao banco de dados: {e}. Tentativa {attempt + 1} de {retries}.")  # Registra um erro de conexão, incluindo a tentativa atual
@@ -70,176 +95,524 @@ def connect_to_database(config, retries=3):
                     logging.warning("Usuário ou senha inválidos. O acesso ao SQL será bloqueado após 3 tentativas.")  # Registra aviso
                     print("Usuário ou senha inválidos. O acesso ao SQL será bloqueado após 3 tentativas.")  # Informa ao usuário
                 raise  # Levanta a exceção para ser tratada na chamada da função
+            time.sleep(min(CONNECT_BACKOFF_MAX, CONNECT_BACKOFF_BASE * 2 ** attempt))  # Espera antes da próxima tentativa
+
+def connect_to_database(config, retries=CONNECT_RETRIES):
+    # Função para conectar ao banco de dados Oracle
+    import oracledb
+    dsn = oracledb.makedsn(config['address'], config['port'], service_name=config['service_name'])  # Cria o DSN para a conexão com o banco de dados
+    return connect_with_backoff(
+        lambda: oracledb.connect(user=config['user'], password=config['password'], dsn=dsn),  # Conexão com as credenciais fornecidas
+        retries
+    )
 
-def execute_query(cursor, ucs, pdf_files):
-    # Função para executar uma consulta SQL no banco de dados
-    sql = f"""
+def create_database_pool(config, retries=CONNECT_RETRIES, min_connections=DB_POOL_MIN, max_connections=DB_POOL_MAX):
+    # Função para criar um pool de conexões com o banco de dados Oracle, com cache de instruções
+    import oracledb
+    dsn = oracledb.makedsn(config['address'], config['port'], service_name=config['service_name'])  # Cria o DSN para a conexão com o banco de dados
+    pool = connect_with_backoff(
+        lambda: oracledb.create_pool(
+            user=config['user'], password=config['password'], dsn=dsn,
+            min=min_connections, max=max_connections, increment=1,
+            stmtcachesize=STATEMENT_CACHE_SIZE
+        ),
+        retries
+    )
+    logging.info(f"Pool de conexões criado (mín. {min_connections}, máx. {max_connections} conexões)")
+    return pool
+
+def build_uc_query(chunk_size=UC_CHUNK_SIZE):
+    # Função que monta a consulta com um número fixo de variáveis de ligação (:1, :2, ...)
+    # O texto do SQL é sempre o mesmo, então o Oracle faz o parse uma única vez e reaproveita o cursor
+    binds = ", ".join(f":{position}" for position in range(1, chunk_size + 1))
+    return f"""
         SELECT DISTINCT
             a.cod_un_cons_uee,  
             a.cod_loc_uee  
         FROM 
             rededes.cad_uc_ee a  
         WHERE
-            a.cod_un_cons_uee IN {ucs}  
+            a.cod_un_cons_uee IN ({binds})  
     """
-    try:
-        cursor.execute(sql)  # Executa a consulta SQL
-        results = cursor.fetchall()  # Obtém todos os resultados da consulta
-        logging.info(f"Resultados da consulta SQL: {results}")  # Registra os resultados obtidos
-
-        found_ucs = {str(row[0]) for row in results}  # Cria um conjunto com os códigos encontrados na consulta
 
-        # Verifica se todos os arquivos PDF estão presentes nos resultados
-        incorrect_ucs = []  # Lista para armazenar UCs incorretas
-        for pdf in pdf_files:
-            if pdf not in found_ucs:  # Se um PDF não foi encontrado nos resultados
-                incorrect_ucs.append(pdf)  # Adiciona à lista de UCs incorretas
-                logging.warning(f"UC não encontrada na consulta: {pdf}")  # Registra um aviso
+def chunk_ucs(ucs, chunk_size=UC_CHUNK_SIZE):
+    # Função que divide as UCs em blocos de tamanho fixo; o último bloco é completado com NULL (que não encontra nenhuma linha)
+    for start in range(0, len(ucs), chunk_size):
+        chunk = list(ucs[start:start + chunk_size])
+        yield chunk + [None] * (chunk_size - len(chunk))
+
+def tune_cursor(cursor, arraysize=FETCH_ARRAYSIZE, prefetchrows=FETCH_PREFETCHROWS):
+    # Função que ajusta quantas linhas o cursor traz por ida ao banco
+    cursor.arraysize = arraysize
+    if hasattr(cursor, "prefetchrows"):  # Cursores que não são do oracledb (ex.: substituto local) não têm prefetch
+        cursor.prefetchrows = prefetchrows
+
+def fetch_chunk(cursor, sql, chunk, index):
+    # Função que consulta um bloco de UCs e registra quanto tempo ele levou
+    start = time.perf_counter()
+    cursor.execute(sql, chunk)  # Executa a consulta SQL com as UCs do bloco
+    rows = cursor.fetchall()  # Obtém os resultados do bloco
+    elapsed = time.perf_counter() - start
+    metrics.observe("oracle_query_chunk_seconds", elapsed)  # Histograma do tempo por bloco
+    uc_count = sum(uc is not None for uc in chunk)  # Desconsidera o preenchimento com NULL
+    logging.info(f"Bloco {index}: {uc_count} UCs, {len(rows)} linhas em {elapsed:.3f} s")
+    return rows
+
+def report_incorrect_ucs(results, pdf_files):
+    # Função que registra as UCs dos PDFs que não foram encontradas na consulta
+    found_ucs = {str(row[0]) for row in results}  # Cria um conjunto com os códigos encontrados na consulta
+
+    # Verifica se todos os arquivos PDF estão presentes nos resultados
+    incorrect_ucs = []  # Lista para armazenar UCs incorretas
+    for pdf in pdf_files:
+        if pdf not in found_ucs:  # Se um PDF não foi encontrado nos resultados
+            incorrect_ucs.append(pdf)  # Adiciona à lista de UCs incorretas
+    if incorrect_ucs:
+        # Um único aviso com uma amostra, em vez de uma linha por UC
+        logging.warning(f"UCs não encontradas na consulta: {log_config.summarize(incorrect_ucs)}")  # Registra um aviso
+
+    metrics.inc("oracle_ucs_found_total", len(pdf_files) - len(incorrect_ucs))
+    metrics.inc("oracle_ucs_missing_total", len(incorrect_ucs))
+
+    # Se houver UCs incorretas, imprime mensagem no terminal
+    if incorrect_ucs:
+        print(f"Algumas UCs estão incorretas: {log_config.summarize(incorrect_ucs)}. Verifique o logging para mais informações.")  # Mensagem no terminal
+    return incorrect_ucs
+
+def execute_query(cursor, ucs, pdf_files, chunk_size=UC_CHUNK_SIZE, arraysize=FETCH_ARRAYSIZE, prefetchrows=FETCH_PREFETCHROWS):
+    # Função para executar a consulta SQL no banco de dados, em blocos de UCs passadas como variáveis de ligação
+    import oracledb
+    sql = build_uc_query(chunk_size)  # Mesmo texto de SQL para todos os blocos
+    ucs = list(dict.fromkeys(ucs))  # Remove UCs repetidas mantendo a ordem
+    try:
+        tune_cursor(cursor, arraysize, prefetchrows)
+        results = []
+        for index, chunk in enumerate(chunk_ucs(ucs, chunk_size), start=1):
+            results.extend(fetch_chunk(cursor, sql, chunk, index))  # Acumula os resultados do bloco
+        logging.info(f"Resultados da consulta SQL: {log_config.summarize(results)}")  # Registra uma amostra dos resultados obtidos
 
-        # Se houver UCs incorretas, imprime mensagem no terminal
-        if incorrect_ucs:
-            print(f"Algumas UCs estão incorretas: {incorrect_ucs}. Verifique o logging para mais informações.")  # Mensagem no terminal
+        report_incorrect_ucs(results, pdf_files)  # Verifica se todos os arquivos PDF estão presentes nos resultados
 
         return results if isinstance(results, list) else []  # Retorna os resultados se forem uma lista, caso contrário retorna uma lista vazia
     except oracledb.DatabaseError as e:  # Captura erros de execução da consulta
         logging.error(f"Erro ao executar a consulta SQL: {e}")  # Registra o erro
         return []  # Retorna uma lista vazia em caso de erro
-        
-def format_dataframe(results, current_date, localities, pdf_files, pdf_sources):
-    # Função para formatar os resultados da consulta em um DataFrame do pandas
-    results_df = pd.DataFrame(results, columns=['cod_un_cons_uee', 'cod_loc_uee'])  # Cria um DataFrame com os resultados
-    results_df['Data'] = current_date  # Adiciona a data atual ao DataFrame
-    results_df['cod_loc_uee'] = results_df['cod_loc_uee'].astype(str).str.lstrip('0')  # Remove zeros à esquerda dos códigos de localidade
-
-    # Mapeia os códigos de localidade para seus nomes correspondentes
-    results_df['Localidade'] = results_df['cod_loc_uee'].map(localities).fillna("Localidade não encontrada")  # Preenche com aviso se não encontrado
-
-    # Mapeia os códigos de unidades consumidoras para suas fontes de PDF
-    results_df['PDF'] = results_df['cod_un_cons_uee'].astype(str).map(dict(zip(pdf_files, pdf_sources)))  # Cria coluna de PDF
-
-    # Verifica se a fonte do PDF corresponde ao diretório ENERGEC
-    energenc_directory = (r'S:\SRC\01_Gestao_da_Receita\01-Recuperacao_Energia\03-Usuarios\ALEX GUIDONI\--- ANÁLISE TOIS FTP\===ENERGEC')
-    results_df['Localidade'] = results_df.apply(
-        lambda row: f"ENERGEC - {row['Localidade']}" if row['PDF'] == energenc_directory else row['Localidade'],  # Adiciona prefixo 'ENERGEC' se a fonte do PDF for do diretório ENERGEC
-        axis=1  # Aplica a função ao longo das linhas
-    )
-
-    # Renomeia as colunas do DataFrame para nomes mais amigáveis
-    results_df.rename(columns={
-        'cod_un_cons_uee': 'UC',  # Renomeia 'cod_un_cons_uee' para 'UC'
-        'Localidade': 'UTD',  # Renomeia 'Localidade' para 'UTD'
-        'Data': 'DATA'  # Renomeia 'Data' para 'DATA'
-    }, inplace=True)
 
-    # Reorganiza as colunas do DataFrame na ordem desejada
-    results_df = results_df[['UC', 'UTD', 'DATA']]
-    # Formata a coluna 'DATA' para o formato 'dd/mm/yyyy'
-    results_df['DATA'] = pd.to_datetime(results_df['DATA'], format='%d.%m.%Y').dt.strftime('%d/%m/%Y')
+def query_chunk_from_pool(pool, sql, chunk, index, arraysize=FETCH_ARRAYSIZE, prefetchrows=FETCH_PREFETCHROWS):
+    # Função que consulta um bloco de UCs em uma conexão emprestada do pool
+    with pool.acquire() as conn:  # A conexão volta ao pool ao sair do bloco
+        cursor = conn.cursor()
+        try:
+            tune_cursor(cursor, arraysize, prefetchrows)
+            return fetch_chunk(cursor, sql, chunk, index)
+        finally:
+            cursor.close()
+
+def execute_query_parallel(pool, ucs, pdf_files, chunk_size=UC_CHUNK_SIZE, workers=DB_POOL_MAX,
+                           arraysize=FETCH_ARRAYSIZE, prefetchrows=FETCH_PREFETCHROWS):
+    # Função que consulta os blocos de UCs em paralelo, cada um em uma conexão do pool
+    # Retorna (resultados, UCs dos blocos que falharam): um bloco com erro não descarta os resultados dos outros
+    import oracledb
+    sql = build_uc_query(chunk_size)  # Mesmo texto de SQL para todos os blocos (reaproveitado pelo cache de instruções)
+    ucs = list(dict.fromkeys(ucs))  # Remove UCs repetidas mantendo a ordem
+    start = time.perf_counter()
+    results = []
+    failed = []  # UCs dos blocos com erro (conexão perdida, erro ORA): não foram consultadas, não são UCs incorretas
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        chunks = list(enumerate(chunk_ucs(ucs, chunk_size), start=1))
+        futures = [
+            executor.submit(query_chunk_from_pool, pool, sql, chunk, index, arraysize, prefetchrows)
+            for index, chunk in chunks
+        ]
+        for (index, chunk), future in zip(chunks, futures):  # Mantém a ordem dos blocos
+            try:
+                results.extend(future.result())
+            except oracledb.Error as e:  # Captura erros de execução da consulta do bloco
+                logging.error(f"Erro ao executar a consulta SQL do bloco {index}: {e}")  # Registra o erro
+                failed.extend(uc for uc in chunk if uc is not None)  # Desconsidera o preenchimento com NULL
+    logging.info(f"{len(chunks)} bloco(s) consultados em {time.perf_counter() - start:.3f} s com até {workers} conexões")
+    logging.info(f"Resultados da consulta SQL: {log_config.summarize(results)}")  # Registra uma amostra dos resultados obtidos
+    if failed:
+        metrics.inc("oracle_ucs_failed_total", len(failed))
+        logging.error(f"{len(failed)} UC(s) não consultadas por erro no banco de dados: {log_config.summarize(failed)}")
+
+    # Só as UCs efetivamente consultadas podem ser UCs incorretas
+    failed_ucs = set(failed)
+    report_incorrect_ucs(results, [uc for uc in pdf_files if uc not in failed_ucs])
+    return results, failed
+
+def read_db_config(path=None):
+    # Função que lê as configurações do banco de dados do arquivo .ini (DB_CONFIG_PATH se nenhum for informado)
+    config = configparser.ConfigParser()  # Cria um objeto de configuração
+    config.read(path or DB_CONFIG_PATH)  # Lê o arquivo de configuração
+    if not config.has_section('database'):  # Verifica se a seção 'database' existe
+        raise ValueError("A seção 'database' não foi encontrada no arquivo de configuração.")  # Levanta um erro se não existir
+
+    # Verifica se todas as chaves necessárias estão presentes na seção 'database'
+    required_keys = ['user', 'password', 'address', 'port', 'service_name']
+    for key in required_keys:
+        if key not in config['database']:
+            raise ValueError(f"A chave '{key}' não foi encontrada na seção 'database'.")  # Levanta um erro se faltar alguma chave
+
+    # Retorna um dicionário com as configurações do banco de dados
+    return {key: config['database'][key] for key in required_keys}
+
+def lookup_ucs(db_config, ucs, cache, pool=None):
+    # Função que busca as UCs no cache local e consulta no Oracle somente as que não estiverem nele
+    # (sem pool informado, um pool é aberto só para esta consulta)
+    # Retorna (resultados, UCs não consultadas): uma UC não consultada (banco indisponível ou bloco com erro) é diferente
+    # de uma UC consultada sem resultado, que é registrada como UC incorreta por execute_query_parallel
+    import oracledb
+    results, missing = cache.lookup(ucs)
+    if not missing:
+        return results, []
+    try:
+        own_pool = create_database_pool(db_config) if pool is None else None  # Cria o pool de conexões com o banco de dados
+    except oracledb.DatabaseError as e:  # Banco indisponível: nenhuma UC fora do cache é consultada
+        logging.error(f"Erro ao conectar ao banco de dados: {e}")
+        rows, unavailable = [], missing
+    else:
+        try:
+            # Só as UCs ausentes do cache vão ao banco (e só elas podem ser UCs incorretas)
+            rows, unavailable = execute_query_parallel(pool or own_pool, missing, missing)
+        finally:
+            if own_pool is not None:
+                own_pool.close()  # Fecha todas as conexões do pool
+    if unavailable:
+        print(f"Banco de dados indisponível: {len(unavailable)} UC(s) fora do cache ficarão de fora do relatório.")
+    cache.store(rows)  # Guarda as UCs consultadas para as próximas execuções
+    results.extend(rows)
+    return results, unavailable
+
+def warm_uc_cache(db_config, cache, ucs):
+    # Função que carrega no cache, de uma vez, as UCs informadas (ex.: lista exportada de processos anteriores)
+    results, unavailable = lookup_ucs(db_config, ucs, cache)
+    cache.log_stats()  # Registra acertos e faltas do cache
+    logging.info(f"Cache de UCs aquecido: {len(results)} UCs disponíveis, {len(unavailable)} não consultadas")
+    print(f"Cache de UCs aquecido: {len(results)} UCs disponíveis")
+
+# Classe que consulta as UCs em lotes à medida que chegam pela fila, enquanto os downloads continuam
+class StreamingLookup:
+    def __init__(self, db_config, batch_size=UC_CHUNK_SIZE, batch_wait=STREAM_BATCH_WAIT, cache_path=None):
+        # Inicializa a fila e as listas acumuladas (resultados da consulta e UCs/fontes dos PDFs)
+        self.db_config = db_config
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.cache_path = cache_path or UC_CACHE_PATH
+        self.queue = queue.Queue()  # Recebe (UC, diretório de origem); None encerra a consulta
+        self.results = []
+        self.pdf_files = []
+        self.pdf_sources = []
+        self.seen = set()  # UCs já consultadas nesta execução
+        self.deferred = []  # UCs fora do cache recebidas com o banco indisponível (consultadas quando ele voltar)
+        self.batches = 0  # Lotes consultados
+        self.busy_time = 0.0  # Tempo (s) gasto consultando (cache + banco)
+        self.thread = threading.Thread(target=self.run, name="consulta-ucs", daemon=True)
+
+    def start(self):
+        # Método que inicia a thread de consulta (o pool do banco é aberto enquanto os downloads começam)
+        self.thread.start()
+        return self
+
+    def submit(self, uc, source):
+        # Método chamado pelos produtores (downloads e varredura) a cada PDF encontrado
+        self.queue.put((uc, source))
+
+    def finish(self):
+        # Método que sinaliza o fim das UCs, aguarda os últimos lotes e retorna (resultados, pdf_files, pdf_sources)
+        self.queue.put(None)
+        self.thread.join()
+        return self.results, self.pdf_files, self.pdf_sources
+
+    def next_batch(self):
+        # Método que junta até batch_size UCs, esperando no máximo batch_wait segundos depois da primeira
+        batch = []
+        item = self.queue.get()
+        deadline = time.monotonic() + self.batch_wait
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                break
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+        return batch, item is None
+
+    def open_pool(self):
+        # Método que abre o pool do banco na chegada do primeiro lote (dia sem PDFs novos não conecta ao banco)
+        import oracledb
+        try:
+            return create_database_pool(self.db_config)
+        except oracledb.DatabaseError as e:  # Banco indisponível: o relatório sai com as UCs do cache
+            logging.error(f"Erro ao conectar ao banco de dados: {e}")
+            print("Banco de dados indisponível: só as UCs do cache entrarão no relatório.")
+            return None
+
+    def lookup_batch(self, cache, pool, ucs):
+        # Método que consulta as UCs do lote junto com as adiadas e retorna o pool para o próximo lote
+        # Sem pool, só o cache responde; o que não pôde ser consultado fica adiado para o próximo lote
+        ucs, self.deferred = list(dict.fromkeys(self.deferred + ucs)), []
+        if pool is not None:
+            found, unavailable = lookup_ucs(self.db_config, ucs, cache, pool)
+        else:
+            found, unavailable = cache.lookup(ucs)
+        self.results.extend(found)
+        self.deferred.extend(unavailable)
+        unavailable = set(unavailable)
+        self.seen.update(uc for uc in ucs if uc not in unavailable)  # Só as UCs efetivamente consultadas
+        if unavailable and pool is not None:
+            # Erro no banco com o pool aberto (conexão perdida, erro ORA): o pool é descartado e reaberto no próximo lote
+            logging.warning(f"{len(unavailable)} UC(s) adiadas por erro no banco de dados; o pool será reaberto")
+            pool.close()
+            pool = None
+        return pool
+
+    def run(self):
+        # Método executado na thread de consulta: o cache SQLite e o pool pertencem a esta thread
+        pool = None
+        retry_at = 0.0  # Momento (monotonic) da próxima tentativa de abrir o pool se o banco estiver indisponível
+        try:
+            with UCLookupCache(self.cache_path) as cache:
+                done = False
+                while not done:
+                    batch, done = self.next_batch()
+                    if not batch:
+                        continue
+                    start = time.perf_counter()
+                    self.pdf_files.extend(uc for uc, _ in batch)
+                    self.pdf_sources.extend(source for _, source in batch)
+                    # A mesma UC pode chegar pelo download e pela varredura: só a primeira ocorrência é consultada
+                    new_ucs = [uc for uc in dict.fromkeys(uc for uc, _ in batch) if uc not in self.seen]
+                    if pool is None and time.monotonic() >= retry_at:
+                        pool = self.open_pool()
+                        retry_at = time.monotonic() + POOL_RETRY_INTERVAL  # No modo contínuo o banco pode voltar ao longo do dia
+                    if pool is not None:
+                        pool = self.lookup_batch(cache, pool, new_ucs)
+                        if pool is None:
+                            retry_at = 0.0  # Pool descartado por erro no banco: o próximo lote o reabre
+                    else:
+                        self.lookup_batch(cache, None, new_ucs)
+                    self.batches += 1
+                    self.busy_time += time.perf_counter() - start
+                    logging.info(f"Lote {self.batches}: {len(batch)} UCs consultadas em {time.perf_counter() - start:.3f} s")
+                if self.deferred:
+                    if pool is None:
+                        pool = self.open_pool()  # Última tentativa antes do relatório
+                    if pool is not None:
+                        pool = self.lookup_batch(cache, pool, [])
+                if self.deferred:
+                    logging.error(f"UCs não consultadas (banco de dados indisponível), fora do relatório: "
+                                  f"{log_config.summarize(self.deferred)}")
+                cache.log_stats()  # Registra acertos e faltas do cache
+        except Exception as e:  # A thread não pode morrer em silêncio: o erro fica no log
+            logging.error(f"Erro na consulta das UCs em fluxo: {e}")
+        finally:
+            if pool is not None:
+                pool.close()  # Fecha todas as conexões do pool
+
+def read_uc_file(path):
+    # Função que lê um arquivo de texto com uma UC por linha
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip()]
 
-    return results_df  # Retorna o DataFrame formatado
+def format_dataframe(results, current_date, localities, pdf_files, pdf_sources):
+    # Função para formatar os resultados da consulta em um DataFrame do pandas (operações vetorizadas, sem apply por linha)
+    import pandas as pd
+    start = time.perf_counter()
+    results_df = pd.DataFrame(results, columns=['cod_un_cons_uee', 'cod_loc_uee'])  # Cria um DataFrame com os resultados
 
-def save_to_excel(results_df, current_date):
-    # Função para salvar o DataFrame em um arquivo Excel
+    # Busca vetorizada pelo código inteiro da localidade ('0069' e 69 são a mesma), sem conversão para texto
+    utd = localities.lookup(results_df['cod_loc_uee'])
+    unknown = utd.isna()
+    if unknown.any():
+        report_unknown_codes(results_df['cod_loc_uee'][unknown])  # Um resumo por código, não uma linha por UC
+    utd = utd.astype(object).fillna(LOCALITY_NOT_FOUND)  # Preenche com aviso se não encontrado
+
+    # Mapeia as UCs para as fontes dos PDFs (Series categórica: cada diretório é guardado uma única vez)
+    sources = pd.Series(pdf_sources, index=pdf_files, dtype='category')
+    sources = sources[~sources.index.duplicated(keep='last')]  # Mesma regra do dict(zip(...)): vale a última fonte
+    pdf_source = results_df['cod_un_cons_uee'].astype(str).map(sources)
+
+    # Adiciona o prefixo 'ENERGEC' às UCs cujo PDF veio do diretório ENERGEC
+    utd = utd.mask(pdf_source.eq(ENERGEC_DIRECTORY), "ENERGEC - " + utd)
+
+    # Converte a data uma única vez para o formato 'dd/mm/yyyy'
+    report_date = datetime.strptime(current_date, '%d.%m.%Y').strftime('%d/%m/%Y')
+
+    # Monta o DataFrame final já com os nomes e a ordem das colunas desejados
+    report_df = pd.DataFrame({
+        'UC': results_df['cod_un_cons_uee'],
+        'UTD': utd.astype('category'),
+        'DATA': pd.Series(report_date, index=results_df.index, dtype='category')
+    })
+    metrics.observe("report_format_seconds", time.perf_counter() - start)
+    metrics.inc("report_rows_total", len(report_df))
+    return report_df
+
+def report_styles():
+    # Função que cria os estilos nomeados da planilha (compartilhados por todas as células, em vez de um objeto por célula)
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+    header_fill = PatternFill(start_color=HEADER_FILL_COLOR, end_color=HEADER_FILL_COLOR, fill_type='solid')  # Preenchimento do cabeçalho
+    thin = Side(style='thin')
+    border_style = Border(left=thin, right=thin, top=thin, bottom=thin)  # Borda de todas as células
+    alignment = Alignment(horizontal='left', vertical='center')  # Texto à esquerda e centralizado verticalmente
+    header_style = NamedStyle(name='report_header', font=Font(bold=True, color='000000'), fill=header_fill,
+                              border=border_style, alignment=alignment)
+    body_style = NamedStyle(name='report_body', border=border_style, alignment=alignment)
+    return header_style, body_style
+
+def write_xlsx(results_df, spreadsheet_name):
+    # Função que grava a planilha em uma única passada no modo somente escrita do openpyxl (memória constante)
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Processos_Retirados')
+    header_style, body_style = report_styles()
+    wb.add_named_style(header_style)
+    wb.add_named_style(body_style)
+
+    # Ajusta as larguras das colunas (no modo somente escrita, antes da primeira linha)
+    for index, column in enumerate(results_df.columns, start=1):
+        ws.column_dimensions[get_column_letter(index)].width = COLUMN_WIDTHS.get(column, 11)
+
+    # Cabeçalho em negrito com preenchimento
+    header = []
+    for column in results_df.columns:
+        cell = WriteOnlyCell(ws, value=column)
+        cell.style = header_style.name
+        header.append(cell)
+    ws.append(header)
+
+    # Cada linha é gravada no arquivo assim que é adicionada: as células de uma coluna são reaproveitadas
+    body = [WriteOnlyCell(ws) for _ in results_df.columns]
+    for cell in body:
+        cell.style = body_style.name
+    for row in results_df.itertuples(index=False, name=None):
+        for cell, value in zip(body, row):
+            cell.value = value
+        ws.append(body)
+
+    wb.save(spreadsheet_name)  # Fecha o fluxo e grava o arquivo
+
+def save_to_excel(results_df, current_date, formats=REPORT_FORMATS, save_directory=REPORT_DIRECTORY):
+    # Função para salvar o DataFrame na planilha Excel (e, se pedido, também em CSV/Parquet)
     if results_df.empty:  # Verifica se o DataFrame está vazio
         logging.warning("O DataFrame gerado está vazio. Nenhum dado a ser salvo.")  # Registra um aviso
         return  # Sai da função se não houver dados
 
-    # Define o diretório onde o arquivo Excel será salvo
-    save_directory = (r'//destiny//directory')
-    # Cria o nome do arquivo Excel com a data atual
-    spreadsheet_name = os.path.join(save_directory, f"Processos retirados do FTP em {current_date}.xlsx")
-    
-    # Salva o DataFrame em um arquivo Excel
-    results_df.to_excel(spreadsheet_name, index=False, sheet_name='Processos_Retirados')  # Salva sem índice
-    logging.info(f"Planilha salva com sucesso: {spreadsheet_name}")  # Registra a informação de que a planilha foi salva
-
-    wb = openpyxl.load_workbook(spreadsheet_name)  # Carrega o arquivo Excel salvo
-    ws = wb.active  # Seleciona a planilha ativa
-    
-    # Ajusta as larguras das colunas para melhor visualização
-    ws.column_dimensions['A'].width = 11  # Largura da coluna UC
-    ws.column_dimensions['B'].width = 31  # Largura da coluna UTD
-    ws.column_dimensions['C'].width = 11  # Largura da coluna DATA
-
-    # Formata as células da planilha
-    for row in range(1, ws.max_row + 1):  # Itera sobre todas as linhas
-        for column in range(1, ws.max_column + 1):  # Itera sobre todas as colunas
-            cell = ws.cell(row=row, column=column)  # Seleciona a célula atual
-            cell.alignment = Alignment(horizontal='left', vertical='center')  # Alinha o texto à esquerda e centraliza verticalmente
-            cell.border = border_style  # Aplica o estilo de borda à célula
-            if row == 1:  # Se for a primeira linha (cabeçalho)
-                cell.font = Font(bold=True, color='000000')  # Aplica negrito e cor ao texto do cabeçalho
-                cell.fill = header_fill  # Aplica o preenchimento do cabeçalho
-
-    wb.save(spreadsheet_name)  # Salva as alterações feitas na planilha
-    wb.close()  # Fecha o arquivo Excel
-    print(f"Planilha criada: {spreadsheet_name}")  # Informa ao usuário que a planilha foi criada
+    # Cria o nome dos arquivos com a data atual
+    base_name = os.path.join(save_directory, f"Processos retirados do FTP em {current_date}")
+
+    for file_format in formats:
+        file_name = f"{base_name}.{file_format}"
+        start = time.perf_counter()
+        try:
+            if file_format == 'xlsx':
+                write_xlsx(results_df, file_name)  # Salva a planilha formatada
+            elif file_format == 'csv':
+                # Separador ';' e BOM para o Excel em português abrir o arquivo direto
+                results_df.to_csv(file_name, index=False, sep=';', encoding='utf-8-sig')
+            elif file_format == 'parquet':
+                results_df.to_parquet(file_name, index=False)
+            else:
+                logging.warning(f"Formato de relatório desconhecido: {file_format}")
+                continue
+        except ImportError as e:  # Parquet sem o pyarrow instalado
+            logging.error(f"Não foi possível salvar o relatório em {file_format}: {e}")
+            continue
+        metrics.observe("report_write_seconds", time.perf_counter() - start, format=file_format)
+        logging.info(f"Planilha salva com sucesso: {file_name}")  # Registra a informação de que a planilha foi salva
+        print(f"Planilha criada: {file_name}")  # Informa ao usuário que a planilha foi criada
+
+def file_hashes_by_uc(pdf_sources):
+    # Função que busca no índice de conteúdo o SHA-256 do PDF de cada UC baixada nos diretórios de origem
+    with ContentStore(CONTENT_STORE_PATH) as content_store:
+        hashes = content_store.hashes_in(pdf_sources)
+    if CONTENT_EXTRACTION:
+        # A UC lida do texto do PDF está no cache da extração, pelo mesmo hash
+        from uc_extractor import ExtractionCache, EXTRACTION_CACHE_PATH
+        cache = ExtractionCache(EXTRACTION_CACHE_PATH)
+        try:
+            extracted = cache.get(hashes.values())
+        finally:
+            cache.close()
+        return {extracted[sha256][0]: sha256 for sha256 in hashes.values() if sha256 in extracted}
+    return {extract_uc(os.path.basename(path.replace('\\', '/'))): sha256 for path, sha256 in hashes.items()}
+
+def flag_resubmissions(results_df, history, current_date):
+    # Função que marca no relatório as UCs que já apareceram em relatórios de dias anteriores
+    previous = history.last_seen(results_df['UC'], before=current_date)
+    if previous:
+        logging.warning(f"UCs já recebidas em relatórios anteriores: {log_config.summarize(sorted(previous))}")
+        print(f"UCs já recebidas em relatórios anteriores: {len(previous)}. Veja a coluna {RESUBMISSION_COLUMN} da planilha.")
+    if RESUBMISSION_COLUMN:
+        results_df[RESUBMISSION_COLUMN] = results_df['UC'].astype(str).map(previous).fillna('')
+    return results_df
+
+def record_history(results_df, history, pdf_files, pdf_sources, current_date):
+    # Função que grava as UCs do relatório no histórico (UC, UTD, data, diretório de origem e hash do arquivo)
+    sources = dict(zip(pdf_files, pdf_sources))
+    hashes = file_hashes_by_uc(set(pdf_sources))
+    history.record(
+        (uc, current_date, utd, sources.get(str(uc)), hashes.get(str(uc)))
+        for uc, utd in zip(results_df['UC'], results_df['UTD'])
+    )
+    logging.info(f"Histórico de UCs atualizado: {len(results_df)} UC(s) em {current_date}")
+
+def build_report(results, pdf_files, pdf_sources, current_date):
+    # Função que monta e salva o relatório a partir dos resultados da consulta
+    localities = load_localities(LOCALITIES_PATH)  # Carrega as localidades do arquivo
+    results_df = format_dataframe(results, current_date, localities, pdf_files, pdf_sources)  # Formata os resultados em um DataFrame
+    # O histórico não pode impedir o relatório: se ele falhar, a planilha sai sem a marcação de reenvios
+    history = None
+    try:
+        history = ReceiptHistory(HISTORY_PATH)
+        with metrics.timer("report_history_seconds", step="reenvios"):
+            results_df = flag_resubmissions(results_df, history, current_date)  # Marca as UCs já recebidas antes
+    except Exception as e:
+        logging.error(f"Erro ao consultar o histórico de UCs: {e}")
+    save_to_excel(results_df, current_date, REPORT_FORMATS, REPORT_DIRECTORY)  # Salva os resultados em um arquivo Excel
+    if history is not None:
+        try:
+            with metrics.timer("report_history_seconds", step="gravação"):
+                record_history(results_df, history, pdf_files, pdf_sources, current_date)
+        except Exception as e:
+            logging.error(f"Erro ao gravar o histórico de UCs: {e}")
+        finally:
+            history.close()
+    return results_df
 
 def main():
     # Função principal que controla o fluxo do programa
-    directories = [  # Lista de diretórios a serem verificados em busca de arquivos PDF
-        (r'//source//directory//1'),
-        (r'//source//directory//2'),
-        (r'//source//directory//3'),
-        (r'//source//directory//4'),
-        (r'//source//directory//5')
-    ]
-
-    # Caminho do arquivo que contém as localidades
-    localities_file_path = (r'\\Localidades.txt')
-    localities = load_localities(localities_file_path)  # Carrega as localidades do arquivo
-
-    pdf_files, pdf_sources = collect_pdfs(directories)  # Coleta os arquivos PDF e suas fontes
+    pdf_files, pdf_sources = collect_pdfs(SOURCE_DIRECTORIES)  # Coleta os arquivos PDF e suas fontes
+    pdf_files, pdf_sources = collapse_duplicate_ucs(pdf_files, pdf_sources)  # Remove UCs repetidas
 
     if not pdf_files:  # Verifica se nenhum arquivo PDF foi encontrado
         logging.warning("Nenhum arquivo PDF encontrado.")  # Registra um aviso
         print("Nenhum arquivo PDF encontrado.")  # Informa ao usuário
         return  # Sai da função principal
 
-    # Formata os códigos das unidades consumidoras para a consulta
-    ucs = "','".join(pdf_files)  # Junta os códigos em uma string formatada
-    ucs = f"('{ucs}')"  # Adiciona parênteses para a consulta SQL
-
     current_date = get_current_date()  # Obtém a data atual
-
-    config = configparser.ConfigParser()  # Cria um objeto de configuração
+    import oracledb  # Só carregado quando há PDFs para consultar
 
     try:
-        config.read(r'\\login_sql.ini')  # Lê o arquivo de configuração
-        if not config.has_section('database'):  # Verifica se a seção 'database' existe
-            raise ValueError("A seção 'database' não foi encontrada no arquivo de configuração.")  # Levanta um erro se não existir
-
-        # Verifica se todas as chaves necessárias estão presentes na seção 'database'
-        required_keys = ['user', 'password', 'address', 'port', 'service_name']
-        for key in required_keys:
-            if key not in config['database']:
-                raise ValueError(f"A chave '{key}' não foi encontrada na seção 'database'.")  # Levanta um erro se faltar alguma chave
-
-        # Cria um dicionário com as configurações do banco de dados
-        db_config = {
-            'user': config['database']['user'],
-            'password': config['database']['password'],
-            'address': config['database']['address'],
-            'port': config['database']['port'],
-            'service_name': config['database']['service_name']
-        }
-
+        db_config = read_db_config()  # Lê as configurações do banco de dados
     except Exception as e:  # Captura erros ao ler o arquivo de configuração
         logging.error(f"Erro ao ler o arquivo de configuração: {e}")  # Registra o erro
         print("Erro ao ler o arquivo de configuração. Verifique os logs para mais detalhes.")  # Informa ao usuário
         return  # Sai da função principal
-    
+
     try:
-        # Tenta conectar ao banco de dados e executar a consulta
-        with connect_to_database(db_config) as conn:  # Conecta ao banco de dados
-            with conn.cursor() as cursor:  # Cria um cursor para executar consultas
-                results = execute_query(cursor, ucs, pdf_files)  # Executa a consulta e obtém os resultados
-                logging.info(f"Número de resultados retornados: {len(results)}")  # Registra o número de resultados
-                print(f"Número de resultados retornados: {len(results)}")  # Informa ao usuário
+        # Busca as UCs no cache local e consulta no banco de dados só as que faltarem
+        with UCLookupCache(UC_CACHE_PATH) as cache:
+            results, unavailable = lookup_ucs(db_config, pdf_files, cache)
+            cache.log_stats()  # Registra acertos e faltas do cache
+        logging.info(f"Número de resultados retornados: {len(results)} ({len(unavailable)} UC(s) não consultadas)")  # Registra o número de resultados
+        print(f"Número de resultados retornados: {len(results)}")  # Informa ao usuário
 
-        # Formata os resultados em um DataFrame
-        results_df = format_dataframe(results, current_date, localities, pdf_files, pdf_sources)
-        save_to_excel(results_df, current_date)  # Salva os resultados em um arquivo Excel
+        build_report(results, pdf_files, pdf_sources, current_date)  # Formata e salva o relatório
 
     except oracledb.DatabaseError as e:  # Captura erros de banco de dados
         logging.error(f"Erro ao conectar ou executar a consulta no banco de dados: {e}")  # Registra o erro
@@ -250,4 +623,15 @@ def main():
 
 # Verifica se o script está sendo executado diretamente
 if __name__ == "__main__":
-    main()  # Chama a função principal
+    parser = argparse.ArgumentParser(description="Gera a planilha de UCs a partir dos PDFs recebidos.")
+    parser.add_argument("--warm-cache", metavar="ARQUIVO",
+                        help="Carrega no cache local as UCs do arquivo (uma por linha) e sai")
+    args = parser.parse_args()
+    setup_logging()  # Configura o logging
+    if args.warm_cache:
+        with UCLookupCache(UC_CACHE_PATH) as cache:
+            warm_uc_cache(read_db_config(), cache, read_uc_file(args.warm_cache))
+    else:
+        with metrics.timer("stage_seconds", stage="planilha"):
+            main()  # Chama a função principal
+    metrics.export("oracle")  # Grava as métricas da execução (JSON e arquivo .prom)
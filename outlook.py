@@ -1,24 +1,40 @@
-import win32com.client
-from datetime import datetime, timedelta 
-import os  
-import pandas as pd  
-import logging  
-import re  
-
-# Configuração do logging
-logging.basicConfig(
-    filename=(r'\\email_log.log'), 
-    level=logging.INFO,  # Define o nível de log como INFO
-    format='%(asctime)s - %(levelname)s - %(message)s',  # Formato das mensagens de log
-    filemode='w'  # Modo de escrita do arquivo de log (substitui o arquivo a cada execução)
-)
+from datetime import datetime, timedelta
+import os
+import json
+import logging
+import re
+import smtplib
+import tempfile
+import time
+import configparser
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+import log_config
+import metrics
 
 # Definição de caminhos como constantes
 CAMINHO_DESTINATARIOS = r'\\Emails.xlsx'  # Caminho para o arquivo de destinatários
 CAMINHO_PLANILHA_BASE = r"\\Base"  # Caminho base para a planilha a ser anexada
+CAMINHO_CACHE_DESTINATARIOS = r'\\Emails.cache.json'  # Destinatários já validados (refeito quando o Emails.xlsx muda)
 
-# Mensagem para o usuário antes de abrir o email
-input("Clique em qualquer tecla para prosseguir com o email (Lembre-se de olhar os prints e logs antes de prosseguir)")
+# Entrega dos e-mails: 'com' (Outlook da máquina), 'smtp' (uma conexão para todos os e-mails) ou 'eml' (arquivos .eml em disco)
+MAIL_BACKEND = 'com'
+CAMINHO_CONFIG_SMTP = r'\\login_smtp.ini'  # Servidor, porta, remetente e credenciais do SMTP (seção [smtp])
+DIRETORIO_EML = r'\\emails'  # Onde o backend 'eml' grava as mensagens (para conferência ou testes locais)
+SMTP_TIMEOUT = 60  # Tempo máximo (s) de espera por uma resposta do servidor SMTP
+
+# True: cada grupo de destinatários com UTD (coluna C do Emails.xlsx) recebe só as linhas da sua UTD;
+# os destinatários sem UTD continuam recebendo o relatório completo
+SPLIT_BY_UTD = False
+
+def setup_logging():
+    # Função para configurar o logging
+    # (gravação em segundo plano; cada execução começa um arquivo novo e as anteriores são mantidas)
+    log_config.setup_logging(r'\\email_log.log', level=logging.INFO)  # Define o nível de log como INFO
+
+def confirm_email():
+    # Função que aguarda o usuário antes de abrir o email
+    input("Clique em qualquer tecla para prosseguir com o email (Lembre-se de olhar os prints e logs antes de prosseguir)")
 
 def get_greeting():
     # Função para obter uma saudação com base na hora atual
@@ -30,52 +46,205 @@ def get_greeting():
     else:  # Para qualquer outra hora
         return "Boa noite"  # Retorna "Boa noite"
 
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$')  # Expressão regular para validação de e-mail
+
 def validate_email(email):
     # Função para validar o formato de um endereço de e-mail
-    regex = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'  # Expressão regular para validação de e-mail
-    return re.match(regex, email) is not None  # Retorna True se o e-mail for válido, caso contrário, False
+    return EMAIL_PATTERN.match(email) is not None  # Retorna True se o e-mail for válido, caso contrário, False
 
 def read_recipients(recipients_path):
-    # Função para ler os destinatários de um arquivo Excel
+    # Função para ler os destinatários de um arquivo Excel: retorna [(principal, cópia, UTD)] de cada linha
     logging.info("Iniciando a leitura do arquivo de destinatários.")  # Log de início da leitura
     try:
-        with pd.ExcelFile(recipients_path) as xls:  # Tenta abrir o arquivo Excel
-            df = pd.read_excel(xls)  # Lê o conteúdo do arquivo em um DataFrame
-            logging.info("Arquivo de destinatários lido com sucesso.")  # Log de sucesso na leitura
+        # A planilha é pequena: lida direto com o openpyxl (importado só aqui), sem carregar o pandas
+        from openpyxl import load_workbook
+        wb = load_workbook(recipients_path, read_only=True, data_only=True)  # Tenta abrir o arquivo Excel
+        try:
+            # Lê as três primeiras colunas (principal, cópia e UTD opcional), sem a linha de cabeçalho
+            rows = [tuple(row) + (None,) * (3 - len(row))
+                    for row in wb.worksheets[0].iter_rows(min_row=2, max_col=3, values_only=True)]
+        finally:
+            wb.close()
+        logging.info("Arquivo de destinatários lido com sucesso.")  # Log de sucesso na leitura
     except Exception as e:  # Captura qualquer exceção que ocorra
         logging.error(f"Erro ao ler o arquivo de destinatários: {e}")  # Log do erro
         print("Erro ao ler o arquivo de destinatários. Verifique os logs para mais detalhes.")  # Mensagem de erro para o usuário
-        return [], []  # Retorna listas vazias em caso de erro
+        return []  # Retorna lista vazia em caso de erro
+    return rows
 
-    # Extrai os destinatários principais e em cópia (CC) do DataFrame
-    main_recipients = list(set(df.iloc[:, 0].dropna().tolist()))  # Destinatários principais (sem duplicatas)
-    cc_recipients = df.iloc[:, 1].dropna().tolist()  # Destinatários em cópia (CC)
+def build_recipient_groups(rows):
+    # Função que valida os endereços uma única vez e agrupa os destinatários por UTD ('' = relatório completo)
+    groups = {}
+    invalid = []
+    for main, cc, utd in rows:
+        group = groups.setdefault(str(utd).strip() if utd is not None else "", {"to": [], "cc": []})
+        for key, address in (("to", main), ("cc", cc)):
+            if address is None:
+                continue
+            address = str(address).strip()
+            if not validate_email(address):
+                invalid.append(address)
+            elif address not in group[key]:
+                group[key].append(address)  # Sem duplicatas, na ordem da planilha
+    if invalid:
+        logging.warning(f"Endereços de e-mail inválidos ignorados: {log_config.summarize(invalid)}")  # Log de aviso para e-mails inválidos
+    return {utd: group for utd, group in groups.items() if group["to"] or group["cc"]}
 
-    return main_recipients, cc_recipients  # Retorna as listas de destinatários
+def load_recipients(recipients_path=CAMINHO_DESTINATARIOS, cache_path=CAMINHO_CACHE_DESTINATARIOS):
+    # Função que retorna os grupos de destinatários já validados, relendo o Excel só quando ele muda
+    try:
+        stat = os.stat(recipients_path)
+    except OSError as e:
+        logging.error(f"Arquivo de destinatários não encontrado: {e}")
+        return {}
+    signature = [stat.st_mtime_ns, stat.st_size]
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as file:
+            cached = json.load(file)
+        if cached.get("signature") == signature:
+            logging.info("Destinatários carregados do cache.")
+            return cached["groups"]
+    except (OSError, ValueError, AttributeError):
+        pass  # Sem cache (ou cache inválido): lê a planilha
 
-def create_outlook_email():
-    # Função para criar e preparar um e-mail no Outlook
-    current_date = datetime.now().strftime("%d.%m.%Y")  # Obtém a data atual formatada
-    previous_day = (datetime.now() - timedelta(days=1)).strftime("%d.%m.%Y")  # Obtém a data do dia anterior
-    greeting = get_greeting()  # Obtém a saudação apropriada
+    rows = read_recipients(recipients_path)
+    groups = build_recipient_groups(rows)
+    if rows:
+        try:
+            with open(cache_path, 'w', encoding='utf-8') as file:
+                json.dump({"signature": signature, "groups": groups}, file, ensure_ascii=False)
+        except OSError as e:
+            logging.warning(f"Não foi possível gravar o cache de destinatários {cache_path}: {e}")
+    return groups
 
-    main_recipients, cc_recipients = read_recipients(CAMINHO_DESTINATARIOS)  # Lê os destinatários do arquivo Excel
+def read_smtp_config(path=CAMINHO_CONFIG_SMTP):
+    # Função que lê as configurações do SMTP (host e remetente obrigatórios; porta, usuário, senha e tls opcionais)
+    config = configparser.ConfigParser()
+    if not config.read(path, encoding='utf-8'):
+        raise FileNotFoundError(f"Arquivo de configuração SMTP não encontrado: {path}")
+    smtp = config['smtp']
+    return {
+        "host": smtp['host'],
+        "port": smtp.getint('port', 587),
+        "sender": smtp['sender'],
+        "user": smtp.get('user'),
+        "password": smtp.get('password'),
+        "tls": smtp.getboolean('tls', True),
+    }
 
-    if not main_recipients:  # Verifica se não há destinatários principais
-        logging.warning("Nenhum destinatário principal encontrado.")  # Log de aviso
-        print("Nenhum destinatário principal encontrado.")  # Mensagem para o usuário
-        return  # Sai da função se não houver destinatários
+def build_mime_message(message, sender):
+    # Função que monta a mensagem MIME (SMTP e .eml) a partir do e-mail montado pelo processo
+    mime = EmailMessage()
+    mime['Subject'] = message["subject"]
+    mime['From'] = sender
+    mime['To'] = ", ".join(message["to"])  # Todos os endereços de uma vez, sem concatenar texto a cada destinatário
+    if message["cc"]:
+        mime['Cc'] = ", ".join(message["cc"])
+    mime['Date'] = formatdate(localtime=True)
+    mime['Message-ID'] = make_msgid()
+    mime.set_content("Este e-mail é em HTML.")
+    mime.add_alternative(message["html"], subtype='html')
+    for path in message["attachments"]:
+        with open(path, 'rb') as file:
+            mime.add_attachment(file.read(), maintype='application', subtype='octet-stream',
+                                filename=os.path.basename(path))
+    return mime
+
+# Classe que entrega os e-mails pelo Outlook da máquina (exibe para revisão ou envia direto)
+class OutlookBackend:
+    name = 'com'
+
+    def __init__(self, send=False):
+        self.send = send
+        self.outlook = None
+
+    def __enter__(self):
+        import win32com.client  # Carregado só na hora de criar o e-mail
+        self.outlook = win32com.client.Dispatch("Outlook.Application")  # Cria uma instância do Outlook
+        return self
+
+    def deliver(self, message):
+        # Método que cria um item de e-mail no Outlook com todos os destinatários de uma vez
+        email = self.outlook.CreateItem(0)  # Cria um novo item de e-mail
+        email.Subject = message["subject"]  # Define o assunto do e-mail
+        email.HTMLBody = message["html"]  # Define o corpo do e-mail em HTML
+        email.To = "; ".join(message["to"])
+        email.CC = "; ".join(message["cc"])
+        for path in message["attachments"]:
+            email.Attachments.Add(path)  # Anexa a planilha ao e-mail
+        if self.send:
+            email.Send()  # Envia sem intervenção do usuário
+        else:
+            email.Display()  # Exibe o e-mail preparado para envio
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.outlook = None
+
+# Classe que envia os e-mails por SMTP usando uma única conexão para todas as mensagens
+class SMTPBackend:
+    name = 'smtp'
+
+    def __init__(self, config_path=CAMINHO_CONFIG_SMTP):
+        self.config = read_smtp_config(config_path)
+        self.connection = None
+
+    def __enter__(self):
+        # Conecta e autentica uma única vez (o custo não cresce com o número de grupos de destinatários)
+        self.connection = smtplib.SMTP(self.config["host"], self.config["port"], timeout=SMTP_TIMEOUT)
+        if self.config["tls"]:
+            self.connection.starttls()
+        if self.config["user"]:
+            self.connection.login(self.config["user"], self.config["password"] or "")
+        return self
 
-    logging.info(f"Destinatários principais encontrados: {main_recipients}")  # Log dos destinatários principais encontrados
-    logging.info(f"Destinatários em cópia (CC): {cc_recipients}")  # Log dos destinatários em cópia
+    def deliver(self, message):
+        # Método que envia uma mensagem pela conexão já aberta
+        self.connection.send_message(build_mime_message(message, self.config["sender"]))
 
-    outlook = win32com.client.Dispatch("Outlook.Application")  # Cria uma instância do Outlook
-    email = outlook.CreateItem(0)  # Cria um novo item de e-mail
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Os e-mails já foram entregues: uma falha no QUIT (inclusive a conexão caída, OSError) só fecha o socket
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self.connection.close()
 
-    email.Subject = f"Processos retirados do FTP em {current_date}"  # Define o assunto do e-mail
+# Classe que grava os e-mails como arquivos .eml (abrem no Outlook; usada para conferência e testes sem servidor)
+class EmlBackend:
+    name = 'eml'
 
-    # Define o corpo do e-mail em HTML
-    email.HTMLBody = f"""
+    def __init__(self, directory=DIRETORIO_EML, sender="relatorio@localhost"):
+        self.directory = directory
+        self.sender = sender
+        self.count = 0
+
+    def __enter__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return self
+
+    def deliver(self, message):
+        # Método que grava a mensagem em um arquivo .eml
+        self.count += 1
+        name = re.sub(r'[^\w.-]+', '_', message["subject"])
+        path = os.path.join(self.directory, f"{datetime.now():%Y%m%d_%H%M%S}_{self.count:03d}_{name}.eml")
+        with open(path, 'wb') as file:
+            file.write(bytes(build_mime_message(message, self.sender)))
+        logging.info(f"E-mail gravado em {path}")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+def get_backend(name=None, send=False):
+    # Função que cria o backend de entrega configurado (MAIL_BACKEND e caminhos lidos no momento da chamada)
+    name = name or MAIL_BACKEND
+    if name == 'smtp':
+        return SMTPBackend(CAMINHO_CONFIG_SMTP)
+    if name == 'eml':
+        return EmlBackend(DIRETORIO_EML)
+    return OutlookBackend(send=send)
+
+def build_html(greeting, previous_day):
+    # Função que monta o corpo do e-mail em HTML
+    return f"""
     <html>
     <body>
     <p>{greeting} a todos!</p>
@@ -88,37 +257,102 @@ def create_outlook_email():
     </html>
     """
 
-    # Adiciona os destinatários principais ao e-mail
-    for recipient in main_recipients:
-        if validate_email(recipient):  # Valida o e-mail do destinatário
-            email.Recipients.Add(recipient)  # Adiciona o destinatário ao e-mail
-            logging.info(f"Destinatário adicionado: {recipient}")  # Log do destinatário adicionado
-        else:  # Se o e-mail não for válido
-            logging.warning(f"Endereço de e-mail inválido: {recipient}")  # Log de aviso para e-mail inválido
-
-    # Adiciona os destinatários em cópia (CC) ao e-mail
-    for cc in cc_recipients:
-        if validate_email(cc):  # Valida o e-mail do destinatário em CC
-            email.CC += f";{cc}"  # Adiciona o destinatário em CC
-            logging.info(f"Destinatário em cópia adicionado: {cc}")  # Log do destinatário em cópia adicionado
-        else:  # Se o e-mail não for válido
-            logging.warning(f"Endereço de e-mail inválido em CC: {cc}")  # Log de aviso para e-mail inválido em CC
+def read_report(spreadsheet_path):
+    # Função que lê a planilha do relatório (quando o e-mail é gerado em um processo separado do relatório)
+    import pandas as pd
+    return pd.read_excel(spreadsheet_path, dtype=str)
 
-    spreadsheet_path = CAMINHO_PLANILHA_BASE.format(current_date)  # Formata o caminho da planilha com a data atual
+def write_utd_reports(report_df, utds, directory, current_date):
+    # Função que grava uma planilha por UTD com só as linhas dela; retorna {UTD: caminho} (UTD sem linhas não recebe e-mail)
+    from oracle import write_xlsx
+    # As UCs da ENERGEC entram no grupo da UTD de origem ("ENERGEC - UTD X" pertence à UTD X)
+    report_utd = report_df['UTD'].astype(str).str.replace(r'^ENERGEC - ', '', regex=True)
+    paths = {}
+    for utd in utds:
+        rows = report_df[report_utd.eq(utd)]
+        if rows.empty:
+            logging.info(f"UTD {utd} sem processos no relatório: e-mail não enviado.")
+            continue
+        name = re.sub(r'[^\w -]+', '_', utd)
+        paths[utd] = os.path.join(directory, f"Processos retirados do FTP em {current_date} - {name}.xlsx")
+        write_xlsx(rows, paths[utd])
+    return paths
+
+def build_messages(groups, spreadsheet_path, current_date, previous_day, report_df, directory):
+    # Função que monta os e-mails: um com o relatório completo e, se ativado, um por UTD com só as suas linhas
+    html = build_html(get_greeting(), previous_day)
+    subject = f"Processos retirados do FTP em {current_date}"  # Define o assunto do e-mail
+    if not SPLIT_BY_UTD:
+        # Todos os destinatários em um único e-mail com o relatório completo, como antes
+        to = list(dict.fromkeys(address for group in groups.values() for address in group["to"]))
+        cc = list(dict.fromkeys(address for group in groups.values() for address in group["cc"]))
+        return [{"subject": subject, "html": html, "to": to, "cc": cc, "attachments": [spreadsheet_path]}]
+
+    messages = []
+    full = groups.get("")
+    if full:
+        messages.append({"subject": subject, "html": html, "to": full["to"], "cc": full["cc"], "attachments": [spreadsheet_path]})
+    utds = [utd for utd in groups if utd]
+    if utds:
+        if report_df is None:
+            report_df = read_report(spreadsheet_path)
+        for utd, path in write_utd_reports(report_df, utds, directory, current_date).items():
+            messages.append({"subject": f"{subject} - {utd}", "html": html, "to": groups[utd]["to"],
+                             "cc": groups[utd]["cc"], "attachments": [path]})
+    return messages
+
+def deliver_messages(messages, backend):
+    # Função que entrega todos os e-mails em uma única sessão do backend
+    start = time.perf_counter()
+    delivered = 0
+    with backend:
+        for message in messages:
+            if not message["to"]:
+                logging.warning(f"E-mail '{message['subject']}' sem destinatário principal. Não enviado.")
+                continue
+            try:
+                backend.deliver(message)
+            except Exception as e:  # Uma falha em um grupo não impede os demais
+                logging.error(f"Erro ao entregar o e-mail '{message['subject']}': {e}")
+                continue
+            delivered += 1
+            metrics.inc("mail_messages_total", backend=backend.name)
+            logging.info(f"E-mail '{message['subject']}': {len(message['to'])} destinatário(s), {len(message['cc'])} em cópia")
+    metrics.observe("mail_delivery_seconds", time.perf_counter() - start, backend=backend.name)
+    return delivered
 
-    if os.path.exists(spreadsheet_path):  # Verifica se a planilha existe
-        email.Attachments.Add(spreadsheet_path)  # Anexa a planilha ao e-mail
-        logging.info(f"Anexo adicionado: {spreadsheet_path}")  # Log do anexo adicionado
-    else:  # Se a planilha não for encontrada
+def create_outlook_email(send=False, report_df=None, backend=None):
+    # Função para criar e preparar os e-mails do relatório (send=True envia direto, sem abrir a janela; usado no modo contínuo)
+    current_date = datetime.now().strftime("%d.%m.%Y")  # Obtém a data atual formatada
+    previous_day = (datetime.now() - timedelta(days=1)).strftime("%d.%m.%Y")  # Obtém a data do dia anterior
+
+    groups = load_recipients(CAMINHO_DESTINATARIOS, CAMINHO_CACHE_DESTINATARIOS)  # Destinatários validados (cache do Emails.xlsx)
+    if not any(group["to"] for group in groups.values()):  # Verifica se não há destinatários principais
+        logging.warning("Nenhum destinatário principal encontrado.")  # Log de aviso
+        print("Nenhum destinatário principal encontrado.")  # Mensagem para o usuário
+        return  # Sai da função se não houver destinatários
+
+    spreadsheet_path = CAMINHO_PLANILHA_BASE.format(current_date)  # Formata o caminho da planilha com a data atual
+    if not os.path.exists(spreadsheet_path):  # Verifica se a planilha existe
         logging.error(f"Planilha não encontrada: {spreadsheet_path}")  # Log de erro para planilha não encontrada
+        print(f"Planilha não encontrada: {spreadsheet_path}")
+        return
+
+    backend = backend or get_backend(send=send)
+    # As planilhas por UTD só precisam existir até a entrega (o Outlook e o SMTP copiam o anexo)
+    with tempfile.TemporaryDirectory() as directory:
+        messages = build_messages(groups, spreadsheet_path, current_date, previous_day, report_df, directory)
+        delivered = deliver_messages(messages, backend)
 
-    email.Display()  # Exibe o e-mail preparado para envio
-    logging.info(f"E-mail preparado para envio em {current_date}.")  # Log de e-mail preparado
-    print(f"E-mail preparado para envio em {current_date}.")  # Mensagem para o usuário informando que o e-mail está preparado
+    action = "preparado(s)" if backend.name == 'com' and not send else "enviado(s)"
+    logging.info(f"{delivered} e-mail(s) {action} em {current_date} ({backend.name}).")  # Log de e-mail preparado
+    print(f"{delivered} e-mail(s) {action} em {current_date}.")  # Mensagem para o usuário informando que o e-mail está preparado
 
 if __name__ == "__main__":  # Verifica se o script está sendo executado diretamente
+    setup_logging()  # Configura o logging
+    confirm_email()  # Mensagem para o usuário antes de abrir o email
     create_outlook_email()  # Chama a função para criar o e-mail
 
-print("")
-print("==========")
-print("")
+    print("")
+    print("==========")
+    print("")
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+# Índice das listagens dos diretórios de PDFs (fica junto dos demais arquivos do processo)
+SCAN_INDEX_PATH = (r'\\pdf_scan_index.sqlite')
+SCAN_WORKERS = 8  # Diretórios listados em paralelo (cada listagem no compartilhamento de rede é uma ida ao servidor)
+RECURSIVE_SCAN = False  # True: também procura PDFs nos subdiretórios
+IGNORED_SAMPLE = 5  # Quantos nomes de arquivos ignorados aparecem no log de cada diretório
+# True: a UC é lida do texto do PDF (uc_extractor.py, exige o pypdf), com o nome do arquivo como alternativa
+CONTENT_EXTRACTION = False
+
+NON_DIGITS = re.compile(r'\D')  # Tudo que não é dígito no nome do arquivo
+
+def extract_uc(file_name):
+    # Função que extrai a UC do nome do arquivo (apenas os números)
+    return NON_DIGITS.sub('', file_name)
+
+def file_uc(path, content_extraction=CONTENT_EXTRACTION):
+    # Função que retorna a UC de um PDF baixado (pelo texto, se a extração estiver ativa, ou pelo nome)
+    if content_extraction:
+        from uc_extractor import extract_ucs
+        return extract_ucs([path])[0][0]
+    return extract_uc(os.path.basename(path))
+
+# Classe que guarda a data de modificação e as entradas de cada diretório já listado
+class ScanIndex:
+    def __init__(self, path=SCAN_INDEX_PATH):
+        # Abre (ou cria) o índice
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                entries TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def load(self):
+        # Método que retorna {diretório: (mtime_ns, [(nome, é_diretório), ...])}
+        return {
+            path: (mtime_ns, [tuple(entry) for entry in json.loads(entries)])
+            for path, mtime_ns, entries in self.conn.execute("SELECT path, mtime_ns, entries FROM directories")
+        }
+
+    def save(self, listings):
+        # Método que grava as listagens novas ou alteradas
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO directories (path, mtime_ns, entries) VALUES (?, ?, ?)",
+            ((path, mtime_ns, json.dumps(entries)) for path, (mtime_ns, entries) in listings.items())
+        )
+        self.conn.commit()
+
+    def close(self):
+        # Método para fechar o índice
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def list_directory(directory, known):
+    # Função que lista um diretório, reaproveitando a listagem do índice se a data de modificação não mudou
+    # A data de modificação do diretório muda quando um arquivo é criado, removido ou renomeado nele
+    mtime_ns = os.stat(directory).st_mtime_ns
+    cached = known.get(directory)
+    if cached is not None and cached[0] == mtime_ns:
+        return mtime_ns, cached[1], False  # Diretório inalterado: não precisa ser listado de novo
+    with os.scandir(directory) as entries:
+        listing = [(entry.name, entry.is_dir()) for entry in entries]
+    return mtime_ns, listing, True
+
+def scan_pdfs(directories, recursive=RECURSIVE_SCAN, index_path=SCAN_INDEX_PATH, workers=SCAN_WORKERS,
+              content_extraction=CONTENT_EXTRACTION):
+    # Função que varre os diretórios em paralelo e retorna as listas de UCs e de diretórios de origem dos PDFs
+    index = ScanIndex(index_path) if index_path else None
+    known = index.load() if index else {}
+    listings = {}  # Listagem de cada diretório varrido nesta execução
+    changed = {}  # Listagens que precisam ser gravadas no índice
+    relisted = 0  # Diretórios que precisaram ser listados no servidor
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Cada diretório configurado é a origem dos PDFs encontrados nele e nos seus subdiretórios
+            pending = {}
+            for directory in dict.fromkeys(directories):  # Ignora diretórios repetidos
+                pending[executor.submit(list_directory, directory, known)] = directory
+
+            while pending:
+                future = next(iter(pending))  # Aguarda na ordem de envio; os demais seguem listando em paralelo
+                directory = pending.pop(future)
+                try:
+                    mtime_ns, listing, fresh = future.result()
+                except (FileNotFoundError, NotADirectoryError):
+                    logging.error(f"Diretório não encontrado: {directory}")  # Registra um erro se o diretório não existe
+                    continue
+                except OSError as e:
+                    logging.error(f"Erro ao listar o diretório {directory}: {e}")
+                    continue
+                listings[directory] = listing
+                if fresh:
+                    relisted += 1
+                    changed[directory] = (mtime_ns, listing)
+                if recursive:
+                    for name, is_dir in listing:
+                        if is_dir:
+                            subdirectory = os.path.join(directory, name)
+                            pending[executor.submit(list_directory, subdirectory, known)] = subdirectory
+
+        if index and changed:
+            index.save(changed)
+    finally:
+        if index:
+            index.close()
+
+    pdf_files = []  # Lista que armazenará as UCs dos arquivos PDF encontrados
+    pdf_sources = []  # Lista que armazenará os diretórios de origem dos arquivos PDF encontrados
+    pdf_paths = []  # Caminho de cada PDF (usado na extração pelo conteúdo)
+    for directory in dict.fromkeys(directories):
+        if directory not in listings:
+            continue
+        found, ignored = collect_listing(directory, directory, listings, recursive, pdf_files, pdf_sources, pdf_paths)
+        if not found and not ignored:
+            logging.warning(f"O diretório {directory} está vazio.")  # Registra um aviso se o diretório estiver vazio
+            continue
+        # Um resumo por diretório em vez de uma linha por arquivo
+        logging.info(f"Diretório {directory}: {found} arquivo(s) PDF encontrado(s)")
+        if ignored:
+            logging.warning(f"Diretório {directory}: {len(ignored)} arquivo(s) ignorado(s) (não é PDF), "
+                            f"ex.: {ignored[:IGNORED_SAMPLE]}")
+
+    logging.info(f"Varredura concluída: {len(listings)} diretório(s), {relisted} listado(s) no servidor, "
+                 f"{len(listings) - relisted} reaproveitado(s) do índice, {len(pdf_files)} PDF(s)")
+    if content_extraction and pdf_paths:
+        from uc_extractor import extract_ucs  # Só carregado quando a extração pelo conteúdo está ativa
+        pdf_files = [uc for uc, _ in extract_ucs(pdf_paths)]
+    return pdf_files, pdf_sources
+
+def collect_listing(directory, source, listings, recursive, pdf_files, pdf_sources, pdf_paths):
+    # Função que percorre a listagem de um diretório (e, se recursiva, dos subdiretórios) acumulando os PDFs
+    found = 0
+    ignored = []
+    for name, is_dir in listings.get(directory, []):
+        if is_dir:
+            if recursive:
+                sub_found, sub_ignored = collect_listing(os.path.join(directory, name), source, listings, recursive,
+                                                         pdf_files, pdf_sources, pdf_paths)
+                found += sub_found
+                ignored.extend(sub_ignored)
+            continue
+        if name.endswith('.pdf'):
+            pdf_files.append(extract_uc(name))  # Adiciona a UC (apenas números) à lista de arquivos PDF
+            pdf_sources.append(source)  # A origem é o diretório configurado (usada na regra da ENERGEC)
+            pdf_paths.append(os.path.join(directory, name))
+            found += 1
+        else:
+            ignored.append(name)
+    return found, ignored
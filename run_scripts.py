@@ -1,6 +1,22 @@
-import subprocess  
-import sys 
-import logging 
+import subprocess
+import sys
+import logging
+import argparse
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import metrics
+import log_config
+
+# Executa as etapas no mesmo processo, com as UCs dos PDFs baixados indo direto para a consulta ao banco
+PIPELINE_MODE = True  # False: executa os três scripts em processos separados, como antes
+
+# Modo contínuo (--daemon): varre o FTP ao longo do dia e envia o relatório no horário de corte
+DAILY_REPORT_TIME = "07:00"  # Horário (HH:MM) do relatório com tudo que foi recebido desde o corte anterior
+
+PIPELINE_LOG_PATH = r'\\pipeline_log.log'  # Log único de todas as etapas do pipeline
 
 def run_script(script_name):
     # Função para executar um script Python dado o seu nome
@@ -12,8 +28,8 @@ def run_script(script_name):
         logging.error(f"Erro ao executar {script_name}: {e}")  # Registra o erro no log
         print(f"Erro ao executar {script_name}: {e}")  # Imprime o erro no console
 
-def main():
-    # Função principal que gerencia a execução dos scripts
+def run_subprocesses():
+    # Função que executa as etapas como scripts separados (cada uma relê do disco o que a anterior gravou)
     scripts_to_run = [
         # Lista de scripts a serem executados
         r'S\\ftp.py',
@@ -24,11 +40,227 @@ def main():
     for script in scripts_to_run:
         # Itera sobre cada script na lista e chama a função run_script
         run_script(script)
-    
+
+def setup_pipeline_logging():
+    # Função para configurar o logging do pipeline (um único arquivo para todas as etapas)
+    log_config.setup_logging(
+        PIPELINE_LOG_PATH,
+        level=logging.INFO,  # Define o nível de log como INFO
+        fmt='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'  # Inclui a thread de cada etapa
+    )
+
+@contextmanager
+def timed(stage_times, stage):
+    # Função que mede o tempo de parede de uma etapa
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_times[stage] = time.perf_counter() - start
+
+def log_stage_times(stage_times, total):
+    # Função que registra e imprime o tempo de cada etapa e o tempo total
+    for stage, elapsed in stage_times.items():
+        logging.info(f"Etapa {stage}: {elapsed:.2f} s")
+        print(f"Etapa {stage}: {elapsed:.2f} s")
+        metrics.observe("stage_seconds", elapsed, stage=stage)
+    metrics.observe("stage_seconds", total, stage="total")
+    logging.info(f"Tempo total (ponta a ponta): {total:.2f} s")
+    print(f"Tempo total (ponta a ponta): {total:.2f} s")
+
+def run_pipeline():
+    # Função que executa coleta, consulta, relatório e e-mail no mesmo processo
+    # As etapas são importadas aqui para que o modo em processos separados não carregue pandas/oracledb à toa
+    import ftp
+    import oracle
+    from pdf_scanner import file_uc
+
+    setup_pipeline_logging()  # Configura o logging
+    start = time.perf_counter()
+    stage_times = {}
+
+    try:
+        db_config = oracle.read_db_config()  # Lê as configurações do banco de dados
+    except Exception as e:  # Captura erros ao ler o arquivo de configuração
+        logging.error(f"Erro ao ler o arquivo de configuração: {e}")  # Registra o erro
+        print("Erro ao ler o arquivo de configuração. Verifique os logs para mais detalhes.")  # Informa ao usuário
+        return
+
+    # A consulta roda em uma thread própria: cada lote de UCs vai ao banco enquanto os downloads continuam
+    lookup = oracle.StreamingLookup(db_config).start()
+
+    def scan_source_directories():
+        # PDFs que já estavam nos diretórios (ex.: os da ENERGEC, recebidos por e-mail) também entram no relatório
+        with timed(stage_times, "varredura dos diretórios"):
+            pdf_files, pdf_sources = oracle.collect_pdfs(oracle.SOURCE_DIRECTORIES)
+            for uc, source in zip(pdf_files, pdf_sources):
+                lookup.submit(uc, source)
+
+    def on_download(file_name, local_file_path):
+        # Cada PDF salvo no diretório base é repassado para a consulta assim que o download termina
+        lookup.submit(file_uc(local_file_path), os.path.dirname(local_file_path))
+
+    scanner = threading.Thread(target=scan_source_directories, name="varredura")
+    scanner.start()
+    try:
+        with timed(stage_times, "coleta FTP"):
+            ftp.log_harvest_summary(ftp.harvest(on_download=on_download))
+    except Exception as e:  # Uma falha na coleta não impede o relatório do que já foi recebido
+        logging.error(f"Erro na coleta FTP: {e}")
+        print("Erro na coleta FTP. O relatório será gerado com os PDFs já recebidos.")
+    scanner.join()
+
+    # Só falta consultar o que chegou depois do último lote
+    with timed(stage_times, "consulta (após a coleta)"):
+        results, pdf_files, pdf_sources = lookup.finish()
+    stage_times["consulta (tempo ocupado)"] = lookup.busy_time
+    pdf_files, pdf_sources = oracle.collapse_duplicate_ucs(pdf_files, pdf_sources)  # Remove UCs repetidas
+
+    if not pdf_files:
+        logging.warning("Nenhum arquivo PDF encontrado.")  # Registra um aviso
+        print("Nenhum arquivo PDF encontrado.")  # Informa ao usuário
+        log_stage_times(stage_times, time.perf_counter() - start)
+        return
+
+    logging.info(f"Número de resultados retornados: {len(results)}")  # Registra o número de resultados
+    print(f"Número de resultados retornados: {len(results)}")  # Informa ao usuário
+    try:
+        with timed(stage_times, "relatório"):
+            report_df = oracle.build_report(results, pdf_files, pdf_sources, oracle.get_current_date())  # Relatório a partir dos resultados em memória
+    except Exception as e:
+        logging.error(f"Erro ao gerar o relatório: {e}")
+        print("Ocorreu um erro ao gerar o relatório. Verifique os logs para mais detalhes.")
+        log_stage_times(stage_times, time.perf_counter() - start)
+        return
+
+    waited = 0.0
+    try:
+        import outlook  # Carregado só quando há relatório para enviar (depende do win32com)
+        wait_start = time.perf_counter()
+        outlook.confirm_email()  # Aguarda o usuário revisar os prints e logs
+        waited = time.perf_counter() - wait_start
+        with timed(stage_times, "e-mail"):
+            outlook.create_outlook_email(report_df=report_df)  # A divisão por UTD usa o relatório em memória
+    except Exception as e:  # O relatório já foi gravado: uma falha no envio não derruba o pipeline
+        logging.error(f"Erro ao enviar o e-mail do relatório: {e}")
+        print("Erro ao enviar o e-mail. O relatório foi gravado; verifique os logs para mais detalhes.")
+    log_stage_times(stage_times, time.perf_counter() - start - waited)  # O tempo de espera pelo usuário fica de fora
+
+def next_cutoff(now, report_time=DAILY_REPORT_TIME):
+    # Função que calcula o próximo horário de corte do relatório diário
+    hour, minute = map(int, report_time.split(':'))
+    cutoff = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return cutoff if cutoff > now else cutoff + timedelta(days=1)
+
+def send_daily_report(lookup):
+    # Função que fecha a consulta do dia, gera o relatório e envia o e-mail sem intervenção do usuário
+    import oracle
+    results, pdf_files, pdf_sources = lookup.finish()  # Só os últimos lotes ainda não consultados
+    pdf_files, pdf_sources = oracle.collapse_duplicate_ucs(pdf_files, pdf_sources)  # Remove UCs repetidas
+    if not pdf_files:
+        logging.warning("Nenhum arquivo PDF recebido desde o último relatório.")
+        return
+    logging.info(f"Relatório diário: {len(pdf_files)} UC(s), {len(results)} resultado(s) em {lookup.batches} lote(s)")
+    try:
+        with metrics.timer("stage_seconds", stage="relatório"):
+            report_df = oracle.build_report(results, pdf_files, pdf_sources, oracle.get_current_date())
+        import outlook
+        with metrics.timer("stage_seconds", stage="e-mail"):
+            outlook.create_outlook_email(send=True, report_df=report_df)
+    except Exception as e:  # O erro de um dia não derruba o modo contínuo
+        logging.error(f"Erro ao gerar ou enviar o relatório diário: {e}")
+
+def run_daemon(stop_event=None):
+    # Função que mantém as sessões FTP abertas, varre os diretórios periodicamente e consulta as UCs em pequenos lotes
+    import ftp
+    import oracle
+    from manifest import SyncManifest, MANIFEST_PATH
+    from content_store import ContentStore, CONTENT_STORE_PATH
+    from pdf_scanner import file_uc
+
+    setup_pipeline_logging()  # Configura o logging
+    try:
+        db_config = oracle.read_db_config()  # Lê as configurações do banco de dados
+    except Exception as e:  # Captura erros ao ler o arquivo de configuração
+        logging.error(f"Erro ao ler o arquivo de configuração: {e}")  # Registra o erro
+        print("Erro ao ler o arquivo de configuração. Verifique os logs para mais detalhes.")  # Informa ao usuário
+        return
+
+    stop_event = stop_event or threading.Event()
+    lookup = oracle.StreamingLookup(db_config).start()  # Consulta do dia: cada lote vai ao banco assim que chega
+    submitted = set()  # (UC, diretório) já enviados para a consulta do dia (a varredura encontra os mesmos PDFs a cada ciclo)
+    submit_lock = threading.Lock()
+
+    def submit(uc, source):
+        with submit_lock:
+            if (uc, source) in submitted:
+                return
+            submitted.add((uc, source))
+        lookup.submit(uc, source)
+
+    def on_download(file_name, local_file_path):
+        # Cada PDF salvo no diretório base é repassado para a consulta assim que o download termina
+        submit(file_uc(local_file_path), os.path.dirname(local_file_path))
+
+    cutoff = next_cutoff(datetime.now())
+    logging.info(f"Modo contínuo iniciado. Varredura a cada {ftp.POLL_INTERVAL} s; próximo relatório em {cutoff:%d/%m/%Y %H:%M}")
+    print(f"Modo contínuo iniciado. Próximo relatório em {cutoff:%d/%m/%Y %H:%M}. Ctrl+C para encerrar.")
+    try:
+        with SyncManifest(MANIFEST_PATH) as manifest, ContentStore(CONTENT_STORE_PATH) as content_store, \
+                ftp.FTPWatcher(ftp.FTP_SERVERS, ftp.FTP_FOLDERS, ftp.BASE_FOLDERS, manifest=manifest,
+                               content_store=content_store, on_download=on_download) as watcher:
+            while not stop_event.is_set():
+                start = time.perf_counter()
+                summary = watcher.poll()
+                # Depois do download, a varredura dos diretórios inclui os PDFs colocados à mão (ex.: ENERGEC)
+                # e os que chegaram antes de um reinício do processo
+                for uc, source in zip(*oracle.collect_pdfs(oracle.SOURCE_DIRECTORIES)):
+                    submit(uc, source)
+                elapsed = time.perf_counter() - start
+                metrics.observe("stage_seconds", elapsed, stage="varredura contínua")
+                logging.info(f"Varredura concluída em {elapsed:.2f} s: {sum(summary['transferred'].values())} PDF(s) novo(s), "
+                             f"{len(submitted)} UC(s) acumulada(s) para o relatório")
+
+                if datetime.now() >= cutoff:
+                    send_daily_report(lookup)
+                    metrics.export("daemon")  # Grava as métricas acumuladas até o corte (JSON e arquivo .prom)
+                    lookup = oracle.StreamingLookup(db_config).start()  # Começa a consulta do próximo dia
+                    submitted.clear()
+                    cutoff = next_cutoff(datetime.now())
+                    logging.info(f"Próximo relatório em {cutoff:%d/%m/%Y %H:%M}")
+
+                # Aguarda a próxima varredura (ou o corte, se vier antes) mantendo as sessões vivas
+                until_cutoff = (cutoff - datetime.now()).total_seconds()
+                watcher.wait(max(0, min(ftp.POLL_INTERVAL - elapsed, until_cutoff)), stop_event)
+    except KeyboardInterrupt:
+        logging.info("Modo contínuo interrompido pelo usuário.")
+    finally:
+        # As UCs do dia não se perdem ao encerrar: os PDFs continuam nos diretórios e entram na próxima execução
+        lookup.finish()
+        logging.info("Modo contínuo encerrado.")
+        print("Modo contínuo encerrado.")
+
+def main():
+    # Função principal que gerencia a execução das etapas
+    parser = argparse.ArgumentParser(description="Executa a coleta FTP, a consulta ao Oracle e o e-mail do relatório.")
+    parser.add_argument("--subprocess", action="store_true",
+                        help="Executa ftp.py, oracle.py e outlook.py em processos separados")
+    parser.add_argument("--daemon", action="store_true",
+                        help=f"Fica em execução varrendo o FTP e envia o relatório todo dia às {DAILY_REPORT_TIME}")
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon()  # Sem input(): roda sem ninguém à frente do terminal
+        return
+    if args.subprocess or not PIPELINE_MODE:
+        logging.basicConfig(level=logging.ERROR)  # Configura o nível de logging para ERROR
+        run_subprocesses()
+    else:
+        run_pipeline()
+        metrics.export("pipeline")  # Grava as métricas da execução (JSON e arquivo .prom)
+
     # Aguarda a interação do usuário antes de finalizar o processo
     input("Clique em qualquer tecla para finalizar o processo.")
 
 if __name__ == "__main__":
-    # Configura o nível de logging para ERROR
-    logging.basicConfig(level=logging.ERROR)
     main()  # Chama a função principal para iniciar o processo
@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+import metrics
+
+# Ordem das transferências dentro de uma mesma prioridade
+ORDER_SMALLEST = "menor primeiro"  # Arquivos menores primeiro (mais processos entregues por minuto de banda)
+ORDER_DEADLINE = "prazo"  # Data do arquivo na listagem + prazo do diretório (o mais antigo perto de vencer primeiro)
+ORDER_LISTING = "listagem"  # Na ordem em que aparecem na listagem (comportamento anterior)
+
+AGING_INTERVAL = 300  # A cada 5 minutos na fila um arquivo sobe um nível de prioridade (nenhum diretório fica parado)
+WAIT_SAMPLE = 5  # Diretórios com maior espera exibidos no resumo
+
+def listing_timestamp(modify):
+    # Função que converte a data do MLSD (AAAAMMDDHHMMSS, em UTC) para epoch; None nos formatos do LIST
+    try:
+        return datetime.strptime(str(modify)[:14], "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def within_hours(hours, now=None):
+    # Função que indica se o horário atual está na janela (início, fim) no formato HH:MM (None = o dia todo)
+    if hours is None:
+        return True
+    start, end = hours
+    current = (now or datetime.now()).strftime("%H:%M")
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end  # Janela que atravessa a meia-noite
+
+# Classe que limita a banda total (bytes/s) de todos os downloads, com rajada de até um segundo
+class TokenBucket:
+    def __init__(self, rate, hours=None):
+        self.rate = rate  # Bytes por segundo
+        self.hours = hours  # Janela em que o limite vale (ex.: horário comercial); fora dela a banda é livre
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0  # Tempo total (s) que os downloads esperaram pela banda
+
+    def consume(self, amount):
+        # Método que reserva a banda de um bloco recebido e espera o tempo necessário para manter a taxa
+        if not within_hours(self.hours):
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(float(self.rate), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount  # A reserva é feita na ordem de chegada; o saldo negativo é a fila de espera
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += delay
+        if delay:
+            time.sleep(delay)
+
+# Classe que decide a ordem das transferências de todas as contas e diretórios e as executa em um número fixo de threads
+class TransferScheduler:
+    def __init__(self, workers, per_account, priorities, default_priority, order=ORDER_SMALLEST, deadlines=None,
+                 default_deadline=0, bandwidth=None, bandwidth_hours=None, aging_interval=AGING_INTERVAL):
+        self.workers = workers  # Transferências simultâneas no total
+        self.per_account = per_account  # Transferências simultâneas por conta FTP
+        self.priorities = priorities  # {diretório FTP: prioridade} (0 é a mais urgente)
+        self.default_priority = default_priority
+        self.order = order
+        self.deadlines = deadlines or {}  # {diretório FTP: prazo em segundos a partir da data do arquivo}
+        self.default_deadline = default_deadline
+        self.bucket = TokenBucket(bandwidth, bandwidth_hours) if bandwidth else None
+        self.aging_interval = aging_interval
+        self.condition = threading.Condition()
+        self.queues = {}  # {conta: heap de (chave, sequência, tarefa)}
+        self.active = {}  # {conta: transferências em andamento}
+        self.served = {}  # {conta: bytes já despachados} (a conta menos atendida vai primeiro dentro da mesma prioridade)
+        self.sequence = itertools.count()
+        self.started = time.monotonic()
+        self.depth = 0  # Arquivos na fila
+        self.max_depth = 0
+        self.waits = {}  # {diretório: [arquivos, espera total, espera máxima]}
+        self.closed = False
+        self.threads = [threading.Thread(target=self.run, name=f"transferencia-{index + 1}", daemon=True)
+                        for index in range(workers)]
+
+    def start(self):
+        # Método que inicia as threads de transferência
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def key(self, folder, size, modify):
+        # Método que calcula a posição do arquivo na fila: (prioridade envelhecida, critério de ordem)
+        # Quem entra na fila depois de N intervalos concorre como se tivesse N níveis a menos de urgência
+        priority = self.priorities.get(folder, self.default_priority)
+        priority += int((time.monotonic() - self.started) // self.aging_interval)
+        if self.order == ORDER_SMALLEST:
+            return priority, size if size is not None else math.inf
+        if self.order == ORDER_DEADLINE:
+            listed_at = listing_timestamp(modify) or time.time()
+            return priority, listed_at + self.deadlines.get(folder, self.default_deadline)
+        return priority, 0  # Ordem da listagem: decide a sequência de chegada
+
+    def submit(self, account, folder, size, modify, function, *args):
+        # Método que enfileira uma transferência e retorna um Future com o seu resultado
+        future = Future()
+        task = (account, folder, size, time.monotonic(), future, function, args)
+        with self.condition:
+            heapq.heappush(self.queues.setdefault(account, []), (self.key(folder, size, modify), next(self.sequence), task))
+            self.active.setdefault(account, 0)
+            self.served.setdefault(account, 0)
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+            metrics.set_gauge("ftp_queue_depth", self.depth)
+            self.condition.notify()
+        return future
+
+    def next_task(self):
+        # Método que escolhe a próxima transferência entre as contas que ainda têm conexão livre
+        with self.condition:
+            while True:
+                candidates = [
+                    (heap[0][0][0], self.served[account], heap[0][0][1], heap[0][1], account)
+                    for account, heap in self.queues.items()
+                    if heap and self.active[account] < self.per_account
+                ]
+                if candidates:
+                    account = min(candidates)[-1]
+                    task = heapq.heappop(self.queues[account])[2]
+                    self.active[account] += 1
+                    self.served[account] += task[2] or 0
+                    self.depth -= 1
+                    metrics.set_gauge("ftp_queue_depth", self.depth)
+                    return task
+                if self.closed and not self.depth:
+                    return None
+                self.condition.wait()
+
+    def run(self):
+        # Método executado pelas threads de transferência
+        while True:
+            task = self.next_task()
+            if task is None:
+                return
+            account, folder, size, queued_at, future, function, args = task
+            waited = time.monotonic() - queued_at
+            metrics.observe("ftp_queue_wait_seconds", waited, folder=folder)
+            with self.condition:
+                stats = self.waits.setdefault(folder, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += waited
+                stats[2] = max(stats[2], waited)
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(function(*args))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self.condition:
+                    self.active[account] -= 1
+                    self.condition.notify_all()
+
+    def throttle(self, amount):
+        # Método chamado a cada bloco recebido: aplica o limite de banda global (se houver)
+        if self.bucket is not None:
+            self.bucket.consume(amount)
+
+    def log_summary(self):
+        # Método que registra a profundidade máxima da fila e a espera por diretório
+        if not self.waits:
+            return
+        by_wait = sorted(self.waits.items(), key=lambda item: item[1][1] / item[1][0], reverse=True)
+        details = "; ".join(f"{folder}: {count} arquivo(s), espera média {total / count:.2f} s, máxima {longest:.2f} s"
+                            for folder, (count, total, longest) in by_wait[:WAIT_SAMPLE])
+        logging.info(f"Fila de transferências: no máximo {self.max_depth} arquivo(s) aguardando. {details}")
+        if self.bucket is not None:
+            logging.info(f"Limite de banda ({self.bucket.rate / 2**20:.2f} MiB/s): {self.bucket.waited:.1f} s de espera acumulada")
+
+    def reset_summary(self):
+        # Método que zera as estatísticas do resumo (no modo contínuo, um resumo por varredura)
+        with self.condition:
+            self.waits = {}
+            self.max_depth = self.depth
+        if self.bucket is not None:
+            with self.bucket.lock:
+                self.bucket.waited = 0.0
+
+    def close(self):
+        # Método que aguarda as transferências enfileiradas, encerra as threads e registra o resumo
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.log_summary()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
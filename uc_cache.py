@@ -0,0 +1,100 @@
+import logging
+import sqlite3
+import time
+import metrics
+
+# Caminho do cache local de UC -> localidade (fica junto dos demais arquivos do processo)
+UC_CACHE_PATH = (r'\\uc_cache.sqlite')
+UC_CACHE_TTL = 30 * 24 * 3600  # Validade (s) de uma UC no cache antes de ser consultada de novo no Oracle
+UC_CACHE_MAX_ENTRIES = 500_000  # Número máximo de UCs; as usadas há mais tempo são removidas primeiro
+SQLITE_CHUNK_SIZE = 900  # UCs por consulta ao SQLite (limite de variáveis de ligação das versões antigas)
+
+# Classe que guarda localmente o resultado da consulta rededes.cad_uc_ee (cod_un_cons_uee -> cod_loc_uee)
+class UCLookupCache:
+    def __init__(self, path=UC_CACHE_PATH, ttl=UC_CACHE_TTL, max_entries=UC_CACHE_MAX_ENTRIES):
+        # Abre (ou cria) o cache
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0  # UCs encontradas no cache nesta execução
+        self.misses = 0  # UCs que precisaram ir ao Oracle nesta execução
+        self.conn = sqlite3.connect(path)
+        # uc guarda o código normalizado (texto) para a busca; uc_value e cod_loc_uee guardam os valores como vieram do Oracle
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS uc_cache (
+                uc TEXT PRIMARY KEY,
+                uc_value,
+                cod_loc_uee,
+                fetched_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_uc_cache_last_used ON uc_cache (last_used);
+        """)
+        self.conn.commit()
+
+    def lookup(self, ucs):
+        # Método que retorna (linhas encontradas no cache, UCs que faltam consultar no Oracle)
+        now = time.time()
+        ucs = list(dict.fromkeys(str(uc) for uc in ucs))  # Remove UCs repetidas mantendo a ordem
+        cached = {}
+        for start in range(0, len(ucs), SQLITE_CHUNK_SIZE):
+            chunk = ucs[start:start + SQLITE_CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+            cached.update(
+                (uc, (uc_value, cod_loc_uee))
+                for uc, uc_value, cod_loc_uee in self.conn.execute(
+                    f"SELECT uc, uc_value, cod_loc_uee FROM uc_cache WHERE uc IN ({placeholders}) AND fetched_at >= ?",
+                    chunk + [now - self.ttl]
+                )
+            )
+        # Marca o uso das UCs encontradas (base da remoção das menos usadas)
+        self.conn.executemany("UPDATE uc_cache SET last_used = ? WHERE uc = ?", ((now, uc) for uc in cached))
+        self.conn.commit()
+
+        missing = [uc for uc in ucs if uc not in cached]
+        self.hits += len(cached)
+        self.misses += len(missing)
+        metrics.inc("uc_cache_hits_total", len(cached))
+        metrics.inc("uc_cache_misses_total", len(missing))
+        logging.info(f"Cache de UCs: {len(cached)} encontradas, {len(missing)} a consultar no banco")
+        return list(cached.values()), missing
+
+    def store(self, rows):
+        # Método que grava no cache as linhas (cod_un_cons_uee, cod_loc_uee) retornadas pelo Oracle
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO uc_cache (uc, uc_value, cod_loc_uee, fetched_at, last_used) VALUES (?, ?, ?, ?, ?)",
+            ((str(uc_value), uc_value, cod_loc_uee, now, now) for uc_value, cod_loc_uee in rows)
+        )
+        self.conn.commit()
+        self.evict()
+
+    def evict(self):
+        # Método que remove as UCs vencidas e, acima do limite, as usadas há mais tempo
+        expired = self.conn.execute("DELETE FROM uc_cache WHERE fetched_at < ?", (time.time() - self.ttl,)).rowcount
+        total = self.conn.execute("SELECT COUNT(*) FROM uc_cache").fetchone()[0]
+        excess = max(total - self.max_entries, 0)
+        if excess:
+            self.conn.execute(
+                "DELETE FROM uc_cache WHERE uc IN (SELECT uc FROM uc_cache ORDER BY last_used LIMIT ?)", (excess,)
+            )
+        self.conn.commit()
+        if expired or excess:
+            logging.info(f"Cache de UCs: {expired} vencidas e {excess} excedentes removidas")
+
+    def log_stats(self):
+        # Método que registra os acertos e as faltas do cache nesta execução
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0
+        logging.info(f"Cache de UCs: {self.hits} acertos, {self.misses} faltas ({ratio:.1f}% de acerto)")
+        print(f"Cache de UCs: {self.hits} acertos, {self.misses} faltas ({ratio:.1f}% de acerto)")
+
+    def close(self):
+        # Método para fechar o cache
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,238 @@
+import atexit
+import logging
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import metrics
+import log_config
+from pdf_scanner import extract_uc
+from content_store import file_sha256  # Mesmo SHA-256 em blocos do índice de conteúdo (chave do cache)
+from uc_cache import SQLITE_CHUNK_SIZE
+
+# Cache da UC extraída de cada PDF, pelo SHA-256 do conteúdo (um arquivo nunca é lido duas vezes)
+EXTRACTION_CACHE_PATH = (r'\\uc_extracao.sqlite')
+EXTRACTION_WORKERS = None  # Processos de leitura dos PDFs (None usa um por núcleo)
+TEXT_PAGES = 2  # Páginas lidas de cada PDF (a UC aparece no cabeçalho do processo)
+
+# Padrões da UC no texto do PDF, em ordem de prioridade
+UC_PATTERNS = (
+    re.compile(r'unidade\s+consumidora\s*(?:n[º°o.]*\s*)?[:\-]?\s*(\d{5,12})\b', re.IGNORECASE),  # "Unidade Consumidora nº 12345678"
+    re.compile(r'\bU\.?\s?C\.?\s*(?:n[º°o.]*\s*)?[:\-]?\s*(\d{5,12})\b', re.IGNORECASE),  # "UC: 12345678", "U.C. 12345678"
+    re.compile(r'instala[çc][ãa]o\s*(?:n[º°o.]*\s*)?[:\-]?\s*(\d{5,12})\b', re.IGNORECASE),  # "Instalação: 12345678"
+)
+
+# Método que produziu a UC de cada arquivo
+METHOD_TEXT = "texto"  # Encontrada no texto do PDF (diferente do nome do arquivo)
+METHOD_TEXT_AND_NAME = "texto e nome"  # O texto confirma a UC do nome do arquivo
+METHOD_FILE_NAME = "nome do arquivo"  # Sem UC no texto (ou PDF sem camada de texto): regra antiga, só os números do nome
+
+def find_candidates(text):
+    # Função que retorna as UCs encontradas no texto, sem repetições, na ordem de prioridade dos padrões
+    candidates = []
+    for pattern in UC_PATTERNS:
+        candidates.extend(pattern.findall(text))
+    return list(dict.fromkeys(candidates))
+
+def choose_uc(candidates, file_name_uc):
+    # Função que escolhe a UC entre as candidatas do texto e a do nome do arquivo
+    if file_name_uc in candidates:
+        return file_name_uc, METHOD_TEXT_AND_NAME
+    if candidates:
+        return candidates[0], METHOD_TEXT  # Nome com datas, protocolos ou vários números: vale o texto
+    return file_name_uc, METHOD_FILE_NAME
+
+def parse_pdf(path):
+    # Função executada nos processos de leitura: retorna (UC, método, erro, pode ir para o cache) a partir do texto do PDF
+    file_name_uc = extract_uc(os.path.basename(path))
+    try:
+        from pypdf import PdfReader  # Dependência opcional: sem ela vale a regra do nome do arquivo
+    except ImportError as e:
+        return file_name_uc, METHOD_FILE_NAME, f"pypdf não instalado ({e})", False  # Lido de novo quando o pypdf for instalado
+    try:
+        reader = PdfReader(path)
+        text = "\n".join(page.extract_text() or "" for page in reader.pages[:TEXT_PAGES])
+    except Exception as e:  # PDF danificado ou protegido: vale a regra do nome do arquivo
+        return file_name_uc, METHOD_FILE_NAME, f"{os.path.basename(path)}: {e}", True
+    uc, method = choose_uc(find_candidates(text), file_name_uc)
+    return uc, method, None, True
+
+# Classe que guarda a UC e o método de extração de cada conteúdo de PDF já lido
+class ExtractionCache:
+    def __init__(self, path=EXTRACTION_CACHE_PATH):
+        # Abre (ou cria) o cache; a conexão é compartilhada entre as threads dos downloads
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # files evita recalcular o hash de um arquivo inalterado (a varredura encontra os mesmos PDFs a cada execução)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS extracted_ucs (
+                sha256 TEXT PRIMARY KEY,
+                uc TEXT NOT NULL,
+                method TEXT NOT NULL,
+                extracted_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def file_hashes(self, stats):
+        # Método que retorna {caminho: sha256} dos arquivos informados ({caminho: (tamanho, mtime_ns)}) que não mudaram
+        paths = list(stats)
+        known = {}
+        with self.lock:
+            for start in range(0, len(paths), SQLITE_CHUNK_SIZE):
+                chunk = paths[start:start + SQLITE_CHUNK_SIZE]
+                for path, size, mtime_ns, sha256 in self.conn.execute(
+                    f"SELECT path, size, mtime_ns, sha256 FROM files WHERE path IN ({', '.join('?' * len(chunk))})", chunk
+                ):
+                    if stats[path] == (size, mtime_ns):
+                        known[path] = sha256
+        return known
+
+    def remember_files(self, rows):
+        # Método que grava (caminho, tamanho, mtime_ns, sha256) dos arquivos cujo hash foi calculado
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)", rows
+            )
+            self.conn.commit()
+
+    def get(self, hashes):
+        # Método que retorna {sha256: (UC, método)} dos conteúdos já lidos
+        found = {}
+        hashes = list(dict.fromkeys(hashes))
+        with self.lock:
+            for start in range(0, len(hashes), SQLITE_CHUNK_SIZE):
+                chunk = hashes[start:start + SQLITE_CHUNK_SIZE]
+                found.update(
+                    (sha256, (uc, method))
+                    for sha256, uc, method in self.conn.execute(
+                        f"SELECT sha256, uc, method FROM extracted_ucs WHERE sha256 IN ({', '.join('?' * len(chunk))})",
+                        chunk
+                    )
+                )
+        return found
+
+    def store(self, rows):
+        # Método que grava (sha256, UC, método) dos PDFs lidos
+        now = datetime.now().isoformat(timespec="seconds")
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO extracted_ucs (sha256, uc, method, extracted_at) VALUES (?, ?, ?, ?)",
+                ((sha256, uc, method, now) for sha256, uc, method in rows)
+            )
+            self.conn.commit()
+
+    def close(self):
+        # Método para fechar o cache
+        with self.lock:
+            self.conn.close()
+
+# Classe que extrai a UC do conteúdo dos PDFs em um pool de processos, consultando antes o cache
+class UCExtractor:
+    def __init__(self, cache_path=EXTRACTION_CACHE_PATH, workers=EXTRACTION_WORKERS):
+        self.cache = ExtractionCache(cache_path)
+        self.workers = workers
+        self.executor = None  # Pool de processos (criado na primeira leitura de um PDF)
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        # Método que cria o pool de processos sob demanda (uma execução só com PDFs já lidos não o abre)
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def extract(self, paths):
+        # Método que retorna [(UC, método)] na ordem dos arquivos informados
+        results = [None] * len(paths)
+        stats = {}  # {caminho: (tamanho, mtime_ns)}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                stats[path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                pass  # Tratado abaixo, junto com os arquivos ilegíveis
+        known = self.cache.file_hashes(stats)  # Arquivos inalterados não são relidos só para calcular o hash
+
+        hashes = {}  # {posição: sha256}
+        hashed = []  # Arquivos cujo hash foi calculado agora
+        for index, path in enumerate(paths):
+            try:
+                if path not in stats:
+                    raise FileNotFoundError(path)
+                if path not in known:
+                    known[path] = file_sha256(path)
+                    hashed.append((path, *stats[path], known[path]))
+                hashes[index] = known[path]
+            except OSError as e:  # Arquivo ilegível ou removido: vale o nome do arquivo
+                logging.warning(f"Não foi possível ler o arquivo {path}: {e}")
+                results[index] = (extract_uc(os.path.basename(path)), METHOD_FILE_NAME)
+        if hashed:
+            self.cache.remember_files(hashed)
+
+        cached = self.cache.get(hashes.values())
+        pending = {}  # {sha256: [posições]}: o mesmo conteúdo em dois arquivos é lido uma única vez
+        for index, sha256 in hashes.items():
+            if sha256 in cached:
+                results[index] = cached[sha256]
+            else:
+                pending.setdefault(sha256, []).append(index)
+
+        errors = []
+        if pending:
+            executor = self.get_executor()
+            futures = {sha256: executor.submit(parse_pdf, paths[indexes[0]]) for sha256, indexes in pending.items()}
+            rows = []
+            for sha256, future in futures.items():
+                uc, method, error, cacheable = future.result()
+                if error:
+                    errors.append(error)
+                for index in pending[sha256]:
+                    results[index] = (uc, method)
+                if cacheable:
+                    rows.append((sha256, uc, method))
+            self.cache.store(rows)
+
+        counts = {}
+        for _, method in results:
+            counts[method] = counts.get(method, 0) + 1
+        for method, count in counts.items():
+            metrics.inc("uc_extraction_total", count, method=method)
+        if len(paths) > 1 or errors:
+            logging.info(f"Extração de UCs: {len(paths)} PDF(s), {len(paths) - sum(map(len, pending.values()))} do cache, "
+                         f"por método: {counts}")
+        if errors:
+            logging.warning(f"PDFs sem leitura do texto (UC pelo nome do arquivo): {log_config.summarize(errors)}")
+        return results
+
+    def close(self):
+        # Método que encerra o pool de processos e fecha o cache
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.cache.close()
+
+default_extractor = None  # Extrator compartilhado pela varredura e pelos downloads da execução
+default_lock = threading.Lock()
+
+def get_extractor():
+    # Função que retorna o extrator da execução, criado na primeira chamada
+    global default_extractor
+    with default_lock:
+        if default_extractor is None:
+            default_extractor = UCExtractor()
+            atexit.register(default_extractor.close)
+        return default_extractor
+
+def extract_ucs(paths):
+    # Função que retorna [(UC, método)] dos arquivos informados usando o extrator da execução
+    return get_extractor().extract(list(paths))